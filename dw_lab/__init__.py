@@ -0,0 +1 @@
+"""Shared helpers for the Data Warehouse Lab pages."""
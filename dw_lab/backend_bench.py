@@ -0,0 +1,112 @@
+"""Benchmark the storage backends on a synthetic star schema.
+
+Loads the same fact and dimension tables into every available backend, then
+times typical scan-and-aggregate queries over `v_star` (best of `--repeat`).
+
+    python -m dw_lab.backend_bench --rows 1000000
+"""
+import argparse
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from dw_lab.backends import BACKENDS, available_backends, drop_backends, get_backend
+from dw_lab.bulkload import bulk_load
+from dw_lab.connections import WAREHOUSE_PATH, drop_manager
+from dw_lab.cube import STAR_VIEW, star_view_sql
+
+QUERIES = {
+    "sum by category": f"SELECT Category, SUM(Amount) AS total FROM {STAR_VIEW} GROUP BY Category",
+    "sum by region x category": f"SELECT Region, Category, SUM(Amount) AS total, COUNT(*) AS orders "
+                                f"FROM {STAR_VIEW} GROUP BY Region, Category",
+    "filtered top products": f"SELECT Product, SUM(Amount) AS total FROM {STAR_VIEW} "
+                             f"WHERE Category IN ('Cat 1', 'Cat 2') GROUP BY Product ORDER BY total DESC LIMIT 10",
+    "distinct customers": f"SELECT Region, COUNT(DISTINCT Customer) AS customers FROM {STAR_VIEW} GROUP BY Region",
+    "full scan stats": f"SELECT AVG(Amount), MIN(Amount), MAX(Amount), SUM(Quantity) FROM {STAR_VIEW}",
+}
+
+
+def synthetic_star(rows, products=500, customers=20_000, seed=0):
+    """`(tables, dimensions)`: a fact table with two surrogate-keyed dimensions."""
+    rng = np.random.default_rng(seed)
+    product = pd.DataFrame({"Product_sk": np.arange(1, products + 1, dtype=np.int32),
+                            "Product": [f"Product {i}" for i in range(products)],
+                            "Category": [f"Cat {i % 12}" for i in range(products)]})
+    customer = pd.DataFrame({"Customer_sk": np.arange(1, customers + 1, dtype=np.int32),
+                             "Customer": [f"C{i:06d}" for i in range(customers)],
+                             "Region": rng.choice(["North", "South", "East", "West"], customers)})
+    fact = pd.DataFrame({"OrderID": np.arange(rows),
+                         "Product_sk": rng.integers(1, products + 1, rows).astype(np.int32),
+                         "Customer_sk": rng.integers(1, customers + 1, rows).astype(np.int32),
+                         "Date": pd.Timestamp("2022-01-01") + pd.to_timedelta(rng.integers(0, 1095, rows), unit="D"),
+                         "Quantity": rng.integers(1, 10, rows),
+                         "Amount": rng.gamma(2.0, 30.0, rows).round(2)})
+    tables = {"fact_table": fact, "dim_product": product, "dim_customer": customer}
+    dimensions = [{"name": "dim_product", "sk": "Product_sk"}, {"name": "dim_customer", "sk": "Customer_sk"}]
+    return tables, dimensions
+
+
+def run_benchmark(rows=1_000_000, repeat=3, backends=None):
+    """Returns `(loads, queries)` DataFrames with one column of timings per backend."""
+    backends = backends or available_backends()
+    tables, dimensions = synthetic_star(rows)
+    # The star view's SQL is derived from the table schemas, which an empty in-memory copy provides
+    schema = sqlite3.connect(":memory:")
+    for table, df in tables.items():
+        bulk_load(schema, table, df.head(0))
+    select_sql, _ = star_view_sql(schema, dimensions)
+    workdir = tempfile.mkdtemp(prefix="dw_bench_")
+    warehouse = f"{workdir}/{WAREHOUSE_PATH}"
+    loads, queries = {}, {name: {} for name in QUERIES}
+    try:
+        for name in backends:
+            backend = get_backend(warehouse, name)
+            start = time.perf_counter()
+            for table, df in tables.items():
+                backend.load_table(table, df)
+            loads[name] = time.perf_counter() - start
+            backend.create_view(STAR_VIEW, select_sql)
+            for label, sql in QUERIES.items():
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    backend.read_sql(sql)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                queries[label][name] = best
+    finally:
+        drop_backends(workdir)
+        drop_manager(warehouse)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    rows_loaded = sum(len(df) for df in tables.values())
+    loads = pd.DataFrame([{"backend": name, "seconds": s, "rows_per_sec": rows_loaded / s}
+                          for name, s in loads.items()])
+    queries = pd.DataFrame.from_dict(queries, orient="index").rename_axis("query") * 1000
+    queries.columns = [f"{c}_ms" for c in queries.columns]
+    if {"sqlite_ms", "duckdb_ms"} <= set(queries.columns):
+        queries["speedup"] = queries["sqlite_ms"] / queries["duckdb_ms"]
+    return loads, queries.reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backend", action="append", choices=BACKENDS,
+                        help="Backend to include (repeatable; default: every installed backend).")
+    args = parser.parse_args(argv)
+
+    loads, queries = run_benchmark(args.rows, args.repeat, args.backend)
+    print(f"Load ({args.rows:,} fact rows + dimensions)")
+    print(loads.to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+    print(f"\nQueries (best of {args.repeat})")
+    print(queries.to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Storage backends for the warehouse's analytical queries.
+
+`SQLiteBackend` is the row-oriented SQLite warehouse written by ETL (through
+the process-wide connection manager). `DuckDBBackend` is an embedded columnar
+engine: tables are created straight from the pandas/Arrow frames ETL already
+holds (DuckDB scans them in place instead of binding rows one by one) and
+scan-and-aggregate queries run vectorized. DuckDB is optional
+(`pip install duckdb`); the deployment picks the backend with `DW_BACKEND`.
+
+SQLite remains the system of record: materialized views, the cube, indexes and
+the version counter used by the query cache live there. A DuckDB backend holds
+a copy of the fact and dimension tables plus `v_star`, and is refreshed by ETL
+together with SQLite; queries reading anything else (`answers`), or that the
+backend fails to run, stay on SQLite. Only whole results go to the backend:
+paginated results and downloads (`pager`) read SQLite page by page.
+"""
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import pandas as pd
+
+from dw_lab.bulkload import bulk_load, quote
+from dw_lab.connections import get_manager
+
+try:
+    import duckdb
+except ImportError:  # optional dependency
+    duckdb = None
+
+BACKENDS = ("sqlite", "duckdb")
+DEFAULT_BACKEND = os.environ.get("DW_BACKEND", "sqlite")
+DUCKDB_FILE = "dw_lab.duckdb"
+
+
+def available_backends():
+    return [name for name in BACKENDS if name != "duckdb" or duckdb is not None]
+
+
+def referenced_tables(conn, sql):
+    """Tables and views `sql` reads in the SQLite warehouse `conn`, found by compiling it under an authorizer.
+
+    A table read through a view is reported as the (innermost) view, since that
+    is the name another backend has to hold.
+    """
+    views = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'view'")}
+    names = set()
+
+    def authorizer(action, arg1, arg2, db_name, source):
+        if action == sqlite3.SQLITE_READ and arg1 and not arg1.startswith("sqlite_"):
+            # `source` is also set for reads inside a WITH clause, whose names only exist in the query
+            names.add(source if source in views else arg1)
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorizer)
+    try:
+        conn.execute(f"EXPLAIN {sql}").fetchall()
+    finally:
+        conn.set_authorizer(None)
+    return sorted(names)
+
+
+class StorageBackend(ABC):
+    """Loads DataFrames as tables and answers read-only SQL with DataFrames."""
+
+    name = None
+
+    @abstractmethod
+    def load_table(self, name, df, append=False):
+        """Create (or append to) table `name` from `df`. Returns `{rows, seconds, rows_per_sec}`."""
+
+    @abstractmethod
+    def create_view(self, name, select_sql):
+        pass
+
+    @abstractmethod
+    def read_sql(self, sql, params=None):
+        pass
+
+    @abstractmethod
+    def table_names(self):
+        pass
+
+    def answers(self, conn, sql):
+        """True when every table or view `sql` reads in the SQLite warehouse `conn` exists in this backend."""
+        held = {name.lower() for name in self.table_names()}
+        return all(name.lower() in held for name in referenced_tables(conn, sql))
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self.manager = get_manager(path)
+
+    def load_table(self, name, df, append=False):
+        try:
+            return bulk_load(self.manager.writer(), name, df, append=append)
+        finally:
+            self.manager.release()
+
+    def create_view(self, name, select_sql):
+        try:
+            conn = self.manager.writer()
+            with conn:
+                conn.execute(f"DROP VIEW IF EXISTS {quote(name)}")
+                conn.execute(f"CREATE VIEW {quote(name)} AS {select_sql}")
+        finally:
+            self.manager.release()
+
+    def read_sql(self, sql, params=None):
+        return pd.read_sql_query(sql, self.manager.reader(), params=params)
+
+    def table_names(self):
+        return self.read_sql("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")["name"].tolist()
+
+
+class DuckDBBackend(StorageBackend):
+    name = "duckdb"
+
+    def __init__(self, path):
+        if duckdb is None:
+            raise ImportError("The duckdb backend needs the `duckdb` package (pip install duckdb).")
+        self.path = path
+        self._db = duckdb.connect(path)
+        self._write_lock = threading.Lock()
+
+    def load_table(self, name, df, append=False):
+        start = time.time()
+        with self._write_lock, self._db.cursor() as cur:
+            # The frame is scanned in place (no row-by-row binding)
+            cur.register("_load_df", df)
+            try:
+                if append:
+                    cur.execute(f"INSERT INTO {quote(name)} SELECT * FROM _load_df")
+                else:
+                    cur.execute(f"CREATE OR REPLACE TABLE {quote(name)} AS SELECT * FROM _load_df")
+            finally:
+                cur.unregister("_load_df")
+        seconds = time.time() - start
+        return {"rows": len(df), "seconds": seconds, "rows_per_sec": len(df) / seconds if seconds else None}
+
+    def create_view(self, name, select_sql):
+        with self._write_lock, self._db.cursor() as cur:
+            cur.execute(f"CREATE OR REPLACE VIEW {quote(name)} AS {select_sql}")
+
+    def read_sql(self, sql, params=None):
+        # One cursor per call: cursors are separate connections to the same database, safe across threads
+        with self._db.cursor() as cur:
+            return cur.execute(sql, params or []).df()
+
+    def table_names(self):
+        return self.read_sql("SELECT table_name AS name FROM information_schema.tables")["name"].tolist()
+
+    def close(self):
+        self._db.close()
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def backend_path(warehouse_path, name):
+    """File for backend `name` next to the SQLite warehouse at `warehouse_path`."""
+    if name == "sqlite":
+        return warehouse_path
+    return os.path.join(os.path.dirname(warehouse_path), DUCKDB_FILE)
+
+
+def get_backend(warehouse_path, name=DEFAULT_BACKEND):
+    """The process's backend `name` for the warehouse at `warehouse_path`, opened on first use."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend: {name} (choose from {', '.join(BACKENDS)})")
+    path = os.path.abspath(backend_path(warehouse_path, name))
+    with _backends_lock:
+        backend = _backends.get(path)
+        if backend is None:
+            backend = _backends[path] = (SQLiteBackend if name == "sqlite" else DuckDBBackend)(path)
+        return backend
+
+
+def drop_backends(directory):
+    """Close and forget every backend with files in `directory` (before it is deleted)."""
+    directory = os.path.abspath(directory)
+    with _backends_lock:
+        for path in [p for p in _backends if os.path.dirname(p) == directory]:
+            _backends.pop(path).close()
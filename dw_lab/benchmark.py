@@ -0,0 +1,274 @@
+"""End-to-end pipeline benchmark on generated data, with baseline comparison.
+
+Runs the app's flow headlessly on a `dw_lab.datagen` dataset in a temporary
+warehouse: generate the CSV, load it (chunked, profiled), define the star or
+snowflake schema, ETL, index, query `v_star` and compute the Reports
+dashboard's aggregates. Every stage records its seconds, rows per second and
+peak RSS (sampled in a background thread), and the result is written as JSON.
+
+With a baseline file from an earlier run at the same row count, any stage that
+got slower or used more memory than the tolerance allows is reported as a
+regression and the exit status is 1. Baselines are per machine, so none is
+shipped: save one with `--save-baseline` first. Without a baseline to compare
+against (missing, or run with other settings) the exit status is 2.
+
+    python -m dw_lab.benchmark --rows 1000000 --out bench.json --baseline benchmarks/baseline.json
+    python -m dw_lab.benchmark --rows 1000000 --save-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from dw_lab.buildgraph import load_graph
+from dw_lab.connections import WAREHOUSE_PATH, drop_manager, get_manager
+from dw_lab.cube import STAR_VIEW, create_star_view
+from dw_lab.datagen import schema_spec, write_csv
+from dw_lab.indexes import index_star
+from dw_lab.ingest import read_csv_chunked
+from dw_lab.keys import build_star
+from dw_lab.profile import Profiler
+from dw_lab.reports import WarehouseReport, choose_granularity, distinct_values, value_range
+
+DEFAULT_BASELINE = "benchmarks/baseline.json"
+# A stage regresses when it is this much slower (or uses this much more memory) than the baseline
+DEFAULT_TOLERANCE = 0.25
+# Stages faster than this are too noisy to compare on time
+MIN_SECONDS = 0.5
+SAMPLE_SECONDS = 0.01
+QUERIES = {
+    "sum by category": f"SELECT Category, SUM(Amount) AS total FROM {STAR_VIEW} GROUP BY Category",
+    "top products": f"SELECT Product, SUM(Amount) AS total FROM {STAR_VIEW} "
+                    f"GROUP BY Product ORDER BY total DESC LIMIT 10",
+    "customers by month": f"SELECT strftime('%Y-%m', Date) AS month, COUNT(DISTINCT CustomerID) AS customers "
+                          f"FROM {STAR_VIEW} GROUP BY month",
+    "full scan stats": f"SELECT COUNT(*), AVG(Amount), MIN(Amount), MAX(Amount) FROM {STAR_VIEW}",
+}
+
+
+def rss_bytes():
+    """Current resident set size of this process (peak so far where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KB on Linux
+
+
+class PeakMemory:
+    """Context manager sampling RSS every `interval` seconds; `peak` is the highest value seen."""
+
+    def __init__(self, interval=SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while True:
+            self.peak = max(self.peak, rss_bytes())
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+class Stages:
+    """Times stages run with `run(name, rows, func, ...)`, recording seconds, rows/sec and peak RSS."""
+
+    def __init__(self, log=None):
+        self.results = []
+        self.log = log
+
+    def run(self, name, rows, func, *args, **kwargs):
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            value = func(*args, **kwargs)
+            seconds = time.perf_counter() - start
+        self.results.append({"stage": name, "rows": rows, "seconds": seconds,
+                             "rows_per_sec": rows / seconds if seconds else None,
+                             "peak_rss_mb": memory.peak / 2 ** 20})
+        if self.log:
+            self.log(f"{name:<8} {seconds:8.2f} sec  {memory.peak / 2 ** 20:8.0f} MB peak RSS")
+        return value
+
+
+def _load(path, memory_budget_mb):
+    profiler = Profiler()
+    df, stats = read_csv_chunked(path, memory_budget_mb, on_chunk=lambda chunk, rows, progress: profiler.update(chunk))
+    if stats["truncated"]:
+        raise ValueError(f"The memory budget of {memory_budget_mb} MB stopped the load at {stats['rows']:,} rows.")
+    return df, profiler.summary()
+
+
+def _etl(conn, fact, dimensions, raw_df, partition_column):
+    return [n["result"] for n in load_graph(conn, fact, dimensions, raw_df, partition_column=partition_column)
+            if "result" in n]
+
+
+def _index(conn, dimensions):
+    index_star(conn, dimensions)
+    return create_star_view(conn, dimensions)
+
+
+def _query(conn):
+    return {label: conn.execute(sql).fetchall() for label, sql in QUERIES.items()}
+
+
+def _reports(conn):
+    """The Reports page's aggregates: filter options, breakdowns, a trend and a date-bounded view."""
+    report = WarehouseReport(conn)
+    distinct_values(conn, "Category")
+    distinct_values(conn, "Product")
+    lo, hi = value_range(conn, "Date")
+    report.aggregate(["Category"])
+    report.aggregate(["Product"], agg="mean")
+    granularity = choose_granularity(lo, hi, 250)
+    report.aggregate(["Date"], buckets={"Date": granularity})
+    # The most recent month, which a partitioned fact table answers from one partition
+    report.filters = {"Date": ("between", hi[:7] + "-01", hi)}
+    report.aggregate(["Category"])
+    report.aggregate(["Date"], buckets={"Date": "day"})
+    return report.sources
+
+
+def _warehouse_mb(manager, path):
+    """Size of the warehouse with its WAL checkpointed into the main file (any rest of the WAL included)."""
+    try:
+        manager.writer().execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    finally:
+        manager.release()
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p)) / 2 ** 20
+
+
+def run_benchmark(rows=1_000_000, seed=0, snowflake=False, partition_column="Date", memory_budget_mb=4096,
+                  workdir=None, log=None):
+    """Run every stage once on `rows` generated rows. Returns the result dict (see `main` for the JSON)."""
+    root = workdir or tempfile.mkdtemp(prefix="dw_benchmark_")
+    csv_path = os.path.join(root, "synthetic.csv")
+    warehouse = os.path.join(root, WAREHOUSE_PATH)
+    stages = Stages(log)
+    spec = schema_spec(snowflake)
+    try:
+        stages.run("generate", rows, write_csv, csv_path, rows, seed)
+        raw_df, _ = stages.run("load", rows, _load, csv_path, memory_budget_mb)
+        fact, dimensions = stages.run("define", rows, build_star, raw_df, spec["fact_cols"], spec["dimensions"])
+        manager = get_manager(warehouse)
+        conn = manager.writer()
+        try:
+            stages.run("etl", rows, _etl, conn, fact, dimensions, raw_df, partition_column)
+            stages.run("index", rows, _index, conn, dimensions)
+        finally:
+            manager.release()
+        reader = manager.reader()
+        try:
+            stages.run("query", rows, _query, reader)
+            sources = stages.run("reports", rows, _reports, reader)
+        finally:
+            manager.release()
+        warehouse_mb = _warehouse_mb(manager, warehouse)
+    finally:
+        drop_manager(warehouse)
+        if workdir is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "meta": {"rows": rows, "seed": seed, "schema": "snowflake" if snowflake else "star",
+                 "partition_column": partition_column, "python": platform.python_version(),
+                 "platform": platform.platform(), "cpus": os.cpu_count(),
+                 "created": time.strftime("%Y-%m-%d %H:%M:%S")},
+        "stages": stages.results,
+        "total_seconds": sum(s["seconds"] for s in stages.results),
+        "peak_rss_mb": max(s["peak_rss_mb"] for s in stages.results),
+        "warehouse_mb": warehouse_mb,
+        "report_sources": sorted(sources),
+    }
+
+
+def compare(result, baseline, tolerance=DEFAULT_TOLERANCE, min_seconds=MIN_SECONDS):
+    """Per-stage comparison with `baseline`: a list of dicts, `regression` set where a limit is exceeded.
+
+    Results of different row counts or schemas are not comparable and give an empty list.
+    """
+    keys = ("rows", "schema", "partition_column")
+    if any(result["meta"].get(k) != baseline["meta"].get(k) for k in keys):
+        return []
+    before = {s["stage"]: s for s in baseline["stages"]}
+    rows = []
+    for s in result["stages"]:
+        b = before.get(s["stage"])
+        if b is None:
+            continue
+        time_ratio = s["seconds"] / b["seconds"] if b["seconds"] else None
+        rss_ratio = s["peak_rss_mb"] / b["peak_rss_mb"] if b["peak_rss_mb"] else None
+        slower = time_ratio is not None and time_ratio > 1 + tolerance and s["seconds"] >= min_seconds
+        bigger = rss_ratio is not None and rss_ratio > 1 + tolerance
+        rows.append({"stage": s["stage"], "seconds": s["seconds"], "baseline_seconds": b["seconds"],
+                     "time_ratio": time_ratio, "peak_rss_mb": s["peak_rss_mb"],
+                     "baseline_peak_rss_mb": b["peak_rss_mb"], "rss_ratio": rss_ratio,
+                     "regression": ", ".join(k for k, bad in (("time", slower), ("memory", bigger)) if bad)})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--snowflake", action="store_true", help="Category as a sub-dimension of dim_product.")
+    parser.add_argument("--no-partition", action="store_true", help="Load the fact table unpartitioned.")
+    parser.add_argument("--memory-budget-mb", type=int, default=4096, help="Memory budget of the CSV load.")
+    parser.add_argument("--out", help="Write the result JSON to this file.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args.rows, args.seed, args.snowflake, None if args.no_partition else "Date",
+                           args.memory_budget_mb, log=print)
+    print(f"Total {result['total_seconds']:.2f} sec, peak RSS {result['peak_rss_mb']:,.0f} MB, "
+          f"warehouse {result['warehouse_mb']:,.1f} MB")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+    status = 0
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved baseline to {args.baseline}.")
+    elif not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; not compared. Save one with --save-baseline.")
+        status = 2
+    else:
+        with open(args.baseline) as f:
+            rows = compare(result, json.load(f), args.tolerance)
+        for r in rows:
+            print(f"{r['stage']:<8} {r['time_ratio'] or 0:6.2f}x time  {r['rss_ratio'] or 0:6.2f}x memory"
+                  + (f"  REGRESSION ({r['regression']})" if r["regression"] else ""))
+        if not rows:
+            print(f"Baseline {args.baseline} was run with other settings; not compared.")
+            status = 2
+        elif any(r["regression"] for r in rows):
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
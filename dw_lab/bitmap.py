@@ -0,0 +1,96 @@
+"""Bitmap indexes over low-cardinality columns of an in-memory fact frame.
+
+Each distinct value of an indexed column gets one bitmap packed 8 rows per
+byte (`np.packbits`); missing values share one bitmap, keyed `None`. A filter
+is evaluated as OR over the selected values of each column and AND across
+columns, on the packed bytes, followed by a single gather of the matching rows.
+Per-value counts are popcounts of the bitmaps.
+"""
+import numpy as np
+import pandas as pd
+
+# Columns with at most this many distinct values (and at most half as many as rows) are indexed
+MAX_CARDINALITY = 256
+CARDINALITY_RATIO = 0.5
+# Set bits per byte value
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(bits):
+    return int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+
+def pack(mask):
+    """Pack a boolean row mask into a bitmap."""
+    return np.packbits(np.asarray(mask, dtype=bool))
+
+
+def low_cardinality_columns(df, max_cardinality=MAX_CARDINALITY, ratio=CARDINALITY_RATIO):
+    columns = []
+    for col in df.columns:
+        s = df[col]
+        if not (isinstance(s.dtype, pd.CategoricalDtype) or s.dtype == object or pd.api.types.is_bool_dtype(s)):
+            continue
+        distinct = s.nunique(dropna=True)
+        if len(s) and distinct <= max_cardinality and distinct / len(s) <= ratio:
+            columns.append(col)
+    return columns
+
+
+class BitmapIndex:
+    """Packed bitmaps per distinct value of each indexed column of `df`."""
+
+    def __init__(self, df, columns=None):
+        self.rows = len(df)
+        self.columns = low_cardinality_columns(df) if columns is None else list(columns)
+        self.bitmaps = {}
+        for col in self.columns:
+            # Missing values get a code (the last one) too, so filtering on every value keeps their rows
+            codes, uniques = pd.factorize(df[col], sort=True, use_na_sentinel=False)
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            bitmaps = {}
+            for i, value in enumerate(uniques):
+                mask = np.zeros(self.rows, dtype=bool)
+                mask[order[bounds[i]:bounds[i + 1]]] = True
+                bitmaps[None if pd.isna(value) else value] = pack(mask)
+            self.bitmaps[col] = bitmaps
+
+    def all(self):
+        return pack(np.ones(self.rows, dtype=bool))
+
+    def none(self):
+        return pack(np.zeros(self.rows, dtype=bool))
+
+    def values(self, column):
+        return list(self.bitmaps[column])
+
+    def nbytes(self):
+        return sum(b.nbytes for bitmaps in self.bitmaps.values() for b in bitmaps.values())
+
+    def any_of(self, column, values):
+        """Bitmap of rows whose `column` is one of `values` (OR of their bitmaps)."""
+        bits = self.none()
+        for value in values:
+            bitmap = self.bitmaps[column].get(value)
+            if bitmap is not None:
+                np.bitwise_or(bits, bitmap, out=bits)
+        return bits
+
+    def evaluate(self, filters, within=None):
+        """Bitmap for `{column: values}` filters ANDed together (and with bitmap `within`)."""
+        bits = self.all() if within is None else within.copy()
+        for column, values in filters.items():
+            np.bitwise_and(bits, self.any_of(column, values), out=bits)
+        return bits
+
+    def counts(self, column, within=None):
+        """`{value: rows}` for `column`, restricted to bitmap `within` when given."""
+        counts = {}
+        for value, bitmap in self.bitmaps[column].items():
+            counts[value] = popcount(bitmap if within is None else bitmap & within)
+        return counts
+
+    def take(self, df, bits):
+        """Rows of `df` (the indexed frame) set in `bits`, gathered in one step."""
+        return df.iloc[np.flatnonzero(np.unpackbits(bits, count=self.rows))]
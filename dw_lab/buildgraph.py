@@ -0,0 +1,126 @@
+"""Dependency-graph scheduling of the tables ETL loads.
+
+Every table is a node whose `build` turns its inputs (the frames of the nodes
+it depends on) into the table, then computes the row hashes and fingerprint
+`etl.load_table` needs. Independent nodes run in a thread pool; a node is
+submitted as soon as its inputs are ready. `run_graph` yields finished nodes in
+completion order, so the caller can write each table through its single
+writer connection while the remaining builds are still running. A node is only
+submitted after the nodes it depends on were yielded *and* handled by the
+caller, so a build may use what the caller stored while loading them.
+`load_graph` is that caller for the ETL page and background ETL jobs.
+"""
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dw_lab.bulkload import bulk_load
+from dw_lab.etl import load_table, prepare_load
+from dw_lab.partitions import load_partitioned, unpartition
+from dw_lab.scd import history_table, is_history, merge_history, version_keys
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def node(name, build, depends=(), kind="table"):
+    return {"name": name, "build": build, "depends": list(depends), "kind": kind}
+
+
+def sub_dimension_source(parent, raw_df, columns):
+    """Frame to build a sub-dimension from: its parent dimension when it holds every column, else the raw data."""
+    if parent is not None and set(columns) <= set(parent.columns):
+        return parent, "parent"
+    return raw_df, "raw"
+
+
+def etl_graph(fact, dimensions, raw_df, versions=None, as_of=None):
+    """Nodes for the fact table, each dimension and each sub-dimension (which depends on its dimension).
+
+    Dimensions are the tables saved with the schema (deduplicated once, with the
+    surrogate keys the fact table was encoded with); their nodes only hash them.
+    History (SCD Type 2) dimensions are loaded before the fact table, whose keys
+    for them are mapped to versions (see `scd.version_keys`) from `versions`, a
+    dict the caller fills with each history dimension's table once it is merged.
+    """
+    history = [d for d in dimensions if is_history(d) and d['sk'] in fact.columns]
+
+    def build_fact(inputs):
+        if not history:
+            return fact
+        out = fact.copy()
+        for d in [d for d in history if d['name'] in versions]:
+            out[d['sk']] = version_keys(fact, d, versions[d['name']],
+                                        as_of if as_of in fact.columns else None)
+        return out
+
+    nodes = [node("fact_table", build_fact, depends=[d['name'] for d in history], kind="fact")]
+    for d in dimensions:
+        nodes.append(node(d['name'], lambda inputs, table=d['table']: table, kind="dimension"))
+        sub = d['sub_dim']
+        if sub:
+            def build_sub(inputs, parent=d['name'], columns=list(sub['columns'])):
+                source, _ = sub_dimension_source(inputs[parent], raw_df, columns)
+                return source[columns].drop_duplicates()
+            nodes.append(node(sub['name'], build_sub, depends=[d['name']], kind="sub-dimension"))
+    return nodes
+
+
+def _run(n, inputs):
+    start = time.perf_counter()
+    table = n["build"](inputs)
+    prepared = prepare_load(table) if table is not None and not table.empty else None
+    return {**n, "table": table, "prepared": prepared, "build_seconds": time.perf_counter() - start}
+
+
+def run_graph(nodes, max_workers=DEFAULT_WORKERS):
+    """Build every node in dependency order on `max_workers` threads, yielding results as they finish."""
+    pending = {n["name"]: n for n in nodes}
+    tables = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="etl-build") as pool:
+        while pending or running:
+            for name in [name for name, n in pending.items() if all(dep in tables for dep in n["depends"])]:
+                n = pending.pop(name)
+                running[pool.submit(_run, n, {dep: tables[dep] for dep in n["depends"]})] = name
+            if not running:
+                raise ValueError(f"Unresolvable dependencies: {', '.join(pending)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+                result = future.result()
+                tables[result["name"]] = result["table"]
+                yield result
+
+
+def load_graph(conn, fact, dimensions, raw_df, as_of=None, partition_column=None, force=False, writer_for=None,
+               max_workers=DEFAULT_WORKERS):
+    """Build every table with `run_graph` and write each one through `conn` as soon as it is built.
+
+    History dimensions are merged with `scd.merge_history` (the node's table
+    becomes their stored versions), the fact table is loaded as monthly
+    partitions when `partition_column` is set, every other table with
+    `etl.load_table`. `writer_for(name, rows)` returns the `bulk_load`-compatible
+    writer for a table about to be written. Yields each node, with its load
+    `result` unless the table was empty.
+    """
+    if not partition_column:
+        unpartition(conn, "fact_table")
+    history = {d['name']: d for d in dimensions if is_history(d)}
+    versions = {}
+    for n in run_graph(etl_graph(fact, dimensions, raw_df, versions, as_of), max_workers):
+        if n["prepared"] is None:
+            yield n
+            continue
+        writer = writer_for(n["name"], len(n["table"])) if writer_for else bulk_load
+        if n["name"] in history:
+            d = history[n["name"]]
+            n["result"] = merge_history(conn, n["name"], n["table"], d['pk'], d['sk'], force=force,
+                                        prepared=n["prepared"], writer=writer)
+            n["table"] = versions[n["name"]] = history_table(conn, n["name"])
+        elif n["name"] == "fact_table" and partition_column:
+            n["result"] = load_partitioned(conn, "fact_table", n["table"], partition_column, force=force,
+                                           prepared=n["prepared"], writer=writer)
+        else:
+            n["result"] = load_table(conn, n["name"], n["table"], force=force, writer=writer,
+                                     prepared=n["prepared"])
+        yield n
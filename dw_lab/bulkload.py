@@ -0,0 +1,124 @@
+"""High-throughput SQLite bulk loader.
+
+Each table is (re)built inside a single transaction with `executemany` over
+fixed-size batches taken straight from the frame's numpy-backed columns,
+instead of pandas `to_sql` with its per-call overhead and default settings.
+"""
+import contextlib
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_BATCH_ROWS = 50_000
+
+# Applied for the duration of a load. WAL with synchronous=NORMAL never corrupts
+# the database; at worst the last commit is lost on power failure.
+LOAD_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -64 * 1024,  # 64 MB (negative values are KiB)
+    "temp_store": "MEMORY",
+}
+
+
+def quote(identifier):
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+@contextlib.contextmanager
+def load_pragmas(conn):
+    """Relaxed load-time PRAGMAs (`LOAD_PRAGMAS`), restoring their previous values on exit.
+
+    The database is also switched to WAL, which is kept afterwards: it is a
+    property of the file, and the warehouse runs in WAL anyway (readers never
+    block the writer, see `connections`).
+    """
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("PRAGMA journal_mode=WAL")
+    previous = {k: conn.execute(f"PRAGMA {k}").fetchone()[0] for k in LOAD_PRAGMAS}
+    for k, v in LOAD_PRAGMAS.items():
+        conn.execute(f"PRAGMA {k}={v}")
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        for k, v in previous.items():
+            conn.execute(f"PRAGMA {k}={v}")
+
+
+def sqlite_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "TIMESTAMP"
+    if isinstance(dtype, pd.CategoricalDtype):
+        return sqlite_type(dtype.categories.dtype)
+    return "TEXT"
+
+
+def datetime_text(s):
+    """Datetimes as the text `to_sql` stores: `YYYY-MM-DD HH:MM:SS[.ffffff][+HH:MM]` (missing values as None)."""
+    text = s.dt.strftime("%Y-%m-%d %H:%M:%S")
+    micro = s.dt.microsecond
+    text = text.where(micro.fillna(0) == 0, text + "." + micro.astype("Int64").astype(str).str.zfill(6))
+    if s.dt.tz is not None:
+        offset = s.dt.strftime("%z")
+        text = text + offset.str[:3] + ":" + offset.str[3:]
+    return np.where(s.isna(), None, text.to_numpy(object))
+
+
+def _column_values(s):
+    """Python-native values for one batch of a column, with missing values as None."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype(s.dtype.categories.dtype if s.notna().all() else object)
+    if pd.api.types.is_datetime64_any_dtype(s.dtype):
+        return datetime_text(s).tolist()
+    if pd.api.types.is_bool_dtype(s.dtype) or pd.api.types.is_integer_dtype(s.dtype):
+        if s.hasnans:  # nullable integer/boolean extension arrays
+            return s.astype(object).where(s.notna(), None).tolist()
+        return s.to_numpy().astype(np.int64).tolist()
+    if pd.api.types.is_float_dtype(s.dtype):
+        # SQLite binds NaN as NULL
+        return s.to_numpy(dtype=np.float64, na_value=np.nan).tolist()
+    return s.astype(object).where(s.notna(), None).tolist()
+
+
+def bulk_load(conn, name, df, batch_rows=DEFAULT_BATCH_ROWS, append=False, before=None, on_batch=None):
+    """Replace table `name` with the contents of `df` in one transaction under `load_pragmas`.
+
+    With `append=True` the rows are inserted into the existing table instead.
+    `before(conn)`, if given, runs first inside the same transaction.
+    `on_batch(rows_written)`, if given, runs after every batch; an exception it
+    raises (e.g. to cancel the load) rolls the whole load back.
+
+    Returns a dict with `rows`, `seconds` and `rows_per_sec`.
+    """
+    start = time.time()
+    columns = ", ".join(f"{quote(c)} {sqlite_type(t)}" for c, t in df.dtypes.items())
+    insert = f"INSERT INTO {quote(name)} VALUES ({', '.join('?' * len(df.columns))})"
+
+    with load_pragmas(conn):
+        conn.execute("BEGIN")
+        try:
+            if not append:
+                conn.execute(f"DROP TABLE IF EXISTS {quote(name)}")
+                conn.execute(f"CREATE TABLE {quote(name)} ({columns})")
+            if before is not None:
+                before(conn)
+            for lo in range(0, len(df), batch_rows):
+                batch = df.iloc[lo:lo + batch_rows]
+                cols = [_column_values(batch.iloc[:, i]) for i in range(batch.shape[1])]
+                conn.executemany(insert, zip(*cols))
+                if on_batch is not None:
+                    on_batch(lo + len(batch))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    seconds = time.time() - start
+    return {"rows": len(df), "seconds": seconds, "rows_per_sec": len(df) / seconds if seconds else float("inf")}
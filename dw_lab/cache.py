@@ -0,0 +1,137 @@
+"""Content-addressed, on-disk columnar cache for loaded datasets.
+
+Each dataset is stored once as an uncompressed Arrow IPC (Feather v2) file named
+after the hash of its source bytes, so re-loading the same CSV — even after a
+server restart — memory-maps the Arrow file instead of parsing CSV again.
+Entries are evicted least-recently-used first when the cache exceeds its quota.
+A dataset's column profile (see `dw_lab.profile`) is kept next to it as a small
+JSON sidecar and evicted with it.
+"""
+import hashlib
+import os
+import time
+
+import pandas as pd
+import pyarrow.feather as feather
+
+CACHE_DIR = ".dw_cache"
+DEFAULT_QUOTA_MB = 1024
+_BLOCK = 1024 * 1024
+_SUFFIX = ".arrow"
+_PROFILE_SUFFIX = ".profile.json"
+
+
+def fingerprint(source, variant=""):
+    """Return a hex digest of the source's bytes (path or file-like), plus `variant`."""
+    h = hashlib.blake2b(digest_size=20)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(_BLOCK), b""):
+                h.update(block)
+    else:
+        pos = source.tell()
+        source.seek(0)
+        for block in iter(lambda: source.read(_BLOCK), b""):
+            h.update(block)
+        source.seek(pos)
+    h.update(variant.encode())
+    return h.hexdigest()
+
+
+def _path(key, cache_dir):
+    return os.path.join(cache_dir, key + _SUFFIX)
+
+
+def get(key, cache_dir=CACHE_DIR):
+    """Return the cached DataFrame for `key`, or None on a miss."""
+    path = _path(key, cache_dir)
+    try:
+        table = feather.read_table(path, memory_map=True)
+    except (FileNotFoundError, OSError):
+        return None
+    # Touch the entry so LRU eviction sees it as recently used
+    os.utime(path)
+    return table.to_pandas()
+
+
+def put(key, df, cache_dir=CACHE_DIR, quota_mb=DEFAULT_QUOTA_MB):
+    """Store `df` under `key`, then evict old entries to stay within `quota_mb`."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _path(key, cache_dir)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    feather.write_feather(df.reset_index(drop=True), tmp, compression="uncompressed")
+    os.replace(tmp, path)
+    evict(quota_mb, cache_dir, keep=key)
+    return path
+
+
+def get_profile(key, cache_dir=CACHE_DIR):
+    """Return the cached column profile for `key`, or None if it was never stored."""
+    try:
+        return pd.read_json(os.path.join(cache_dir, key + _PROFILE_SUFFIX), orient="table")
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def put_profile(key, profile, cache_dir=CACHE_DIR):
+    """Store `profile` (a DataFrame) beside the dataset entry `key`; skipped if the dataset is not cached."""
+    if not os.path.exists(_path(key, cache_dir)):
+        return None
+    path = os.path.join(cache_dir, key + _PROFILE_SUFFIX)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    profile.to_json(tmp, orient="table", index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def entries(cache_dir=CACHE_DIR):
+    """List cache entries as `(key, size_bytes, last_used)` tuples, most recent first."""
+    if not os.path.isdir(cache_dir):
+        return []
+    out = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(_SUFFIX):
+            continue
+        st = os.stat(os.path.join(cache_dir, name))
+        out.append((name[:-len(_SUFFIX)], st.st_size, st.st_mtime))
+    return sorted(out, key=lambda e: e[2], reverse=True)
+
+
+def evict(quota_mb=DEFAULT_QUOTA_MB, cache_dir=CACHE_DIR, keep=None):
+    """Delete least-recently-used entries until the cache fits in `quota_mb`.
+
+    Returns the evicted keys. The entry named by `keep` is never evicted.
+    """
+    quota = quota_mb * 1024 * 1024
+    items = entries(cache_dir)
+    total = sum(size for _, size, _ in items)
+    evicted = []
+    for key, size, _ in reversed(items):
+        if total <= quota:
+            break
+        if key == keep:
+            continue
+        for path in (_path(key, cache_dir), os.path.join(cache_dir, key + _PROFILE_SUFFIX)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+        evicted.append(key)
+    return evicted
+
+
+def load_cached(source, loader, variant="", cache_dir=CACHE_DIR, quota_mb=DEFAULT_QUOTA_MB):
+    """Return `(df, key, hit, seconds)`, calling `loader(source)` only on a cache miss.
+
+    `loader` must return `(df, cacheable)`; partial loads should not be cached.
+    """
+    start = time.time()
+    key = fingerprint(source, variant)
+    df = get(key, cache_dir)
+    if df is not None:
+        return df, key, True, time.time() - start
+    df, cacheable = loader(source)
+    if cacheable and df is not None and not df.empty:
+        put(key, df, cache_dir, quota_mb)
+    return df, key, False, time.time() - start
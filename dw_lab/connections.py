@@ -0,0 +1,180 @@
+"""Process-wide SQLite connection manager: one serialized writer and a pool of WAL readers.
+
+Every page run gets its connections from `get_manager(path)` instead of
+opening its own. Connections are leased to the calling thread: `writer()` and
+`reader()` return the same connection for the rest of the thread (a Streamlit
+script run) until `release()` is called or the thread ends, when the lease is
+reclaimed by the next caller. Only one thread holds the writer at a time;
+readers are read-only connections that, in WAL mode, never block the writer.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+WAREHOUSE_PATH = "dw_lab.db"
+STAGING_PATH = "staging_lab.db"
+DEFAULT_READERS = 4
+# Prepared statements kept per connection (sqlite3's LRU statement cache)
+STATEMENT_CACHE = 256
+WAIT_TIMEOUT = 60
+# How often a waiter re-checks whether the current holder's thread has ended
+_POLL_SECONDS = 0.1
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(path=WAREHOUSE_PATH, readers=DEFAULT_READERS):
+    """The process's manager for database file `path`, created on first use."""
+    key = os.path.abspath(path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = ConnectionManager(key, readers)
+        return manager
+
+
+def drop_manager(path):
+    """Close and forget the manager for `path` (e.g. before its file is deleted)."""
+    with _managers_lock:
+        manager = _managers.pop(os.path.abspath(path), None)
+    if manager is not None:
+        manager.close()
+
+
+def find_manager(path):
+    with _managers_lock:
+        return _managers.get(os.path.abspath(path))
+
+
+class ConnectionManager:
+    """One writer connection and up to `max_readers` read-only connections to one database file."""
+
+    def __init__(self, path, max_readers=DEFAULT_READERS, statement_cache=STATEMENT_CACHE):
+        self.path = path
+        self.max_readers = max_readers
+        self.statement_cache = statement_cache
+        self._cond = threading.Condition()
+        self._writer = None
+        self._writer_owner = None
+        self._leases = {}
+        self._idle = []
+        self._readers_open = 0
+        self.writer_waits = self.reader_waits = 0
+        self.writer_wait_seconds = self.reader_wait_seconds = 0.0
+        self.last_used = time.time()
+
+    def _connect(self, read_only):
+        if read_only:
+            return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False,
+                                   cached_statements=self.statement_cache)
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=WAIT_TIMEOUT,
+                               cached_statements=self.statement_cache)
+        conn.execute("PRAGMA journal_mode = WAL")
+        return conn
+
+    def _wait(self, deadline, what):
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            raise TimeoutError(f"Timed out waiting for the {what} connection to {self.path}")
+        self._cond.wait(min(remaining, _POLL_SECONDS))
+
+    def writer(self):
+        """The writer connection, leased to the calling thread (waits while another thread holds it)."""
+        me = threading.current_thread()
+        start = time.perf_counter()
+        self.last_used = time.time()
+        with self._cond:
+            while self._writer_owner not in (None, me) and self._writer_owner.is_alive():
+                self._wait(start + WAIT_TIMEOUT, "writer")
+            if self._writer_owner is not me:
+                waited = time.perf_counter() - start
+                if waited > 0.001:
+                    self.writer_waits += 1
+                    self.writer_wait_seconds += waited
+                if self._writer is None:
+                    self._writer = self._connect(read_only=False)
+                elif self._writer.in_transaction:
+                    # Left open by a run that ended without committing
+                    self._writer.rollback()
+                self._writer_owner = me
+            return self._writer
+
+    def _reclaim(self):
+        for thread in [t for t in self._leases if not t.is_alive()]:
+            self._idle.append(self._leases.pop(thread))
+
+    def reader(self):
+        """A read-only connection leased to the calling thread (waits while all are in use)."""
+        me = threading.current_thread()
+        start = time.perf_counter()
+        self.last_used = time.time()
+        with self._cond:
+            conn = self._leases.get(me)
+            while conn is None:
+                self._reclaim()
+                if self._idle:
+                    conn = self._idle.pop()
+                elif self._readers_open < self.max_readers:
+                    conn = self._connect(read_only=True)
+                    self._readers_open += 1
+                else:
+                    self._wait(start + WAIT_TIMEOUT, "reader")
+                    continue
+                waited = time.perf_counter() - start
+                if waited > 0.001:
+                    self.reader_waits += 1
+                    self.reader_wait_seconds += waited
+                self._leases[me] = conn
+            return conn
+
+    def release(self):
+        """Return the calling thread's leases; an uncommitted write transaction is rolled back."""
+        me = threading.current_thread()
+        with self._cond:
+            if self._writer_owner is me:
+                if self._writer.in_transaction:
+                    self._writer.rollback()
+                self._writer_owner = None
+            conn = self._leases.pop(me, None)
+            if conn is not None:
+                self._idle.append(conn)
+            self._cond.notify_all()
+
+    def busy(self):
+        """Whether any live thread holds the writer or a reader."""
+        with self._cond:
+            self._reclaim()
+            return bool(self._leases) or (self._writer_owner is not None and self._writer_owner.is_alive())
+
+    def stats(self):
+        with self._cond:
+            self._reclaim()
+            writer_busy = self._writer_owner is not None and self._writer_owner.is_alive()
+            return {
+                "path": self.path,
+                "writer_open": self._writer is not None,
+                "writer_busy": writer_busy,
+                "readers_open": self._readers_open,
+                "readers_leased": len(self._leases),
+                "readers_idle": len(self._idle),
+                "max_readers": self.max_readers,
+                "writer_waits": self.writer_waits,
+                "writer_wait_seconds": self.writer_wait_seconds,
+                "reader_waits": self.reader_waits,
+                "reader_wait_seconds": self.reader_wait_seconds,
+                "statement_cache": self.statement_cache,
+            }
+
+    def close(self):
+        """Close every connection (leased ones included); the manager reopens them on demand."""
+        with self._cond:
+            for conn in [self._writer, *self._leases.values(), *self._idle]:
+                if conn is not None:
+                    conn.close()
+            self._writer = self._writer_owner = None
+            self._leases.clear()
+            self._idle.clear()
+            self._readers_open = 0
+            self._cond.notify_all()
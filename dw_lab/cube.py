@@ -0,0 +1,294 @@
+"""OLAP cube precomputation and an aggregate navigator.
+
+`build_cube` materializes one aggregate table per grouping set (ROLLUP: every
+prefix of the chosen columns, CUBE: every subset) holding SUM/COUNT/MIN/MAX of
+each measure. The finest grouping set is computed from the star view and every
+coarser one from the smallest finer aggregate already built.
+
+`answer` serves a GROUP BY request from the smallest registered aggregate that
+contains all group-by and filter columns and the measure, and falls back to
+the base star view only when no aggregate covers the request. When the fact
+table is partitioned and the request is bounded on the partition column, the
+star view is read over the overlapping partitions only.
+"""
+import hashlib
+import itertools
+import json
+import time
+
+import pandas as pd
+
+from dw_lab.bulkload import quote
+from dw_lab.etl import META_TABLE, bump_version
+from dw_lab.partitions import partition_tables, prune, union_sql
+from dw_lab.scd import HISTORY_COLUMNS, is_history
+
+STAR_VIEW = "v_star"
+CUBE_REGISTRY = "_cube_registry"
+AGGREGATES = ("sum", "count", "mean", "min", "max")
+ROWS = "_rows"
+# SQL truncating an ISO date/timestamp column to the start of its bucket (weeks start on Monday)
+TIME_BUCKETS = {
+    "day": "date({col})",
+    "week": "date({col}, '-6 days', 'weekday 1')",
+    "month": "strftime('%Y-%m-01', {col})",
+    "quarter": "printf('%s-%02d-01', strftime('%Y', {col}), (CAST(strftime('%m', {col}) AS INTEGER) - 1) / 3 * 3 + 1)",
+}
+
+
+def _columns(conn, table):
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({quote(table)})")]
+
+
+def star_view_sql(conn, dimensions, fact_table="fact_table"):
+    """`(select_sql, columns)` defining `v_star`: the fact table joined to its surrogate-keyed dimensions.
+
+    Surrogate keys are replaced by the dimension's attributes, so the view has
+    the same natural columns as the raw data. Only dimensions with a surrogate
+    key are joined (their key is unique, so the join never fans out rows). For a
+    history dimension the key is a version, so facts see the attributes of the
+    version they were mapped to; its bookkeeping columns are left out.
+    """
+    fact_cols = _columns(conn, fact_table)
+    keys = {d['sk'] for d in dimensions if d.get('sk')}
+    select = [f"f.{quote(c)}" for c in fact_cols if c not in keys]
+    names = {c for c in fact_cols if c not in keys}
+    joins = []
+    for i, d in enumerate(dimensions):
+        sk = d.get('sk')
+        if not sk or sk not in fact_cols:
+            continue
+        dim_cols = _columns(conn, d['name'])
+        if not dim_cols:
+            continue
+        alias = f"d{i}"
+        joins.append(f"LEFT JOIN {quote(d['name'])} {alias} ON f.{quote(sk)} = {alias}.{quote(sk)}")
+        hidden = HISTORY_COLUMNS if is_history(d) else ()
+        for c in dim_cols:
+            if c != sk and c not in names and c not in hidden:
+                select.append(f"{alias}.{quote(c)}")
+                names.add(c)
+    return f"SELECT {', '.join(select)} FROM {quote(fact_table)} f {' '.join(joins)}", sorted(names)
+
+
+def create_star_view(conn, dimensions, fact_table="fact_table"):
+    """(Re)create `v_star` (see `star_view_sql`). Returns its column names."""
+    select_sql, names = star_view_sql(conn, dimensions, fact_table)
+    with conn:
+        conn.execute(f"DROP VIEW IF EXISTS {STAR_VIEW}")
+        conn.execute(f"CREATE VIEW {STAR_VIEW} AS {select_sql}")
+    return names
+
+
+def pruned_star_sql(conn, filters, fact_table="fact_table"):
+    """`(select_sql, tables)`: `v_star` over just the fact partitions `filters` can match, or `(None, None)`."""
+    tables = prune(conn, fact_table, filters)
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'view' AND name = ?", (STAR_VIEW,)).fetchone()
+    if tables is None or row is None:
+        return None, None
+    # The view's text is `CREATE VIEW v_star AS <star_view_sql>`, whose fact source is `FROM "fact_table" f `
+    select_sql = row[0].split(" AS ", 1)[1] + " "  # SQLite drops the trailing space of a star view without joins
+    fact_from = f"FROM {quote(fact_table)} f "
+    if fact_from not in select_sql:
+        return None, None
+    source = union_sql(tables) if tables else f"SELECT * FROM {quote(fact_table)} WHERE 0"
+    return select_sql.replace(fact_from, f"FROM ({source}) f ", 1), tables
+
+
+def grouping_sets(columns, mode="rollup"):
+    """Grouping sets from finest to coarsest, always ending with the grand total ()."""
+    columns = list(columns)
+    if mode == "cube":
+        return [list(c) for n in range(len(columns), -1, -1) for c in itertools.combinations(columns, n)]
+    return [columns[:n] for n in range(len(columns), -1, -1)]
+
+
+def aggregate_name(group_cols):
+    return "agg_" + ("__".join(group_cols) if group_cols else "all")
+
+
+def ensure_registry(conn):
+    conn.execute(
+        f"""CREATE TABLE IF NOT EXISTS {CUBE_REGISTRY} (
+            table_name  TEXT PRIMARY KEY,
+            group_cols  TEXT NOT NULL,
+            measures    TEXT NOT NULL,
+            mode        TEXT NOT NULL,
+            rows        INTEGER NOT NULL,
+            fingerprint TEXT,
+            seconds     REAL
+        )"""
+    )
+
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def registered_aggregates(conn):
+    # Also called on read-only connections, so a missing registry means no aggregates rather than being created
+    if not _has_table(conn, CUBE_REGISTRY):
+        return []
+    rows = conn.execute(
+        f"SELECT table_name, group_cols, measures, mode, rows, fingerprint, seconds FROM {CUBE_REGISTRY}"
+    ).fetchall()
+    return [{"table": r[0], "group_cols": json.loads(r[1]), "measures": json.loads(r[2]),
+             "mode": r[3], "rows": r[4], "fingerprint": r[5], "seconds": r[6]} for r in rows]
+
+
+def cube_config(conn):
+    """`(columns, measures, mode)` of the current cube, or None if none was built."""
+    aggregates = registered_aggregates(conn)
+    if not aggregates:
+        return None
+    finest = max(aggregates, key=lambda a: len(a["group_cols"]))
+    return finest["group_cols"], finest["measures"], finest["mode"]
+
+
+def sources_fingerprint(conn):
+    """Combined fingerprint of every table ETL has loaded (fact, dimensions, sub-dimensions)."""
+    rows = (conn.execute(f"SELECT table_name, fingerprint FROM {META_TABLE} ORDER BY table_name").fetchall()
+            if _has_table(conn, META_TABLE) else [])
+    return hashlib.blake2b(json.dumps(rows).encode(), digest_size=16).hexdigest()
+
+
+def is_stale(conn):
+    current = sources_fingerprint(conn)
+    return any(a["fingerprint"] != current for a in registered_aggregates(conn))
+
+
+def drop_cube(conn):
+    for a in registered_aggregates(conn):
+        conn.execute(f"DROP TABLE IF EXISTS {quote(a['table'])}")
+    with conn:
+        ensure_registry(conn)
+        conn.execute(f"DELETE FROM {CUBE_REGISTRY}")
+    bump_version(conn)
+
+
+def _measure_columns(measure):
+    return {agg: f"{measure}__{agg}" for agg in ("sum", "count", "min", "max")}
+
+
+def build_cube(conn, columns, measures, mode="rollup", source=STAR_VIEW):
+    """Materialize and register one aggregate table per grouping set. Returns per-table results."""
+    drop_cube(conn)
+    fingerprint = sources_fingerprint(conn)
+    built = []
+    results = []
+    for group_cols in grouping_sets(columns, mode):
+        start = time.time()
+        name = aggregate_name(group_cols)
+        # Roll up from the smallest already-built aggregate that is finer than this one
+        parents = [b for b in built if set(group_cols) <= set(b["group_cols"])]
+        if parents:
+            parent = min(parents, key=lambda b: b["rows"])
+            exprs = [f"SUM({quote(ROWS)}) AS {quote(ROWS)}"]
+            for m in measures:
+                cols = _measure_columns(m)
+                exprs += [f"SUM({quote(cols['sum'])}) AS {quote(cols['sum'])}",
+                          f"SUM({quote(cols['count'])}) AS {quote(cols['count'])}",
+                          f"MIN({quote(cols['min'])}) AS {quote(cols['min'])}",
+                          f"MAX({quote(cols['max'])}) AS {quote(cols['max'])}"]
+            from_table = parent["table"]
+        else:
+            exprs = [f"COUNT(*) AS {quote(ROWS)}"]
+            for m in measures:
+                cols = _measure_columns(m)
+                exprs += [f"SUM({quote(m)}) AS {quote(cols['sum'])}",
+                          f"COUNT({quote(m)}) AS {quote(cols['count'])}",
+                          f"MIN({quote(m)}) AS {quote(cols['min'])}",
+                          f"MAX({quote(m)}) AS {quote(cols['max'])}"]
+            from_table = source
+        keys = [quote(c) for c in group_cols]
+        group_by = f" GROUP BY {', '.join(keys)}" if keys else ""
+        with conn:
+            conn.execute(f"DROP TABLE IF EXISTS {quote(name)}")
+            conn.execute(f"CREATE TABLE {quote(name)} AS SELECT {', '.join(keys + exprs)} "
+                         f"FROM {quote(from_table)}{group_by}")
+        rows = conn.execute(f"SELECT COUNT(*) FROM {quote(name)}").fetchone()[0]
+        seconds = time.time() - start
+        with conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {CUBE_REGISTRY} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, json.dumps(group_cols), json.dumps(list(measures)), mode, rows, fingerprint, seconds),
+            )
+        built.append({"table": name, "group_cols": group_cols, "rows": rows})
+        results.append({"table": name, "group_by": ", ".join(group_cols) or "(total)",
+                        "rows": rows, "seconds": seconds, "from": from_table})
+    bump_version(conn)
+    return results
+
+
+def where_clause(filters):
+    """SQL WHERE clause and params for `{column: values}` (IN) or `{column: ("between", lo, hi)}`."""
+    clauses, params = [], []
+    for col, spec in (filters or {}).items():
+        if isinstance(spec, tuple) and spec and spec[0] == "between":
+            clauses.append(f"{quote(col)} BETWEEN ? AND ?")
+            params += [spec[1], spec[2]]
+        else:
+            values = list(spec)
+            if not values:
+                clauses.append("0")
+                continue
+            clauses.append(f"{quote(col)} IN ({', '.join('?' * len(values))})")
+            params += [v.item() if hasattr(v, "item") else v for v in values]
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def choose_aggregate(conn, group_by, measure, filters=None):
+    """Smallest fresh aggregate covering the group-by and filter columns and the measure, or None."""
+    needed = set(group_by) | set(filters or {})
+    current = sources_fingerprint(conn)
+    candidates = [a for a in registered_aggregates(conn)
+                  if a["fingerprint"] == current and needed <= set(a["group_cols"])
+                  and (measure is None or measure in a["measures"])]
+    return min(candidates, key=lambda a: a["rows"]) if candidates else None
+
+
+def answer(conn, group_by, measure, agg="sum", filters=None, buckets=None):
+    """GROUP BY `group_by` computing `agg` of `measure`; returns `(df, source_table)`.
+
+    `measure=None` counts rows. The result column is named after the measure (or `_rows`).
+    `buckets` maps date group-by columns to a `TIME_BUCKETS` granularity to group by instead.
+    """
+    if agg not in AGGREGATES:
+        raise ValueError(f"Unsupported aggregate: {agg}")
+    aggregate = choose_aggregate(conn, group_by, measure, filters)
+    out = quote(measure or ROWS)
+    if aggregate is not None:
+        source = aggregate["table"]
+        if measure is None:
+            expr = f"SUM({quote(ROWS)})"
+        else:
+            cols = {k: quote(v) for k, v in _measure_columns(measure).items()}
+            expr = {
+                "sum": f"SUM({cols['sum']})",
+                "count": f"SUM({cols['count']})",
+                "mean": f"SUM({cols['sum']}) * 1.0 / SUM({cols['count']})",
+                "min": f"MIN({cols['min']})",
+                "max": f"MAX({cols['max']})",
+            }[agg]
+    else:
+        source = STAR_VIEW
+        expr = "COUNT(*)" if measure is None else {
+            "sum": f"SUM({quote(measure)})",
+            "count": f"COUNT({quote(measure)})",
+            "mean": f"AVG({quote(measure)})",
+            "min": f"MIN({quote(measure)})",
+            "max": f"MAX({quote(measure)})",
+        }[agg]
+    buckets = buckets or {}
+    keys = [TIME_BUCKETS[buckets[c]].format(col=quote(c)) if c in buckets else quote(c) for c in group_by]
+    select = [f"{k} AS {quote(c)}" for k, c in zip(keys, group_by)]
+    where, params = where_clause(filters)
+    group = f" GROUP BY {', '.join(keys)}" if keys else ""
+    from_sql = quote(source)
+    if source == STAR_VIEW:
+        pruned, tables = pruned_star_sql(conn, filters)
+        if pruned is not None:
+            from_sql = f"({pruned})"
+            source = f"{STAR_VIEW} ({len(tables)} of {len(partition_tables(conn, 'fact_table'))} partitions)"
+    sql = f"SELECT {', '.join(select + [f'{expr} AS {out}'])} FROM {from_sql}{where}{group}"
+    return pd.read_sql_query(sql, conn, params=params), source
@@ -0,0 +1,105 @@
+"""Deterministic synthetic sales data shaped like `data/sample.csv`, at any scale.
+
+Rows have the sample's columns (OrderID, Product, Category, Amount, CustomerID)
+plus an ISO `Date`. Every product belongs to one category, so the data models
+as a star (product and customer dimensions) or a snowflake (category as a
+sub-dimension of product); `schema_spec` returns either definition.
+
+Rows are generated in fixed blocks of `BLOCK_ROWS`, each from its own seeded
+generator, so the output depends only on `rows` and `seed` (not on the chunk
+size) and files of tens of millions of rows are written without holding them
+in memory.
+
+    python -m dw_lab.datagen --rows 1000000 --out data/synthetic_1m.csv
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+BLOCK_ROWS = 100_000
+DEFAULT_CHUNK_ROWS = 1_000_000
+CATEGORIES = ("Fruit", "Vegetable", "Dairy", "Bakery", "Meat", "Seafood", "Beverages", "Snacks",
+              "Frozen", "Pantry", "Household", "Personal Care")
+
+
+def products(count=200, seed=0):
+    """`(names, categories)` of the product catalog; the sample's products come first."""
+    base = [("Apple", "Fruit"), ("Banana", "Fruit"), ("Carrot", "Vegetable")]
+    rng = np.random.default_rng(seed)
+    extra = [(f"Product {i:04d}", CATEGORIES[c]) for i, c in
+             enumerate(rng.integers(0, len(CATEGORIES), max(count - len(base), 0)), start=len(base))]
+    names, categories = zip(*(base + extra)[:count])
+    return np.array(names, dtype=object), np.array(categories, dtype=object)
+
+
+def _block(index, rows, seed, names, categories, customers, start, days):
+    rng = np.random.default_rng([seed, index + 1])
+    # Skewed product popularity (a few best sellers), like real sales data
+    product = np.minimum(rng.zipf(1.3, rows) - 1, len(names) - 1)
+    first = index * BLOCK_ROWS + 1
+    return pd.DataFrame({
+        "OrderID": np.arange(first, first + rows, dtype=np.int64),
+        "Product": names[product],
+        "Category": categories[product],
+        "Amount": np.maximum(rng.gamma(2.0, 25.0, rows).round(), 1).astype(np.int64),
+        "CustomerID": rng.integers(100, 100 + customers, rows),
+        "Date": (start + pd.to_timedelta(rng.integers(0, days, rows), unit="D")).strftime("%Y-%m-%d"),
+    })
+
+
+def generate_chunks(rows, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS, product_count=200, customers=50_000,
+                    start="2023-01-01", days=730):
+    """Yield the dataset as DataFrames of about `chunk_rows` rows (a multiple of `BLOCK_ROWS`)."""
+    names, categories = products(product_count, seed)
+    start = pd.Timestamp(start)
+    per_chunk = max(1, chunk_rows // BLOCK_ROWS)
+    blocks = range(-(-rows // BLOCK_ROWS))
+    for lo in range(0, len(blocks), per_chunk):
+        yield pd.concat([_block(i, min(BLOCK_ROWS, rows - i * BLOCK_ROWS), seed, names, categories,
+                                customers, start, days) for i in blocks[lo:lo + per_chunk]],
+                        ignore_index=True)
+
+
+def generate(rows, seed=0, **kwargs):
+    """The whole dataset as one DataFrame."""
+    return pd.concat(generate_chunks(rows, seed, **kwargs), ignore_index=True)
+
+
+def write_csv(path, rows, seed=0, **kwargs):
+    """Stream the dataset to a CSV file chunk by chunk. Returns `{rows, seconds}`."""
+    start = time.perf_counter()
+    written = 0
+    with open(path, "w", newline="") as f:
+        for i, chunk in enumerate(generate_chunks(rows, seed, **kwargs)):
+            chunk.to_csv(f, index=False, header=i == 0)
+            written += len(chunk)
+    return {"rows": written, "seconds": time.perf_counter() - start}
+
+
+def schema_spec(snowflake=False):
+    """Fact/dimension definition for the generated data, in the form `pages/2_Define_Tables.py` saves."""
+    product = {"name": "dim_product", "columns": ["Product", "Category"], "pk": "Product", "fk": "Product",
+               "history": False, "sub_dim": None}
+    if snowflake:
+        product["sub_dim"] = {"name": "dim_category", "columns": ["Category"], "pk": "Category", "fk": "Category"}
+    customer = {"name": "dim_customer", "columns": ["CustomerID"], "pk": "CustomerID", "fk": "CustomerID",
+                "history": False, "sub_dim": None}
+    return {"fact_cols": ["OrderID", "Product", "Amount", "CustomerID", "Date"],
+            "dimensions": [product, customer]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="CSV file to write.")
+    args = parser.parse_args(argv)
+
+    result = write_csv(args.out, args.rows, args.seed)
+    print(f"Wrote {result['rows']:,} rows to {args.out} in {result['seconds']:.1f} sec.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Incremental loading of fact and dimension tables into the warehouse."""
+import hashlib
+import time
+
+import pandas as pd
+
+from dw_lab.bulkload import bulk_load, sqlite_type
+
+# Bookkeeping table holding one content fingerprint per loaded table
+META_TABLE = "_etl_meta"
+# Single-row counter bumped whenever warehouse contents change (used to invalidate caches)
+VERSION_TABLE = "_dw_version"
+
+
+def _digest(df, row_hashes):
+    h = hashlib.blake2b(digest_size=16)
+    # Schema as stored in SQLite, so int8 vs int16 or category vs object don't count as changes
+    for col, dtype in df.dtypes.items():
+        h.update(f"{col}:{sqlite_type(dtype)};".encode())
+    h.update(row_hashes.tobytes())
+    return h.hexdigest()
+
+
+def row_hashes(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def table_fingerprint(df):
+    """Hash of a frame's schema plus its row contents (order-sensitive)."""
+    return _digest(df, row_hashes(df))
+
+
+def prepare_load(df, hashes=None):
+    """The database-independent part of `load_table` (row hashes and fingerprint), safe to run in a worker.
+
+    Pass `hashes` when `df`'s row hashes are already known (e.g. a slice of a hashed frame).
+    """
+    hashes = row_hashes(df) if hashes is None else hashes
+    return {"hashes": hashes, "fingerprint": _digest(df, hashes)}
+
+
+def ensure_meta(conn):
+    conn.execute(
+        f"""CREATE TABLE IF NOT EXISTS {META_TABLE} (
+            table_name  TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            rows        INTEGER NOT NULL,
+            loaded_at   REAL NOT NULL,
+            seconds     REAL NOT NULL,
+            append_from INTEGER
+        )"""
+    )
+    columns = {r[1] for r in conn.execute(f"PRAGMA table_info({META_TABLE})")}
+    if "append_from" not in columns:
+        conn.execute(f"ALTER TABLE {META_TABLE} ADD COLUMN append_from INTEGER")
+
+
+def warehouse_version(conn):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (VERSION_TABLE,)
+    ).fetchone()
+    if not row:
+        return 0
+    return conn.execute(f"SELECT version FROM {VERSION_TABLE}").fetchone()[0]
+
+
+def bump_version(conn):
+    """Increment the warehouse version; call after any change to warehouse tables."""
+    with conn:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (version INTEGER NOT NULL)")
+        if conn.execute(f"UPDATE {VERSION_TABLE} SET version = version + 1").rowcount == 0:
+            conn.execute(f"INSERT INTO {VERSION_TABLE} VALUES (1)")
+
+
+def stored_meta(conn, name):
+    """Return `{fingerprint, rows, append_from}` for the last load of `name`, or None.
+
+    `append_from` is the row count before the last load when that load only
+    appended rows, and NULL when the table was rewritten.
+    """
+    ensure_meta(conn)
+    row = conn.execute(
+        f"SELECT fingerprint, rows, append_from FROM {META_TABLE} WHERE table_name = ?", (name,)
+    ).fetchone()
+    return {"fingerprint": row[0], "rows": row[1], "append_from": row[2]} if row else None
+
+
+def stored_fingerprint(conn, name):
+    meta = stored_meta(conn, name)
+    return meta["fingerprint"] if meta else None
+
+
+def table_exists(conn, name):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+
+def load_table(conn, name, df, force=False, writer=bulk_load, prepared=None):
+    """Write `df` as table `name` unless its fingerprint matches the last load.
+
+    When the previously loaded rows are an unchanged prefix of `df`, only the new
+    rows are appended. `prepared` is `prepare_load(df)` if already computed.
+    Returns a dict with `table`, `rows`, `skipped`, `appended`, `seconds` and
+    `rows_per_sec`.
+    """
+    start = time.time()
+    ensure_meta(conn)
+    prepared = prepared or prepare_load(df)
+    hashes, fp = prepared["hashes"], prepared["fingerprint"]
+    prev = stored_meta(conn, name) if not force and table_exists(conn, name) else None
+    if prev and fp == prev["fingerprint"]:
+        return {"table": name, "rows": len(df), "skipped": True, "appended": False,
+                "seconds": time.time() - start, "rows_per_sec": None}
+
+    append_from = None
+    if prev and len(df) > prev["rows"] and _digest(df, hashes[:prev["rows"]]) == prev["fingerprint"]:
+        append_from = prev["rows"]
+        writer(conn, name, df.iloc[append_from:], append=True)
+    else:
+        writer(conn, name, df)
+    seconds = time.time() - start
+    written = len(df) - (append_from or 0)
+    with conn:
+        conn.execute(
+            f"INSERT OR REPLACE INTO {META_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+            (name, fp, len(df), time.time(), seconds, append_from),
+        )
+    bump_version(conn)
+    return {"table": name, "rows": len(df), "skipped": False, "appended": append_from is not None,
+            "seconds": seconds, "rows_per_sec": written / seconds if seconds else None}
@@ -0,0 +1,56 @@
+"""Query profiling: EXPLAIN QUERY PLAN analysis and per-phase timings."""
+import time
+
+import pandas as pd
+
+
+def explain(conn, sql):
+    """`EXPLAIN QUERY PLAN` as a DataFrame with `full_scan`, `temp_btree` and `auto_index` flags."""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    plan = pd.DataFrame(rows, columns=["id", "parent", "notused", "detail"]).drop(columns="notused")
+    detail = plan["detail"].str.upper()
+    # "SCAN t" reads every row; "SCAN t USING COVERING INDEX ..." still scans but only the index
+    plan["full_scan"] = detail.str.startswith("SCAN") & ~detail.str.contains("INDEX")
+    plan["temp_btree"] = detail.str.contains("TEMP B-TREE")
+    plan["auto_index"] = detail.str.contains("AUTOMATIC")
+    return plan
+
+
+def plan_warnings(plan):
+    warnings = []
+    for detail in plan.loc[plan["full_scan"], "detail"]:
+        warnings.append(f"Full table scan: `{detail}`")
+    for detail in plan.loc[plan["temp_btree"], "detail"]:
+        warnings.append(f"Temporary B-tree (sort/group without an index): `{detail}`")
+    for detail in plan.loc[plan["auto_index"], "detail"]:
+        warnings.append(f"Automatic index built for this query only: `{detail}`")
+    return warnings
+
+
+def profile_query(conn, sql):
+    """Run `sql`, timing each phase separately. Returns `(df, timings)`.
+
+    Phases: `prepare` (compiling the statement), `execute` (stepping to the first
+    row, where SQLite does most of the work for sorts and aggregates), `fetch`
+    (stepping through the remaining rows) and `build` (creating the DataFrame).
+    """
+    timings = {}
+    start = time.perf_counter()
+    # Compiling under EXPLAIN prepares the statement without running it
+    conn.execute(f"EXPLAIN {sql}").fetchone()
+    timings["prepare"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cursor = conn.execute(sql)
+    first = cursor.fetchone()
+    timings["execute"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rows = ([first] + cursor.fetchall()) if first is not None else []
+    timings["fetch"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columns = [c[0] for c in cursor.description] if cursor.description else []
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    timings["build"] = time.perf_counter() - start
+    return df, timings
@@ -0,0 +1,87 @@
+"""PK/FK and covering indexes for the loaded star/snowflake schema."""
+import time
+
+from dw_lab.bulkload import quote
+from dw_lab.partitions import partition_tables
+
+
+def index_name(table, columns):
+    return "ix_" + "_".join([table] + list(columns))
+
+
+def database_bytes(conn):
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return page_count * page_size
+
+
+def create_index(conn, table, columns, unique=False):
+    """`CREATE INDEX IF NOT EXISTS` on `table(columns)`; returns `(name, created, seconds)`."""
+    name = index_name(table, columns)
+    start = time.time()
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)
+    ).fetchone()
+    if not exists:
+        cols = ", ".join(quote(c) for c in columns)
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        with conn:
+            conn.execute(f"CREATE {kind} {quote(name)} ON {quote(table)} ({cols})")
+    return name, not exists, time.time() - start
+
+
+def star_index_specs(dimensions, fact_table="fact_table", group_by=(), measures=()):
+    """List `(table, columns, unique)` for every key declared in the schema.
+
+    Surrogate keys are unique, so their dimension indexes are UNIQUE. Each
+    `group_by` column gets a covering index `(group_col, *measures)` on the
+    fact table so GROUP BY aggregates can be answered from the index alone.
+    """
+    specs = []
+    for d in dimensions:
+        if d.get('sk'):
+            specs.append((d['name'], [d['sk']], True))
+            specs.append((fact_table, [d['sk']], False))
+        elif d['pk'] and d['fk']:
+            specs.append((d['name'], [d['pk']], False))
+            specs.append((fact_table, [d['fk']], False))
+        sub = d.get('sub_dim')
+        if sub and sub['pk'] and sub['fk']:
+            specs.append((sub['name'], [sub['pk']], False))
+            specs.append((d['name'], [sub['fk']], False))
+    for col in group_by:
+        specs.append((fact_table, [col] + [m for m in measures if m != col], False))
+
+    seen, unique_specs = set(), []
+    for table, columns, unique in specs:
+        key = (table, tuple(columns))
+        if key not in seen:
+            seen.add(key)
+            unique_specs.append((table, columns, unique))
+    return unique_specs
+
+
+def index_star(conn, dimensions, fact_table="fact_table", group_by=(), measures=(), analyze=True):
+    """Create all schema indexes, then refresh planner statistics with ANALYZE.
+
+    Returns `(results, bytes_added, analyze_seconds)`; `results` has one dict per index.
+    """
+    before = database_bytes(conn)
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    # A partitioned fact table is a view: its indexes go on every partition
+    partitioned = {fact_table: partition_tables(conn, fact_table)}
+    results = []
+    for table, columns, unique in star_index_specs(dimensions, fact_table, group_by, measures):
+        for target in partitioned.get(table) or [table]:
+            if target not in existing:
+                continue
+            name, created, seconds = create_index(conn, target, columns, unique)
+            results.append({"index": name, "table": target, "columns": ", ".join(columns),
+                            "created": created, "seconds": seconds})
+    analyze_seconds = 0.0
+    if analyze and any(r["created"] for r in results):
+        start = time.time()
+        with conn:
+            conn.execute("ANALYZE")
+        analyze_seconds = time.time() - start
+    return results, database_bytes(conn) - before, analyze_seconds
@@ -0,0 +1,128 @@
+"""Chunked, memory-bounded CSV ingestion."""
+import os
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# First chunk is kept small so the preview shows up right away
+PREVIEW_ROWS = 10_000
+# Strings with distinct/rows below this ratio become `category`
+CATEGORY_RATIO = 0.5
+# Share of the memory budget a single raw (not yet downcast) chunk may use
+CHUNK_BUDGET_SHARE = 0.1
+
+
+def downcast(df, category_cols=None, category_ratio=CATEGORY_RATIO):
+    """Shrink dtypes in place: smallest int width, low-cardinality strings to `category`.
+
+    Returns the list of columns converted to `category`.
+    """
+    if category_cols is None:
+        category_cols = []
+        for col in df.columns:
+            s = df[col]
+            if s.dtype == object and len(s) and s.nunique(dropna=True) / len(s) <= category_ratio:
+                category_cols.append(col)
+
+    for col in df.columns:
+        s = df[col]
+        if col in category_cols:
+            df[col] = s.astype("category")
+        elif pd.api.types.is_integer_dtype(s):
+            df[col] = pd.to_numeric(s, downcast="integer")
+    return category_cols
+
+
+def _source_size(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    size = getattr(source, "size", None)
+    if size is None:
+        pos = source.tell()
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(pos)
+    return size
+
+
+def _combine(chunks, category_cols):
+    """Concatenate downcast chunks, merging per-chunk categories without going through object."""
+    if len(chunks) == 1:
+        return chunks[0]
+    columns = chunks[0].columns
+    plain = [c for c in columns if c not in category_cols]
+    out = pd.concat([ch[plain] for ch in chunks], ignore_index=True)
+    for col in category_cols:
+        try:
+            merged = union_categoricals([ch[col] for ch in chunks])
+        except TypeError:
+            # Chunks parsed the column with different category types (e.g. int vs str)
+            merged = pd.concat([ch[col].astype(object) for ch in chunks], ignore_index=True)
+        out[col] = pd.Series(merged, index=out.index)
+    # Integer widths may differ between chunks; re-downcast the combined result
+    for col in plain:
+        if pd.api.types.is_integer_dtype(out[col]):
+            out[col] = pd.to_numeric(out[col], downcast="integer")
+    return out[columns]
+
+
+def read_csv_chunked(source, memory_budget_mb=512, on_chunk=None, preview_rows=PREVIEW_ROWS):
+    """Read a CSV in chunks, downcasting each one, without exceeding `memory_budget_mb`.
+
+    `on_chunk(chunk, rows_loaded, progress)` is called after every chunk; the first call
+    carries the preview chunk. Returns `(df, stats)` where `stats` has `rows`, `chunks`,
+    `bytes`, `memory_bytes` and `truncated` (True if the budget stopped the load early).
+    """
+    budget = int(memory_budget_mb * 1024 * 1024)
+    total_bytes = _source_size(source)
+    handle = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+
+    chunks = []
+    category_cols = None
+    rows = used = 0
+    truncated = False
+    chunk_rows = preview_rows
+    try:
+        with pd.read_csv(handle, iterator=True) as reader:
+            while True:
+                try:
+                    chunk = reader.get_chunk(chunk_rows)
+                except StopIteration:
+                    break
+                raw_bytes = chunk.memory_usage(deep=True).sum()
+                if category_cols is None:
+                    category_cols = downcast(chunk)
+                    # Size later chunks from the observed raw bytes per row
+                    per_row = max(raw_bytes / max(len(chunk), 1), 1)
+                    chunk_rows = max(int(budget * CHUNK_BUDGET_SHARE / per_row), 1_000)
+                else:
+                    downcast(chunk, category_cols)
+
+                size = chunk.memory_usage(deep=True).sum()
+                if chunks and used + size > budget:
+                    truncated = True
+                    break
+                chunks.append(chunk)
+                used += size
+                rows += len(chunk)
+
+                if on_chunk is not None:
+                    pos = handle.tell() if hasattr(handle, "tell") else total_bytes
+                    on_chunk(chunk, rows, min(pos / total_bytes, 1.0) if total_bytes else 1.0)
+    finally:
+        if handle is not source:
+            handle.close()
+
+    if not chunks:
+        return pd.DataFrame(), {"rows": 0, "chunks": 0, "bytes": total_bytes,
+                                "memory_bytes": 0, "truncated": False}
+
+    df = _combine(chunks, category_cols)
+    stats = {
+        "rows": rows,
+        "chunks": len(chunks),
+        "bytes": total_bytes,
+        "memory_bytes": int(df.memory_usage(deep=True).sum()),
+        "truncated": truncated,
+    }
+    return df, stats
@@ -0,0 +1,200 @@
+"""Background jobs on a process-wide executor, with per-table progress and cooperative cancellation.
+
+A job runs in a worker thread of the process's executor, so it outlives the
+Streamlit script run that submitted it: the page only keeps the job id, and
+reruns (or visits to other pages) find the job in the module-level registry
+while it keeps loading. Every table the job writes reports the rows written so
+far after each `bulk_load` batch, from which the page shows progress and
+throughput. `Job.cancel` only sets a flag; the job stops at its next batch
+(the table being written is rolled back) or between tables.
+"""
+import itertools
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from dw_lab.buildgraph import load_graph
+from dw_lab.bulkload import bulk_load
+from dw_lab.connections import get_manager
+
+MAX_WORKERS = 2
+# Finished jobs are forgotten after this many seconds
+JOB_TTL = 3600
+# How often a page showing a running job refreshes it
+POLL_SECONDS = 0.5
+
+_executor = None
+_jobs = {}
+_lock = threading.Lock()
+_ids = itertools.count(1)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, name, session_id=None):
+        self.id = f"{name}-{next(_ids)}"
+        self.name = name
+        self.session_id = session_id
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = self.finished = None
+        self.result = self.error = self.traceback = None
+        self.tables = {}
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        """Raise `JobCancelled` if cancellation was requested (call between units of work)."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def start_table(self, table, rows):
+        with self._lock:
+            self.tables[table] = {"table": table, "status": "writing", "rows": rows, "written": 0,
+                                  "started": time.time(), "seconds": 0.0}
+
+    def advance(self, table, rows):
+        """Count `rows` more rows written to `table`, then stop here if the job was cancelled."""
+        with self._lock:
+            t = self.tables[table]
+            t["written"] += rows
+            t["seconds"] = time.time() - t["started"]
+        self.check()
+
+    def finish_table(self, table, status):
+        with self._lock:
+            t = self.tables[table]
+            t["status"] = status
+            t["seconds"] = time.time() - t["started"]
+
+    def _stop_writing(self, status):
+        with self._lock:
+            writing = [name for name, t in self.tables.items() if t["status"] == "writing"]
+        for name in writing:
+            self.finish_table(name, status)
+
+    def writer(self, table, rows):
+        """A `bulk_load`-compatible writer reporting its progress to `table` (which may span several loads)."""
+        self.start_table(table, rows)
+
+        def write(conn, name, df, **kwargs):
+            done = 0
+
+            def on_batch(written):
+                nonlocal done
+                self.advance(table, written - done)
+                done = written
+
+            return bulk_load(conn, name, df, on_batch=on_batch, **kwargs)
+
+        return write
+
+    def progress(self):
+        """One dict per table with `status`, `rows`, `written`, `seconds` and `rows_per_sec`."""
+        with self._lock:
+            tables = [dict(t) for t in self.tables.values()]
+        for t in tables:
+            if t["status"] == "writing":
+                t["seconds"] = time.time() - t["started"]
+            t["rows_per_sec"] = t["written"] / t["seconds"] if t["seconds"] else None
+            del t["started"]
+        return tables
+
+    def fraction(self):
+        """Share of the known rows written so far (tables not yet built are not counted)."""
+        tables = self.progress()
+        total = sum(t["rows"] for t in tables)
+        done = sum(t["rows"] if t["status"] != "writing" else min(t["written"], t["rows"]) for t in tables)
+        return done / total if total else 0.0
+
+    def _run(self, func, args, kwargs):
+        if self._cancel.is_set():
+            self.finished, self.status = time.time(), "cancelled"
+            return
+        self.status, self.started = "running", time.time()
+        # `finished` is set in the same assignment as the final status, so a job that is no longer
+        # active always has it (`_forget_finished` runs on other threads)
+        try:
+            self.result = func(self, *args, **kwargs)
+            self.finished, self.status = time.time(), "done"
+        except JobCancelled:
+            self._stop_writing("cancelled")
+            self.finished, self.status = time.time(), "cancelled"
+        except Exception as e:
+            self._stop_writing("failed")
+            self.error = f"{type(e).__name__}: {e}"
+            self.traceback = traceback.format_exc()
+            self.finished, self.status = time.time(), "failed"
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="dw-job")
+        return _executor
+
+
+def _forget_finished(now):
+    for job_id in [i for i, j in _jobs.items() if not j.active and j.finished is not None
+                   and now - j.finished > JOB_TTL]:
+        del _jobs[job_id]
+
+
+def submit(name, func, *args, session_id=None, **kwargs):
+    """Run `func(job, *args, **kwargs)` in the background. Returns the `Job`."""
+    job = Job(name, session_id)
+    with _lock:
+        _forget_finished(time.time())
+        _jobs[job.id] = job
+    _pool().submit(job._run, func, args, kwargs)
+    return job
+
+
+def get_job(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def jobs(session_id=None):
+    """Registered jobs (of one session if given), newest first."""
+    with _lock:
+        found = [j for j in _jobs.values() if session_id is None or j.session_id == session_id]
+    return sorted(found, key=lambda j: j.submitted, reverse=True)
+
+
+def etl_job(job, warehouse_path, fact, dimensions, raw_df, as_of=None, partition_column=None, force=False):
+    """The ETL page's loads as a job: `buildgraph.load_graph` through the warehouse's writer.
+
+    Returns `{nodes, seconds}` with every node by name, as the page reports
+    them: its `kind`, `build_seconds` and load `result`. The built tables are
+    not kept, since the job stays registered after the session that ran it.
+    """
+    warehouse = get_manager(warehouse_path)
+    conn = warehouse.writer()
+    start = time.time()
+    nodes = {}
+    try:
+        for n in load_graph(conn, fact, dimensions, raw_df, as_of, partition_column, force, writer_for=job.writer):
+            if "result" in n:
+                job.finish_table(n["name"], "skipped" if n["result"]["skipped"] else "done")
+            nodes[n["name"]] = {k: n[k] for k in ("name", "kind", "build_seconds", "result") if k in n}
+            job.check()
+    finally:
+        warehouse.release()
+    return {"nodes": nodes, "seconds": time.time() - start}
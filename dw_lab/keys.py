@@ -0,0 +1,86 @@
+"""Surrogate keys for star/snowflake schemas.
+
+Every dimension gets a dense int32 surrogate key (1..n, 0 is the "unknown"
+member) and the fact table stores those int32 keys in place of the wide
+natural-key columns. Keys are mapped with hash-based index lookups
+(`Index.get_indexer`), so no Python-level loop touches the fact rows.
+"""
+import numpy as np
+import pandas as pd
+
+UNKNOWN_SK = 0
+
+
+def sk_column(dim_name):
+    return f"{dim_name}_sk"
+
+
+def build_dimension(df, columns, pk, name):
+    """Distinct dimension rows by natural key `pk`, with a leading `<name>_sk` column."""
+    if not columns or not pk:
+        return df[list(columns)].drop_duplicates()
+    dim = df[list(columns)].drop_duplicates(subset=[pk]).reset_index(drop=True)
+    dim.insert(0, sk_column(name), np.arange(1, len(dim) + 1, dtype=np.int32))
+    return dim
+
+
+def lookup_keys(natural_values, dim, pk, name):
+    """Map natural key values to the dimension's surrogate keys (hash join)."""
+    positions = pd.Index(dim[pk]).get_indexer(natural_values)
+    keys = dim[sk_column(name)].to_numpy()
+    return np.where(positions >= 0, keys[positions], UNKNOWN_SK).astype(np.int32)
+
+
+def build_star(df, fact_cols, dimension_defs):
+    """Build an int-encoded fact table and surrogate-keyed dimensions from the raw frame.
+
+    Returns `(fact, dimensions)`; each dimension dict gains `table` and `sk`.
+    """
+    dimensions = []
+    keys = {}
+    for d in dimension_defs:
+        dim = build_dimension(df, d['columns'], d['pk'], d['name'])
+        sk = sk_column(d['name'])
+        if d['pk'] and d['fk'] in df.columns and sk in dim.columns:
+            keys[d['name']] = lookup_keys(df[d['fk']], dim, d['pk'], d['name'])
+        dimensions.append({**d, 'table': dim, 'sk': sk})
+    return encode_fact(df, fact_cols, dimensions, keys), dimensions
+
+
+def encode_fact(df, fact_cols, dimensions, keys):
+    """`df[fact_cols]` with each FK replaced by the surrogate keys `keys[<dimension name>]` (where given)."""
+    fact = df[fact_cols].copy()
+    replaced = set()
+    for d in dimensions:
+        if d['name'] not in keys:
+            continue
+        position = fact.columns.get_loc(d['fk']) if d['fk'] in fact.columns else len(fact.columns)
+        fact.insert(position, d['sk'], keys[d['name']])
+        replaced.add(d['fk'])
+    return fact.drop(columns=[c for c in replaced if c in fact.columns])
+
+
+def natural_fact(fact, dimensions, columns=None):
+    """Decode surrogate keys in `fact` back to natural-key columns for display and analysis.
+
+    String keys come back as `category` (codes are the surrogate keys, so no strings
+    are copied). Pass `columns` to decode only the natural keys that are needed.
+    """
+    out = fact
+    for d in dimensions:
+        sk = d.get('sk')
+        if not sk or sk not in out.columns or (columns is not None and d['fk'] not in columns):
+            continue
+        if d['fk'] in out.columns:
+            continue
+        values = d['table'][d['pk']]
+        codes = out[sk].to_numpy().astype(np.int64) - 1
+        if values.notna().all() and not pd.api.types.is_numeric_dtype(values):
+            decoded = pd.Categorical.from_codes(codes, categories=pd.Index(values.astype(object)))
+        else:
+            decoded = pd.api.extensions.take(values.to_numpy(), codes, allow_fill=True)
+        if out is fact:
+            out = fact.copy(deep=False)
+        out.insert(out.columns.get_loc(sk), d['fk'], decoded)
+        out = out.drop(columns=[sk])
+    return out
@@ -0,0 +1,159 @@
+"""Paginated query results and chunked exports.
+
+Pages are read with `LIMIT/OFFSET` on the calling script run's leased reader
+from the connection manager (`connections.get_manager`), and the cursor is
+drained before returning, so no read transaction stays open between runs to
+hold back WAL checkpoints. OFFSET is deliberate: an arbitrary SELECT has no key
+to seek on, and keeping a cursor open across runs would hold such a
+transaction. Its cost is a scan of the skipped rows, so with a query cache one
+read fetches `READ_AHEAD_PAGES` consecutive pages and caches each of them;
+paging forward then scans once per block rather than once per page, and pages
+already read come from the cache. At most one block of rows is materialized at
+a time. The total row count is only computed on request. Exports stream the
+result through the same reader in chunks.
+"""
+import csv
+import os
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from dw_lab.connections import get_manager
+from dw_lab.etl import warehouse_version
+from dw_lab.querycache import database_id, normalize_sql
+
+DEFAULT_PAGE_SIZE = 100
+READ_AHEAD_PAGES = 10
+EXPORT_CHUNK_ROWS = 50_000
+# A browser download is served from memory (Streamlit's media store), so larger exports are not offered
+MAX_DOWNLOAD_MB = 200
+
+
+def leased_reader(conn):
+    """The calling thread's read-only connection to the same database file as `conn`."""
+    path = database_id(conn)
+    if path.startswith("memory:"):
+        return conn
+    return get_manager(path).reader()
+
+
+class ResultPager:
+    """Page through the rows of one SELECT; holds no connection, so it can be kept across script runs."""
+
+    def __init__(self, conn, sql, page_size=DEFAULT_PAGE_SIZE, cache=None):
+        self.sql = normalize_sql(sql)
+        self.page_size = page_size
+        self.cache = cache
+        # In-memory databases (no manager) are read through `conn` itself
+        self._memory = conn if database_id(conn).startswith("memory:") else None
+        self._path = database_id(conn)
+        self.version = warehouse_version(conn)
+        self._columns = None
+        self._total = None
+
+    def _reader(self):
+        return self._memory or get_manager(self._path).reader()
+
+    def _key(self, conn, number):
+        return self.cache.key(conn, self.sql, "page", self.page_size, number)
+
+    def page(self, number):
+        """Return page `number` (0-based) as a DataFrame."""
+        conn = self._reader()
+        if self.cache is None:
+            first, count = number, 1
+        else:
+            cached = self.cache.get(self._key(conn, number))
+            if cached is not None:
+                return cached
+            # Read the block holding `number`, so the pages after it need no scan of their own
+            first, count = number - number % READ_AHEAD_PAGES, READ_AHEAD_PAGES
+
+        cursor = conn.execute(f"SELECT * FROM ({self.sql}) LIMIT ? OFFSET ?",
+                              (count * self.page_size, first * self.page_size))
+        try:
+            self._columns = [c[0] for c in cursor.description]
+            for n in range(first, first + count):
+                df = pd.DataFrame.from_records(cursor.fetchmany(self.page_size), columns=self._columns)
+                if self.cache is not None:
+                    self.cache.put(self._key(conn, n), df)
+                if n == number:
+                    page = df
+                if n >= number and len(df) < self.page_size:
+                    break
+        finally:
+            cursor.close()
+        return page
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            cursor = self._reader().execute(f"SELECT * FROM ({self.sql}) LIMIT 0")
+            self._columns = [c[0] for c in cursor.description]
+            cursor.close()
+        return self._columns
+
+    def total(self, compute=True):
+        """Total row count, computed once on first request (None if not yet computed and `compute` is False)."""
+        if self._total is None and compute:
+            self._total = self._reader().execute(f"SELECT COUNT(*) FROM ({self.sql})").fetchone()[0]
+        return self._total
+
+
+def iter_chunks(conn, sql, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield `(columns, rows)` chunks of a query result from a fresh cursor on the leased reader."""
+    cursor = leased_reader(conn).execute(sql)
+    try:
+        columns = [c[0] for c in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield columns, rows
+    finally:
+        cursor.close()
+
+
+def export_csv(conn, sql, path, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Write the full result of `sql` to `path` as CSV, one chunk at a time. Returns the row count."""
+    total = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        header_written = False
+        for columns, rows in iter_chunks(conn, sql, chunk_rows):
+            if not header_written:
+                writer.writerow(columns)
+                header_written = True
+            writer.writerows(rows)
+            total += len(rows)
+    return total
+
+
+def export_parquet(conn, sql, path, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Write the full result of `sql` to `path` as Parquet, one row group per chunk. Returns the row count."""
+    total = 0
+    writer = None
+    try:
+        for columns, rows in iter_chunks(conn, sql, chunk_rows):
+            table = pa.Table.from_pandas(pd.DataFrame.from_records(rows, columns=columns), preserve_index=False)
+            if writer is None:
+                # Columns that are all NULL in the first chunk are written as strings
+                schema = pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                                    for f in table.schema]).remove_metadata()
+                writer = pq.ParquetWriter(path, schema)
+            writer.write_table(table.cast(schema, safe=False) if table.schema != schema else table)
+            total += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+
+def export_to_tempfile(conn, sql, fmt="csv", chunk_rows=EXPORT_CHUNK_ROWS):
+    """Stream the result of `sql` into a temporary file; returns `(path, rows)`."""
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}", prefix="dw_export_")
+    os.close(fd)
+    export = export_parquet if fmt == "parquet" else export_csv
+    return path, export(conn, sql, path, chunk_rows)
@@ -0,0 +1,204 @@
+"""Monthly partitioning of the fact table.
+
+With a partition column, ETL stores the fact table as one table per calendar
+month (`fact_table__p2024_03`; rows whose value is not an ISO date go to
+`fact_table__pother`) and `fact_table` becomes a UNION ALL view over them, so
+every reader works unchanged. Each partition is loaded with `etl.load_table`:
+a month whose rows did not change is skipped, one that only gained rows is
+appended to, and only the months that changed are rewritten.
+
+`_fact_partitions` records each partition's `[lo, hi)` bounds. Bounds are
+compared as text, exactly like SQLite compares the stored ISO dates, so a query
+bounded on the partition column can read just the overlapping partitions
+(`prune`) and get the same rows as a scan of the whole table.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from dw_lab.bulkload import bulk_load, quote
+from dw_lab.etl import META_TABLE, bump_version, ensure_meta, load_table, prepare_load, stored_fingerprint
+
+CATALOG_TABLE = "_fact_partitions"
+OTHER = "other"
+# SQLite's default limit on the terms of a compound SELECT (the UNION ALL view)
+MAX_PARTITIONS = 500
+_ISO_DATE = r"\d{4}-\d{2}-\d{2}"
+_FINGERPRINT_PREFIX = "partitioned:"
+
+
+def ensure_catalog(conn):
+    conn.execute(
+        f"""CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            parent     TEXT NOT NULL,
+            column     TEXT NOT NULL,
+            partition  TEXT NOT NULL,
+            lo         TEXT,
+            hi         TEXT,
+            rows       INTEGER NOT NULL
+        )"""
+    )
+
+
+def partition_table(parent, key):
+    return f"{parent}__p{key}"
+
+
+def _iso_text(values):
+    s = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(s.dtype):
+        return s.dt.strftime("%Y-%m-%d %H:%M:%S")
+    return s.astype(str).where(s.notna(), None)
+
+
+def date_columns(df, sample=100):
+    """Columns holding datetimes or ISO date strings (candidates for the partition column)."""
+    found = []
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_datetime64_any_dtype(s.dtype):
+            found.append(col)
+        elif not pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+            head = s.dropna().head(sample)
+            if len(head) and head.astype(str).str.match(_ISO_DATE).all():
+                found.append(col)
+    return found
+
+
+def month_keys(values):
+    """`YYYY_MM` partition key per value (as stored in SQLite), or `OTHER` when it is not an ISO date."""
+    # String work is done once per distinct value (dates repeat a lot); missing values get code -1
+    codes, uniques = pd.factorize(pd.Series(values))
+    text = _iso_text(uniques)
+    iso = text.str.match(_ISO_DATE).fillna(False).to_numpy(bool)
+    keys = np.full(len(text) + 1, OTHER, dtype=object)
+    keys[:-1][iso] = (text[iso].str[:4] + "_" + text[iso].str[5:7]).to_numpy(object)
+    return keys[codes]
+
+
+def month_bounds(key):
+    """`[lo, hi)` of a month partition as ISO text, or `(None, None)` for `OTHER`."""
+    if key == OTHER:
+        return None, None
+    year, month = key.split("_")
+    next_year, next_month = (int(year) + 1, 1) if month == "12" else (int(year), int(month) + 1)
+    return f"{year}-{month}-01", f"{next_year:04d}-{next_month:02d}-01"
+
+
+def partitions(conn, parent):
+    """Catalog rows of `parent`'s partitions ordered by key (`OTHER` last); empty if not partitioned."""
+    # Also called on read-only connections, so the catalog is not created here
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                        (CATALOG_TABLE,)).fetchone():
+        return []
+    rows = conn.execute(
+        f"SELECT table_name, column, partition, lo, hi, rows FROM {CATALOG_TABLE} WHERE parent = ? "
+        f"ORDER BY partition = ?, partition", (parent, OTHER)).fetchall()
+    return [{"table": r[0], "column": r[1], "partition": r[2], "lo": r[3], "hi": r[4], "rows": r[5]} for r in rows]
+
+
+def partition_tables(conn, parent):
+    return [p["table"] for p in partitions(conn, parent)]
+
+
+def union_sql(tables):
+    return " UNION ALL ".join(f"SELECT * FROM {quote(t)}" for t in tables)
+
+
+def drop_partitions(conn, parent, keep=()):
+    """Drop `parent`'s partition tables (except the keys in `keep`) with their catalog and meta rows."""
+    for p in partitions(conn, parent):
+        if p["partition"] in keep:
+            continue
+        conn.execute(f"DROP TABLE IF EXISTS {quote(p['table'])}")
+        conn.execute(f"DELETE FROM {META_TABLE} WHERE table_name = ?", (p["table"],))
+        conn.execute(f"DELETE FROM {CATALOG_TABLE} WHERE table_name = ?", (p["table"],))
+
+
+def load_partitioned(conn, name, df, column, force=False, prepared=None, writer=bulk_load):
+    """Load `df` as monthly partitions of `column` behind view `name`.
+
+    Returns the `etl.load_table` result dict plus `partitions` and one result per
+    partition in `details` (empty when the whole table was unchanged).
+    """
+    start = time.time()
+    ensure_meta(conn)
+    ensure_catalog(conn)
+    prepared = prepared or prepare_load(df)
+    fp = f"{_FINGERPRINT_PREFIX}{column}:" + prepared["fingerprint"]
+    existing = partitions(conn, name)
+    if existing and not force and stored_fingerprint(conn, name) == fp:
+        return {"table": name, "rows": len(df), "skipped": True, "appended": False, "seconds": time.time() - start,
+                "rows_per_sec": None, "partitions": len(existing), "details": []}
+
+    groups = df.groupby(month_keys(df[column]), sort=True).indices
+    if len(groups) > MAX_PARTITIONS:
+        raise ValueError(f"{len(groups)} monthly partitions of `{column}` exceed the limit of {MAX_PARTITIONS}.")
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    with conn:
+        if kind and kind[0] == "table":
+            # Replaces an unpartitioned load of the same table
+            conn.execute(f"DROP TABLE {quote(name)}")
+        # Partitions are committed one by one: until all of them, the catalog and the view are done,
+        # no fingerprint may claim the table holds `df` (an interrupted load would then be skipped)
+        conn.execute(f"DELETE FROM {META_TABLE} WHERE table_name = ?", (name,))
+    details = []
+    for key, rows in groups.items():
+        # Row hashes are per row, so each partition's are a slice of the whole table's
+        part = df.iloc[rows]
+        result = load_table(conn, partition_table(name, key), part, force=force, writer=writer,
+                            prepared=prepare_load(part, prepared["hashes"][rows]))
+        details.append({**result, "partition": key})
+
+    with conn:
+        drop_partitions(conn, name, keep=groups)
+        register_partitions(conn, name, column, {key: len(rows) for key, rows in groups.items()})
+    seconds = time.time() - start
+    with conn:
+        conn.execute(f"INSERT OR REPLACE INTO {META_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+                     (name, fp, len(df), time.time(), seconds, None))
+    bump_version(conn)
+    written = sum(r["rows"] for r in details if not r["skipped"])
+    return {"table": name, "rows": len(df), "skipped": False,
+            "appended": all(r["skipped"] or r["appended"] for r in details),
+            "seconds": seconds, "rows_per_sec": written / seconds if seconds else None,
+            "partitions": len(groups), "details": details}
+
+
+def register_partitions(conn, name, column, rows_by_key):
+    """Catalog the loaded partition tables of `name` (rows per key) and (re)create its UNION ALL view."""
+    for key, rows in rows_by_key.items():
+        lo, hi = month_bounds(key)
+        conn.execute(f"INSERT OR REPLACE INTO {CATALOG_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (partition_table(name, key), name, column, key, lo, hi, int(rows)))
+    conn.execute(f"DROP VIEW IF EXISTS {quote(name)}")
+    conn.execute(f"CREATE VIEW {quote(name)} AS {union_sql(partition_tables(conn, name))}")
+
+
+def unpartition(conn, name):
+    """Drop `name`'s partitions and view (before it is loaded as a plain table again)."""
+    if not partitions(conn, name):
+        return
+    with conn:
+        drop_partitions(conn, name)
+        conn.execute(f"DROP VIEW IF EXISTS {quote(name)}")
+        conn.execute(f"DELETE FROM {META_TABLE} WHERE table_name = ?", (name,))
+    bump_version(conn)
+
+
+def prune(conn, parent, filters):
+    """Partition tables of `parent` that can hold rows matching `filters`.
+
+    Returns None when `parent` is not partitioned or `filters` do not bound its
+    partition column with `("between", lo, hi)`.
+    """
+    parts = partitions(conn, parent)
+    if not parts:
+        return None
+    spec = (filters or {}).get(parts[0]["column"])
+    if not (isinstance(spec, tuple) and spec and spec[0] == "between"):
+        return None
+    lo, hi = str(spec[1]), str(spec[2])
+    return [p["table"] for p in parts if p["lo"] is None or (p["lo"] <= hi and lo < p["hi"])]
@@ -0,0 +1,387 @@
+"""Headless batch pipeline: staging and ETL of a CSV file from a declarative schema spec.
+
+The spec is the schema `pages/2_Define_Tables.py` saves, as JSON (see
+`dw_lab.datagen.schema_spec`): `fact_cols` and `dimensions` (each with `name`,
+`columns`, `pk`, `fk`, optional `history` and `sub_dim`), plus optional
+`surrogate_keys` (default true), `history_as_of`, `partition_column` and
+`staging` (`{"scaled_column": {"source", "target", "factor"}}`).
+
+The CSV is read in chunks and never held whole. Each chunk is appended to the
+raw staging table and, with its foreign keys encoded, to the fact table;
+dimensions grow by the keys seen for the first time, so their surrogate keys
+are the ones `keys.build_star` assigns to the whole file. Only the dimensions
+(one row per key) are kept in memory. History dimensions need every key before
+the fact table is encoded, so their columns are read in a first pass.
+
+The fact table is written under a temporary name and swapped in at the end in
+one transaction, so readers never see a half-loaded table. Dimensions go
+through the same incremental `load_table` / `merge_history` as the ETL page,
+then indexes, materialized views, `v_star` and a stale cube are refreshed.
+A run whose file and spec match the last run is skipped.
+
+    python -m dw_lab.pipeline data/sales.csv --spec schema.json --warehouse dw_lab.db
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from dw_lab.bulkload import bulk_load, quote
+from dw_lab.cache import fingerprint
+from dw_lab.connections import STAGING_PATH, WAREHOUSE_PATH, drop_manager, get_manager
+from dw_lab.cube import build_cube, create_star_view, cube_config, is_stale
+from dw_lab.etl import META_TABLE, bump_version, ensure_meta, load_table, prepare_load, stored_fingerprint
+from dw_lab.indexes import index_star
+from dw_lab.keys import UNKNOWN_SK, encode_fact, lookup_keys, sk_column
+from dw_lab.partitions import (MAX_PARTITIONS, drop_partitions, ensure_catalog, month_keys, partition_table,
+                               register_partitions)
+from dw_lab.scd import history_table, merge_history, version_keys
+from dw_lab.staging import StagingPipeline, drop_nulls, scaled_column, select_all
+from dw_lab.views import refresh_views
+
+FACT_TABLE = "fact_table"
+DEFAULT_CHUNK_ROWS = 250_000
+_LOADING_SUFFIX = "__loading"
+_FINGERPRINT_PREFIX = "batch:"
+
+
+def load_spec(source):
+    """Schema spec from a JSON file path or a dict, with defaults filled in."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source) as f:
+            source = json.load(f)
+    spec = {"surrogate_keys": True, "history_as_of": None, "partition_column": None, "staging": {}, **source}
+    spec["dimensions"] = [{"history": False, "sub_dim": None, **d} for d in spec.get("dimensions", [])]
+    return spec
+
+
+def validate_spec(spec, columns):
+    """Raise ValueError when the spec names columns the CSV does not have."""
+    needed = {"fact_cols": spec.get("fact_cols") or []}
+    for d in spec["dimensions"]:
+        needed[d["name"]] = list(d["columns"]) + [d["fk"]]
+        if d["sub_dim"]:
+            needed[d["sub_dim"]["name"]] = list(d["sub_dim"]["columns"])
+    if not needed["fact_cols"]:
+        raise ValueError("The spec has no fact columns.")
+    missing = {name: [c for c in cols if c not in columns] for name, cols in needed.items()}
+    missing = {name: cols for name, cols in missing.items() if cols}
+    if missing:
+        raise ValueError("Columns not in the CSV: " + "; ".join(f"{n}: {', '.join(c)}" for n, c in missing.items()))
+    for d in spec["dimensions"]:
+        if d["history"] and not spec["surrogate_keys"]:
+            raise ValueError(f"History dimension `{d['name']}` needs surrogate keys.")
+    if spec["partition_column"] and spec["partition_column"] not in spec["fact_cols"]:
+        raise ValueError(f"Partition column `{spec['partition_column']}` is not a fact column.")
+
+
+class DimensionBuilder:
+    """A dimension grown chunk by chunk: rows of keys not seen before are kept, in order of first appearance."""
+
+    def __init__(self, columns, pk=None):
+        self.columns = list(columns)
+        self.pk = pk
+        self.parts = []
+        self.keys = None
+
+    def update(self, chunk):
+        if self.pk is None:
+            # Without a key the dimension is the distinct rows; keep it deduplicated as it grows
+            rows = pd.concat(self.parts + [chunk[self.columns]], ignore_index=True).drop_duplicates()
+            self.parts = [rows.reset_index(drop=True)]
+            return
+        rows = chunk[self.columns].drop_duplicates(subset=[self.pk])
+        new = rows if self.keys is None else rows[self.keys.get_indexer(rows[self.pk]) < 0]
+        if len(new):
+            self.parts.append(new)
+            self.keys = pd.Index(new[self.pk]) if self.keys is None else self.keys.append(pd.Index(new[self.pk]))
+
+    def surrogate_keys(self, values):
+        """Keys 1..n in order of first appearance (`UNKNOWN_SK` for keys never seen), as `keys.lookup_keys`."""
+        if self.keys is None:
+            return np.full(len(values), UNKNOWN_SK, dtype=np.int32)
+        positions = self.keys.get_indexer(values)
+        return np.where(positions >= 0, positions + 1, UNKNOWN_SK).astype(np.int32)
+
+    def table(self, name=None):
+        """The dimension table, with a leading `<name>_sk` column when it has a key and `name` is given."""
+        rows = (pd.concat(self.parts, ignore_index=True) if self.parts
+                else pd.DataFrame(columns=self.columns))
+        if name is not None and self.pk is not None:
+            rows.insert(0, sk_column(name), np.arange(1, len(rows) + 1, dtype=np.int32))
+        return rows
+
+
+def read_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS, usecols=None, on_chunk=None):
+    """Yield the CSV's rows as DataFrames of `chunk_rows`; `on_chunk(rows_read, progress)` follows each one."""
+    total = os.path.getsize(path)
+    rows = 0
+    with open(path, "rb") as handle, pd.read_csv(handle, chunksize=chunk_rows, usecols=usecols) as reader:
+        for chunk in reader:
+            rows += len(chunk)
+            yield chunk
+            if on_chunk is not None:
+                on_chunk(rows, min(handle.tell() / total, 1.0) if total else 1.0)
+
+
+class FactWriter:
+    """Appends encoded fact chunks under a temporary name, then swaps them in as `FACT_TABLE`."""
+
+    def __init__(self, conn, partition_column=None):
+        self.conn = conn
+        self.partition_column = partition_column
+        self.loading = FACT_TABLE + _LOADING_SUFFIX
+        self.rows = 0
+        self.partition_rows = {}
+        self._drop_loading()
+
+    def _drop_loading(self):
+        # Leftovers of an interrupted run
+        pattern = self.loading.replace("_", "\\_") + "%"
+        names = [r[0] for r in self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\'", (pattern,))]
+        for name in names:
+            with self.conn:
+                self.conn.execute(f"DROP TABLE {quote(name)}")
+
+    def append(self, fact):
+        if self.partition_column is None:
+            bulk_load(self.conn, self.loading, fact, append=self.rows > 0)
+        else:
+            for key, rows in fact.groupby(month_keys(fact[self.partition_column]), sort=True).indices.items():
+                if key not in self.partition_rows and len(self.partition_rows) >= MAX_PARTITIONS:
+                    raise ValueError(f"Monthly partitions of `{self.partition_column}` exceed the limit of "
+                                     f"{MAX_PARTITIONS}.")
+                bulk_load(self.conn, partition_table(self.loading, key), fact.iloc[rows],
+                          append=key in self.partition_rows)
+                self.partition_rows[key] = self.partition_rows.get(key, 0) + len(rows)
+        self.rows += len(fact)
+
+    def swap(self, fp, seconds):
+        """Replace `FACT_TABLE` (a table, or a partitioned view) with the loaded rows in one transaction."""
+        conn = self.conn
+        ensure_meta(conn)
+        ensure_catalog(conn)
+        if conn.in_transaction:
+            conn.commit()
+        # Keep views that read the fact table (v_star, materialized view sources) pointing at the new one
+        conn.execute("PRAGMA legacy_alter_table = ON")
+        conn.execute("BEGIN")
+        try:
+            drop_partitions(conn, FACT_TABLE)
+            kind = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (FACT_TABLE,)).fetchone()
+            if kind:
+                conn.execute(f"DROP {kind[0].upper()} {quote(FACT_TABLE)}")
+            if self.partition_column is None:
+                conn.execute(f"ALTER TABLE {quote(self.loading)} RENAME TO {quote(FACT_TABLE)}")
+            else:
+                for key in self.partition_rows:
+                    conn.execute(f"ALTER TABLE {quote(partition_table(self.loading, key))} "
+                                 f"RENAME TO {quote(partition_table(FACT_TABLE, key))}")
+                register_partitions(conn, FACT_TABLE, self.partition_column, self.partition_rows)
+            conn.execute(f"INSERT OR REPLACE INTO {META_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+                         (FACT_TABLE, fp, self.rows, time.time(), seconds, None))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("PRAGMA legacy_alter_table = OFF")
+        bump_version(conn)
+
+
+def _sk(spec, d):
+    return sk_column(d["name"]) if spec["surrogate_keys"] and d["pk"] else None
+
+
+def _history_pass(conn, path, spec, chunk_rows, force):
+    """Read the history dimensions' columns and merge them. Returns `{name: (dimension, versions, result)}`."""
+    history = [d for d in spec["dimensions"] if d["history"]]
+    columns = sorted({c for d in history for c in list(d["columns"]) + [d["fk"]]})
+    builders = {d["name"]: DimensionBuilder(d["columns"], d["pk"]) for d in history}
+    for chunk in read_chunks(path, chunk_rows, usecols=columns):
+        for d in history:
+            builders[d["name"]].update(chunk)
+    out = {}
+    for d in history:
+        table = builders[d["name"]].table(d["name"])
+        result = merge_history(conn, d["name"], table, d["pk"], sk_column(d["name"]), force=force)
+        dimension = {**d, "table": table, "sk": sk_column(d["name"])}
+        out[d["name"]] = (dimension, history_table(conn, d["name"]), result)
+    return out
+
+
+def _encode(chunk, spec, builders, history):
+    """The chunk's fact rows with surrogate keys (history dimensions' keys mapped to versions)."""
+    if not spec["surrogate_keys"]:
+        return chunk[spec["fact_cols"]]
+    keys = {}
+    dimensions = []
+    for d in spec["dimensions"]:
+        dimensions.append({**d, "sk": _sk(spec, d)})
+        if not d["pk"]:
+            continue
+        if d["name"] in history:
+            dimension, versions, _ = history[d["name"]]
+            as_of = spec["history_as_of"] if spec["history_as_of"] in chunk.columns else None
+            codes = pd.DataFrame({dimension["sk"]: lookup_keys(chunk[d["fk"]], dimension["table"], d["pk"],
+                                                               d["name"])})
+            if as_of:
+                codes[as_of] = chunk[as_of].to_numpy()
+            keys[d["name"]] = version_keys(codes, dimension, versions, as_of)
+        else:
+            keys[d["name"]] = builders[d["name"]].surrogate_keys(chunk[d["fk"]])
+    return encode_fact(chunk, spec["fact_cols"], dimensions, keys)
+
+
+def _stage(staging, spec, source_fp, written):
+    pipeline = StagingPipeline(staging)
+    pipeline.loaded("staging_raw", source_fp)
+    pipeline.view("staging_clean", "staging_raw", drop_nulls)
+    scaled = (spec["staging"] or {}).get("scaled_column")
+    if scaled:
+        pipeline.view("staging_transformed", "staging_clean", scaled_column, **scaled)
+    else:
+        pipeline.view("staging_transformed", "staging_clean", select_all)
+    return pipeline.run(force=written)
+
+
+def run_pipeline(csv_path, spec, warehouse_path=WAREHOUSE_PATH, staging_path=STAGING_PATH,
+                 chunk_rows=DEFAULT_CHUNK_ROWS, force=False, on_chunk=None):
+    """Stage and load `csv_path` into the warehouse at `warehouse_path` (staging skipped when `staging_path` is None).
+
+    Returns a dict with `skipped`, `rows`, `seconds`, `tables` (one load result
+    per table), `staging` (one result per stage) and `indexes`.
+    """
+    start = time.time()
+    spec = load_spec(spec)
+    columns = list(pd.read_csv(csv_path, nrows=0).columns)
+    validate_spec(spec, columns)
+    # Staging depends on the file only, the warehouse on the file and the spec
+    source_fp = fingerprint(csv_path)
+    fact_fp = _FINGERPRINT_PREFIX + hashlib.blake2b(
+        (source_fp + json.dumps(spec, sort_keys=True, default=str)).encode(), digest_size=20).hexdigest()
+
+    warehouse = get_manager(warehouse_path)
+    staging_manager = get_manager(staging_path) if staging_path else None
+    conn = warehouse.writer()
+    staging = staging_manager.writer() if staging_manager else None
+    try:
+        ensure_meta(conn)
+        write_fact = force or stored_fingerprint(conn, FACT_TABLE) != fact_fp
+        write_staging = staging is not None and (force or not StagingPipeline(staging).is_current("staging_raw",
+                                                                                                 source_fp))
+        result = {"skipped": not (write_fact or write_staging), "rows": 0, "tables": [], "staging": [],
+                  "indexes": 0}
+        if write_fact:
+            history = _history_pass(conn, csv_path, spec, chunk_rows, force) if any(
+                d["history"] for d in spec["dimensions"]) else {}
+            builders = {d["name"]: DimensionBuilder(d["columns"], d["pk"] if _sk(spec, d) else None)
+                        for d in spec["dimensions"] if d["name"] not in history}
+            subs = {d["name"]: DimensionBuilder(d["sub_dim"]["columns"]) for d in spec["dimensions"]
+                    if d["sub_dim"] and not set(d["sub_dim"]["columns"]) <= set(d["columns"])}
+            fact_writer = FactWriter(conn, spec["partition_column"])
+        if write_staging:
+            # Written here chunk by chunk, not by `load_table`: its fingerprint of an earlier frame would
+            # make the Staging page skip reloading that frame over this file's rows
+            ensure_meta(staging)
+            with staging:
+                staging.execute(f"DELETE FROM {META_TABLE} WHERE table_name = ?", ("staging_raw",))
+        for chunk in (read_chunks(csv_path, chunk_rows, on_chunk=on_chunk)
+                      if write_fact or write_staging else ()):
+            if write_staging:
+                bulk_load(staging, "staging_raw", chunk, append=result["rows"] > 0)
+            if write_fact:
+                for builder in list(builders.values()) + list(subs.values()):
+                    builder.update(chunk)
+                fact_writer.append(_encode(chunk, spec, builders, history))
+            result["rows"] += len(chunk)
+        if write_fact:
+            if not fact_writer.rows:
+                raise ValueError(f"{csv_path} has no rows.")
+            fact_writer.swap(fact_fp, time.time() - start)
+            result["tables"].append({"table": FACT_TABLE, "rows": fact_writer.rows, "skipped": False,
+                                     "appended": False, "seconds": time.time() - start,
+                                     "partitions": len(fact_writer.partition_rows)})
+            result["tables"] += _load_dimensions(conn, spec, builders, subs, history, force)
+            result["indexes"] = _finish(conn, spec)
+        if staging is not None:
+            result["staging"] = _stage(staging, spec, source_fp, write_staging)
+    finally:
+        warehouse.release()
+        if staging_manager:
+            staging_manager.release()
+    result["seconds"] = time.time() - start
+    return result
+
+
+def _load_dimensions(conn, spec, builders, subs, history, force):
+    results = []
+    for d in spec["dimensions"]:
+        if d["name"] in history:
+            _, table, result = history[d["name"]]
+            results.append(result)
+        else:
+            table = builders[d["name"]].table(d["name"] if _sk(spec, d) else None)
+            results.append(load_table(conn, d["name"], table, force=force, prepared=prepare_load(table)))
+        sub = d["sub_dim"]
+        if sub:
+            columns = list(sub["columns"])
+            # Built from the dimension when it holds every column (like `buildgraph.sub_dimension_source`)
+            source = subs[d["name"]].table() if d["name"] in subs else table
+            sub_table = source[columns].drop_duplicates()
+            results.append(load_table(conn, sub["name"], sub_table, force=force))
+    return results
+
+
+def _finish(conn, spec):
+    """Indexes, materialized views, `v_star` and a stale cube, as the ETL page refreshes them."""
+    dimensions = [{**d, "sk": _sk(spec, d), "history": d["history"] and bool(_sk(spec, d))}
+                  for d in spec["dimensions"]]
+    indexes, _, _ = index_star(conn, dimensions)
+    refresh_views(conn)
+    create_star_view(conn, dimensions)
+    config = cube_config(conn)
+    if config and config[1] and is_stale(conn):
+        build_cube(conn, *config)
+    return len(indexes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("csv", help="CSV file to load.")
+    parser.add_argument("--spec", required=True, help="Schema spec (JSON).")
+    parser.add_argument("--warehouse", default=WAREHOUSE_PATH)
+    parser.add_argument("--staging", default=STAGING_PATH, help="Staging database.")
+    parser.add_argument("--no-staging", action="store_true", help="Skip the staging tables.")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--force", action="store_true", help="Reload even if the file and spec are unchanged.")
+    args = parser.parse_args(argv)
+
+    def progress(rows, fraction):
+        print(f"  {rows:>12,} rows read ({fraction:.0%})", flush=True)
+
+    try:
+        result = run_pipeline(args.csv, args.spec, args.warehouse, None if args.no_staging else args.staging,
+                              args.chunk_rows, args.force, on_chunk=progress)
+    finally:
+        drop_manager(args.warehouse)
+        if not args.no_staging:
+            drop_manager(args.staging)
+    if result["skipped"]:
+        print(f"{args.csv} and the spec are unchanged since the last run; nothing to do.")
+        return
+    for r in result["tables"]:
+        status = "unchanged" if r["skipped"] else f"{r['rows']:,} rows"
+        print(f"{r['table']:<24} {status}")
+    for r in result["staging"]:
+        print(f"{r['stage']:<24} {r['status']}")
+    print(f"Loaded {result['rows']:,} rows in {result['seconds']:.1f} sec ({result['indexes']} indexes).")
+
+
+if __name__ == "__main__":
+    main()
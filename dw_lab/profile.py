@@ -0,0 +1,245 @@
+"""One-pass column profiling with bounded-memory sketches.
+
+`Profiler.update` is fed each chunk as it is ingested and keeps, per column:
+row and null counts, min/max, a HyperLogLog distinct-count estimate, a t-digest
+of numeric values (for quantiles) and a top-k frequent-values summary. Memory
+per column is fixed (about 16 KB of HLL registers, a few hundred centroids and
+`TOPK_CAPACITY` counters) regardless of the number of rows.
+"""
+import numpy as np
+import pandas as pd
+
+from dw_lab.ingest import CATEGORY_RATIO
+
+HLL_PRECISION = 14
+DIGEST_DELTA = 200
+TOP_K = 5
+# Counters kept per column; values that fall out of the top are folded into the error bound
+TOPK_CAPACITY = 200
+# Rows profiled at a time when a whole frame is profiled after loading
+PROFILE_CHUNK_ROWS = 100_000
+QUANTILES = (0.25, 0.5, 0.75, 0.99)
+
+
+class HyperLogLog:
+    """Distinct-count estimate from 2**p one-byte registers (standard error 1.04 / sqrt(2**p))."""
+
+    def __init__(self, p=HLL_PRECISION):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        """Add 64-bit hashes: the top `p` bits pick a register, the rest give the rank."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        # Rank = position of the first set bit in the next 32 bits (exact as float64)
+        rest = ((hashes << np.uint64(self.p)) >> np.uint64(32)).astype(np.float64)
+        rank = np.where(rest > 0, 32 - np.floor(np.log2(np.maximum(rest, 1))), 33).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * np.log(m / zeros)  # linear counting for small cardinalities
+        return raw
+
+    def relative_error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+
+class TDigest:
+    """Merging t-digest: values are merged into centroids whose size is bounded by the arcsine scale.
+
+    Centroids near the median may hold many values; centroids near the tails hold
+    few, so extreme quantiles stay accurate.
+    """
+
+    def __init__(self, delta=DIGEST_DELTA):
+        self.delta = delta
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, np.ones(len(values))]))
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        q_left = (np.cumsum(weights) - weights) / total
+        # Arcsine scale: one unit of k is one centroid, so at most ~delta/2 centroids
+        k = self.delta / (2 * np.pi) * np.arcsin(np.clip(2 * q_left - 1, -1, 1))
+        cluster = np.floor(k - k[0]).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, cluster[1:] != cluster[:-1]])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def quantile(self, q):
+        if not len(self.weights):
+            return None
+        cumulative = np.cumsum(self.weights)
+        centers = cumulative - self.weights / 2
+        x = np.concatenate([[0], centers, [cumulative[-1]]])
+        y = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q * cumulative[-1], x, y))
+
+
+class TopK:
+    """Approximate most frequent values: counts are lower bounds, exact when above `error`."""
+
+    def __init__(self, k=TOP_K, capacity=TOPK_CAPACITY):
+        self.k = k
+        self.capacity = capacity
+        self.counts = {}
+        self.error = 0
+
+    def update(self, values):
+        counts = values.value_counts(sort=True)
+        counts = counts[counts > 0]
+        if len(counts) > self.capacity:
+            self.error = max(self.error, int(counts.iloc[self.capacity]))
+            counts = counts.iloc[:self.capacity]
+        for value, count in counts.items():
+            self.counts[value] = self.counts.get(value, 0) + int(count)
+        if len(self.counts) > self.capacity:
+            ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+            self.error = max(self.error, ranked[self.capacity][1])
+            self.counts = dict(ranked[:self.capacity])
+
+    def top(self):
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:self.k]
+
+
+def _hashable(values):
+    """Normalize dtypes so a value hashes the same in every chunk (e.g. int8 vs int64, int vs float)."""
+    if pd.api.types.is_bool_dtype(values):
+        return values
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(np.float64)
+    return values
+
+
+class ColumnProfile:
+    def __init__(self, name):
+        self.name = name
+        self.dtype = None
+        self.rows = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.hll = HyperLogLog()
+        self.digest = None
+        self.topk = TopK()
+        self.textual = False
+
+    def update(self, s):
+        self.dtype = str(s.dtype)
+        categorical = isinstance(s.dtype, pd.CategoricalDtype)
+        self.textual = categorical or pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)
+        self.rows += len(s)
+        values = s.dropna()
+        self.nulls += len(s) - len(values)
+        if not len(values):
+            return
+        self.hll.add_hashes(pd.util.hash_pandas_object(_hashable(values), index=False).to_numpy())
+        self.topk.update(values)
+        numeric = pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)
+        if numeric:
+            if self.digest is None:
+                self.digest = TDigest()
+            self.digest.update(values.to_numpy(dtype=np.float64))
+        try:
+            # Unordered categoricals have no min/max of their own; compare the (few) distinct values
+            lo, hi = (min(values.unique()), max(values.unique())) if categorical else (values.min(), values.max())
+        except TypeError:  # mixed types or unordered values
+            return
+        self.min = lo if self.min is None else min(self.min, lo)
+        self.max = hi if self.max is None else max(self.max, hi)
+
+    def summary(self):
+        distinct = int(round(self.hll.estimate())) if self.rows > self.nulls else 0
+        top = self.topk.top()
+        non_null = self.rows - self.nulls
+        row = {
+            "column": self.name,
+            "dtype": self.dtype,
+            "rows": self.rows,
+            "nulls": self.nulls,
+            "null_pct": self.nulls / self.rows * 100 if self.rows else 0.0,
+            "distinct_est": min(distinct, non_null),
+            "min": None if self.min is None else str(self.min),
+            "max": None if self.max is None else str(self.max),
+        }
+        for q in QUANTILES:
+            row[f"p{int(q * 100)}"] = self.digest.quantile(q) if self.digest else None
+        row["top_values"] = ", ".join(f"{v} ({c:,})" for v, c in top)
+        # Unique and complete: the estimate is within the HLL error of the row count, and no value
+        # was seen twice (top-k counts are lower bounds, so any count above 1 is a real duplicate)
+        tolerance = 3 * self.hll.relative_error()
+        row["pk_candidate"] = bool(self.rows and not self.nulls and distinct >= self.rows * (1 - tolerance)
+                                   and (not top or top[0][1] <= 1))
+        row["suggest_category"] = bool(self.textual and non_null and distinct / non_null <= CATEGORY_RATIO)
+        return row
+
+
+class Profiler:
+    """Profiles a dataset chunk by chunk in one pass."""
+
+    def __init__(self):
+        self.columns = {}
+
+    def update(self, chunk):
+        for col in chunk.columns:
+            if col not in self.columns:
+                self.columns[col] = ColumnProfile(col)
+            self.columns[col].update(chunk[col])
+
+    def summary(self):
+        return pd.DataFrame([p.summary() for p in self.columns.values()])
+
+
+def profile_frame(df, chunk_rows=PROFILE_CHUNK_ROWS):
+    """Profile an already-loaded frame in slices (same sketches as during ingestion)."""
+    profiler = Profiler()
+    for start in range(0, len(df), chunk_rows):
+        profiler.update(df.iloc[start:start + chunk_rows])
+    return profiler.summary()
+
+
+def pk_candidates(profile, columns=None):
+    """Columns the profile marks as unique and non-null, optionally restricted to `columns`."""
+    if profile is None or profile.empty:
+        return []
+    found = profile.loc[profile["pk_candidate"], "column"].tolist()
+    return [c for c in found if columns is None or c in columns]
+
+
+def category_suggestions(profile):
+    if profile is None or profile.empty:
+        return []
+    return profile.loc[profile["suggest_category"] & (profile["dtype"] != "category"), "column"].tolist()
+
+
+def key_column(profile, columns):
+    """The column of `columns` most likely to identify rows: fewest nulls, then most distinct values."""
+    if profile is None or profile.empty or not columns:
+        return None
+    known = profile[profile["column"].isin(columns)]
+    if known.empty:
+        return None
+    return known.sort_values(["nulls", "distinct_est"], ascending=[True, False])["column"].iloc[0]
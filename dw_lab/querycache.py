@@ -0,0 +1,167 @@
+"""Query result cache keyed on normalized SQL and the warehouse version.
+
+ETL bumps the warehouse version (`etl.bump_version`) whenever a table or
+materialized view changes, so cached results never outlive the data they were
+computed from. Entries are evicted least-recently-used under a byte budget.
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from dw_lab.etl import bump_version, warehouse_version
+
+DEFAULT_MAX_MB = 256
+
+_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|\s+|[^'\"\s/-]+|.", re.S)
+# Authorizer actions a statement that only reads needs when it is compiled
+_READ_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and drop comments outside string literals; strip a trailing `;`."""
+    parts = []
+    for token in _TOKEN.findall(sql):
+        if token.isspace() or token.startswith(("--", "/*")):
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        else:
+            parts.append(token)
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def is_read_only(conn, sql):
+    """True unless compiling `sql` on `conn` asks the authorizer for anything but reads (e.g. `WITH ... DELETE`).
+
+    A statement that does not compile for another reason cannot write either,
+    and counts as read-only so it fails on a reader.
+    """
+    denied = []
+
+    def authorizer(action, arg1, arg2, db_name, source):
+        if action in _READ_ACTIONS:
+            return sqlite3.SQLITE_OK
+        denied.append(action)
+        return sqlite3.SQLITE_DENY
+
+    conn.set_authorizer(authorizer)
+    try:
+        conn.execute(f"EXPLAIN {sql}").fetchall()
+    except sqlite3.Error:
+        return not denied
+    finally:
+        conn.set_authorizer(None)
+    return True
+
+
+def database_id(conn):
+    """Identify the main database file, so caches shared across connections don't mix warehouses."""
+    return conn.execute("PRAGMA database_list").fetchone()[2] or f"memory:{id(conn)}"
+
+
+class QueryCache:
+    """Thread-safe LRU cache of query results (DataFrames) with a byte budget.
+
+    Cached frames are shared between callers and must not be modified in place.
+    """
+
+    def __init__(self, max_mb=DEFAULT_MAX_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def read_sql(self, conn, sql, backend=None):
+        """Return `(df, hit, seconds, engine)` for `sql`, executing it only on a miss.
+
+        Read-only statements run on `backend` (a `backends.StorageBackend`) when
+        given; `conn` is the SQLite warehouse that versions the results. Should
+        the backend fail (e.g. SQL it does not support), the statement runs on
+        `conn` instead. `engine` names the one that answered.
+        """
+        start = time.time()
+        if not is_read_only(conn, sql):
+            # Statements that may write are never cached, and invalidate everything cached so far
+            try:
+                return pd.read_sql_query(sql, conn), False, time.time() - start, "sqlite"
+            finally:
+                bump_version(conn)
+
+        if backend is not None:
+            key = self.key(conn, sql, backend.name)
+            df = self.get(key)
+            if df is not None:
+                return df, True, time.time() - start, backend.name
+            try:
+                df = backend.read_sql(sql)
+            except Exception:
+                pass
+            else:
+                self.put(key, df)
+                return df, False, time.time() - start, backend.name
+
+        key = self.key(conn, sql)
+        df = self.get(key)
+        if df is None:
+            df = pd.read_sql_query(sql, conn)
+            self.put(key, df)
+            return df, False, time.time() - start, "sqlite"
+        return df, True, time.time() - start, "sqlite"
+
+    def key(self, conn, sql, *extra):
+        """Cache key for `sql` against the warehouse's current version; `extra` distinguishes variants."""
+        return (database_id(conn), warehouse_version(conn), normalize_sql(sql)) + extra
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (df, size)
+            self.bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def resize(self, max_mb):
+        with self._lock:
+            self.max_bytes = int(max_mb * 1024 * 1024)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
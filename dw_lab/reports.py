@@ -0,0 +1,111 @@
+"""Warehouse-side helpers for the Reports dashboard.
+
+Filter options, date bounds and every chart's data are computed inside
+`dw_lab.db` (through the aggregate navigator where possible), so only small
+aggregated results reach the page and the browser.
+
+Time series are bucketed server-side at a granularity picked from the date
+range and the chart width, and capped at `MAX_POINTS` with LTTB downsampling.
+"""
+import numpy as np
+import pandas as pd
+
+from dw_lab.bulkload import quote
+from dw_lab.cube import STAR_VIEW, TIME_BUCKETS, answer
+
+GRANULARITIES = ("day", "week", "month", "quarter")
+BUCKET_DAYS = {"day": 1, "week": 7, "month": 30.44, "quarter": 91.31}
+MAX_POINTS = 500
+PX_PER_POINT = 4
+_PERIODS = {"day": "D", "week": "W-SUN", "month": "M", "quarter": "Q"}
+
+
+def star_columns(conn):
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({STAR_VIEW})")]
+
+
+def distinct_values(conn, column, filters=None):
+    """Distinct non-null values of `column` with their row counts among rows matching `filters`.
+
+    Answered from the cube if possible.
+    """
+    counts, _ = answer(conn, [column], None, "count", filters)
+    counts = counts[counts[column].notna()]
+    return counts.rename(columns={"_rows": "rows"}).reset_index(drop=True)
+
+
+def value_range(conn, column):
+    """`(min, max)` of `column` over the whole star view."""
+    return conn.execute(f"SELECT MIN({quote(column)}), MAX({quote(column)}) FROM {STAR_VIEW}").fetchone()
+
+
+class WarehouseReport:
+    """Runs the dashboard's aggregations with one shared set of filters, recording which tables served them."""
+
+    def __init__(self, conn, measure="Amount"):
+        self.conn = conn
+        self.measure = measure
+        self.filters = {}
+        self.sources = set()
+
+    def aggregate(self, group_by, agg="sum", buckets=None):
+        df, source = answer(self.conn, list(group_by), self.measure, agg, filters=self.filters, buckets=buckets)
+        self.sources.add(source)
+        return df
+
+
+def point_budget(width_px, px_per_point=PX_PER_POINT, max_points=MAX_POINTS):
+    """How many points a chart `width_px` wide can usefully show, capped at `max_points`."""
+    return max(2, min(max_points, int(width_px) // px_per_point))
+
+
+def choose_granularity(start, end, max_points):
+    """Finest granularity whose bucket count over `[start, end]` fits in `max_points`."""
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    for granularity in GRANULARITIES:
+        if days / BUCKET_DAYS[granularity] <= max_points:
+            return granularity
+    return GRANULARITIES[-1]
+
+
+def bucket_series(dates, granularity):
+    """Pandas equivalent of `cube.TIME_BUCKETS`: each date truncated to the start of its bucket."""
+    if granularity not in TIME_BUCKETS:
+        raise ValueError(f"Unsupported granularity: {granularity}")
+    return pd.to_datetime(dates).dt.to_period(_PERIODS[granularity]).dt.start_time
+
+
+def lttb(x, y, threshold):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    `x` must be sorted and numeric. The first and last points are always kept;
+    from each of the `threshold - 2` buckets in between, the point forming the
+    largest triangle with the previously kept point and the next bucket's mean.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def downsample(df, x, y, max_points):
+    """`df` sorted by `x` and reduced to at most `max_points` rows with LTTB (NaN `y` rows dropped)."""
+    df = df.dropna(subset=[y]).sort_values(x)
+    if len(df) <= max_points:
+        return df.reset_index(drop=True)
+    xs = pd.to_datetime(df[x]).to_numpy("datetime64[ns]").astype(np.int64)
+    return df.iloc[lttb(xs, df[y].to_numpy(), max_points)].reset_index(drop=True)
@@ -0,0 +1,175 @@
+"""Slowly changing dimensions, Type 2: dimension tables that keep attribute history.
+
+A history dimension stores one row per *version* of each natural key. The
+surrogate key `<name>_sk` identifies a version (so the fact table's keys and the
+star view's joins work unchanged). Every version also has `row_hash` (hash of
+the natural key and attributes), `valid_from` / `valid_to` (open versions end at
+`OPEN_END`) and `is_current`.
+
+On each load the incoming rows are hashed and compared with the current
+versions in one vectorized pass. Unchanged keys are not touched; for a changed
+key the current version is closed and a new one inserted; keys missing from the
+input have their current version closed (should such a key come back, its new
+version starts at that load). The fact table's surrogate keys are then mapped
+to versions, either the current one or the one valid at each fact row's date
+(point in time).
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from dw_lab.bulkload import bulk_load, datetime_text, quote
+from dw_lab.etl import META_TABLE, bump_version, ensure_meta, prepare_load, row_hashes, stored_meta, table_exists
+from dw_lab.indexes import create_index, index_name
+from dw_lab.keys import UNKNOWN_SK
+
+HISTORY_COLUMNS = ("row_hash", "valid_from", "valid_to", "is_current")
+# The first version of every key is valid from the start, so facts dated before the first load still match it
+EARLIEST = "1900-01-01 00:00:00"
+OPEN_END = "9999-12-31 23:59:59"
+_FINGERPRINT_PREFIX = "scd2:"
+
+
+def is_history(dimension):
+    return bool(dimension.get('history') and dimension.get('sk') and dimension.get('pk'))
+
+
+def _keys(values):
+    """Natural-key values as stored in SQLite, so frame keys and table keys compare equal."""
+    s = pd.Series(values)
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype(s.dtype.categories.dtype)
+    if pd.api.types.is_datetime64_any_dtype(s.dtype):
+        return datetime_text(s)
+    if pd.api.types.is_bool_dtype(s.dtype) or pd.api.types.is_integer_dtype(s.dtype):
+        return s.to_numpy(np.int64)
+    if pd.api.types.is_float_dtype(s.dtype):
+        return s.to_numpy(np.float64)
+    return s.astype(str).to_numpy(object)
+
+
+def history_table(conn, name):
+    return pd.read_sql_query(f"SELECT * FROM {quote(name)}", conn)
+
+
+def point_in_time_sql(name):
+    """`SELECT` of the versions of `name` valid at the bound timestamp `:as_of`."""
+    return (f"SELECT * FROM {quote(name)} "
+            f"WHERE valid_from <= :as_of AND :as_of < valid_to")
+
+
+def index_history(conn, name, pk):
+    """One current version per key (partial UNIQUE index) and `(pk, valid_from, valid_to)` for as-of lookups."""
+    current = index_name(name, [pk, "current"])
+    with conn:
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {quote(current)} "
+                     f"ON {quote(name)} ({quote(pk)}) WHERE is_current = 1")
+    create_index(conn, name, [pk, "valid_from", "valid_to"])
+
+
+def _versions(df, sk, first_sk, hashes, valid_from):
+    out = df.copy()
+    out[sk] = np.arange(first_sk, first_sk + len(df), dtype=np.int64)
+    out["row_hash"] = hashes
+    out["valid_from"] = valid_from
+    out["valid_to"] = OPEN_END
+    out["is_current"] = 1
+    return out
+
+
+def merge_history(conn, name, df, pk, sk, force=False, prepared=None, now=None, writer=bulk_load):
+    """Apply dimension rows `df` (one per natural key `pk`) to history table `name`.
+
+    Returns the `etl.load_table` result dict plus `new`, `changed`, `expired`,
+    `unchanged` and `versions` (rows in the table afterwards).
+    """
+    start = time.time()
+    ensure_meta(conn)
+    now = now or time.strftime("%Y-%m-%d %H:%M:%S")
+    fp = _FINGERPRINT_PREFIX + (prepared or prepare_load(df))["fingerprint"]
+    df = df.drop_duplicates(subset=[pk]).reset_index(drop=True)
+    attributes = [c for c in df.columns if c != sk]
+    # Hash normalized values, so a column downcast differently on another load is not a change
+    hashes = row_hashes(pd.DataFrame({c: _keys(df[c]) for c in attributes})).view(np.int64)
+    expected = list(df.columns) + list(HISTORY_COLUMNS)
+    stored = ([r[1] for r in conn.execute(f"PRAGMA table_info({quote(name)})")]
+              if table_exists(conn, name) else [])
+    prev = stored_meta(conn, name) if sorted(stored) == sorted(expected) else None
+    counts = {"new": 0, "changed": 0, "expired": 0, "unchanged": 0}
+
+    if prev and not force and prev["fingerprint"] == fp:
+        versions = conn.execute(f"SELECT COUNT(*) FROM {quote(name)}").fetchone()[0]
+        return {"table": name, "rows": len(df), "skipped": True, "appended": False, "seconds": time.time() - start,
+                "rows_per_sec": None, **counts, "unchanged": len(df), "versions": versions}
+
+    if prev is None:
+        # First load, or the dimension's columns changed: start the history over
+        writer(conn, name, _versions(df, sk, 1, hashes, EARLIEST))
+        counts["new"] = written = len(df)
+    else:
+        current = pd.read_sql_query(
+            f"SELECT {quote(pk)}, {quote(sk)}, row_hash FROM {quote(name)} WHERE is_current = 1", conn)
+        incoming_keys, current_keys = _keys(df[pk]), _keys(current[pk])
+        position = pd.Index(current_keys).get_indexer(incoming_keys)
+        new = position < 0
+        changed = ~new & (np.append(current["row_hash"].to_numpy(), 0)[position] != hashes)
+        gone = pd.Index(incoming_keys).get_indexer(current_keys) < 0
+        expire = np.concatenate([current[sk].to_numpy()[position[changed]], current[sk].to_numpy()[gone]])
+        rows = new | changed
+        next_sk = (conn.execute(f"SELECT MAX({quote(sk)}) FROM {quote(name)}").fetchone()[0] or 0) + 1
+        # A key seen for the first time is valid from the start, like the keys of the first load; a key
+        # that was expired and comes back starts now, after its closed versions
+        known = _keys(pd.read_sql_query(f"SELECT DISTINCT {quote(pk)} FROM {quote(name)}", conn)[pk])
+        first_seen = new & (pd.Index(known).get_indexer(incoming_keys) < 0)
+        inserts = _versions(df[rows], sk, next_sk, hashes[rows], np.where(first_seen[rows], EARLIEST, now))[stored]
+
+        def close_versions(c):
+            c.executemany(f"UPDATE {quote(name)} SET valid_to = ?, is_current = 0 WHERE {quote(sk)} = ?",
+                          [(now, int(key)) for key in expire])
+
+        # Closing the old versions and inserting the new ones is a single transaction
+        writer(conn, name, inserts, append=True, before=close_versions)
+        counts.update(new=int(new.sum()), changed=int(changed.sum()), expired=int(gone.sum()),
+                      unchanged=int(len(df) - new.sum() - changed.sum()))
+        written = len(inserts) + len(expire)
+
+    index_history(conn, name, pk)
+    seconds = time.time() - start
+    versions = conn.execute(f"SELECT COUNT(*) FROM {quote(name)}").fetchone()[0]
+    with conn:
+        conn.execute(f"INSERT OR REPLACE INTO {META_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+                     (name, fp, versions, time.time(), seconds, None))
+    bump_version(conn)
+    return {"table": name, "rows": len(df), "skipped": False, "appended": prev is not None,
+            "seconds": seconds, "rows_per_sec": written / seconds if seconds else None,
+            **counts, "versions": versions}
+
+
+def version_keys(fact, dimension, versions, as_of=None):
+    """The fact's `<name>_sk` column mapped to history-table version keys.
+
+    `fact[sk]` holds the keys `keys.build_star` assigned to `dimension['table']`.
+    Each row gets the current version of its natural key or, when `as_of` (a
+    fact column of dates) is given, the version valid at that date.
+    """
+    sk, pk = dimension['sk'], dimension['pk']
+    codes = fact[sk].to_numpy().astype(np.int64)
+    known = codes != UNKNOWN_SK
+    natural = _keys(dimension['table'][pk].to_numpy()[codes[known] - 1])
+    out = np.full(len(fact), UNKNOWN_SK, dtype=np.int64)
+    keys = _keys(versions[pk])
+    if as_of is None:
+        current = versions["is_current"].to_numpy() == 1
+        position = pd.Index(keys[current]).get_indexer(natural)
+        out[known] = np.where(position >= 0, versions[sk].to_numpy()[current][position], UNKNOWN_SK)
+    else:
+        # Undated rows take the latest version
+        dates = pd.to_datetime(fact[as_of], errors="coerce").to_numpy()[known]
+        left = pd.DataFrame({"key": natural, "at": np.where(pd.isna(dates), np.datetime64("2262-01-01"), dates),
+                             "row": np.arange(len(natural))}).sort_values("at")
+        right = pd.DataFrame({"key": keys, "sk": versions[sk].to_numpy(),
+                              "at": pd.to_datetime(versions["valid_from"])}).sort_values("at")
+        matched = pd.merge_asof(left, right, on="at", by="key", direction="backward").sort_values("row")
+        out[known] = matched["sk"].fillna(UNKNOWN_SK).to_numpy(np.int64)
+    return out.astype(fact[sk].dtype)
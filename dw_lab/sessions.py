@@ -0,0 +1,89 @@
+"""Per-session warehouse files with TTL-based garbage collection.
+
+Each browser session gets its own directory under `.dw_sessions/` holding its
+warehouse and staging databases, so one user's ETL never rewrites tables
+another user is reading. A session directory is removed once neither its files
+nor its connection managers have been used for `SESSION_TTL` seconds.
+"""
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from dw_lab.backends import drop_backends
+from dw_lab.connections import STAGING_PATH, WAREHOUSE_PATH, drop_manager, find_manager
+
+SESSIONS_DIR = ".dw_sessions"
+SESSION_TTL = 2 * 3600
+# Garbage collection runs at most this often per process
+GC_INTERVAL = 300
+
+_gc_lock = threading.Lock()
+_last_gc = 0.0
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def session_dir(session_id, sessions_dir=SESSIONS_DIR):
+    return os.path.join(sessions_dir, session_id)
+
+
+def session_path(session_id, filename=WAREHOUSE_PATH, sessions_dir=SESSIONS_DIR):
+    """Path of `filename` (e.g. the warehouse or staging database) inside the session's directory."""
+    directory = session_dir(session_id, sessions_dir)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+def last_used(directory):
+    """Latest use of a session: file modification times and in-process connection activity."""
+    latest = os.path.getmtime(directory)
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        latest = max(latest, os.path.getmtime(path))
+        manager = find_manager(path)
+        if manager is not None:
+            latest = max(latest, manager.last_used)
+    return latest
+
+
+def _in_use(directory):
+    for name in (WAREHOUSE_PATH, STAGING_PATH):
+        manager = find_manager(os.path.join(directory, name))
+        if manager is not None and manager.busy():
+            return True
+    return False
+
+
+def collect_garbage(ttl=SESSION_TTL, sessions_dir=SESSIONS_DIR, now=None):
+    """Delete session directories idle for longer than `ttl` seconds. Returns the removed session ids."""
+    now = time.time() if now is None else now
+    removed = []
+    if not os.path.isdir(sessions_dir):
+        return removed
+    for session_id in os.listdir(sessions_dir):
+        directory = session_dir(session_id, sessions_dir)
+        try:
+            if now - last_used(directory) <= ttl or _in_use(directory):
+                continue
+        except FileNotFoundError:
+            continue
+        for name in os.listdir(directory):
+            drop_manager(os.path.join(directory, name))
+        drop_backends(directory)
+        shutil.rmtree(directory, ignore_errors=True)
+        removed.append(session_id)
+    return removed
+
+
+def maybe_collect_garbage(ttl=SESSION_TTL, sessions_dir=SESSIONS_DIR, interval=GC_INTERVAL):
+    """`collect_garbage`, throttled to once per `interval` seconds per process."""
+    global _last_gc
+    with _gc_lock:
+        if time.time() - _last_gc < interval:
+            return []
+        _last_gc = time.time()
+    return collect_garbage(ttl, sessions_dir)
@@ -0,0 +1,127 @@
+"""Declarative staging pipeline: a DAG of memoized stages.
+
+The first stage materializes the uploaded frame as a table. Every later stage
+is a pure row filter or derived-column step over its upstream stage and is
+created as a SQL view, so nothing is copied and rows are computed only when
+read. Each stage has a key hashing its definition, its parameters and its
+upstream stage's key. A stage is rebuilt only when its key differs from the
+one recorded in `_staging_stages`, so a parameter change touches just that
+stage and the stages below it.
+"""
+import hashlib
+import json
+import time
+
+from dw_lab.bulkload import quote
+from dw_lab.etl import load_table, prepare_load
+
+REGISTRY_TABLE = "_staging_stages"
+
+
+def ensure_registry(conn):
+    conn.execute(
+        f"""CREATE TABLE IF NOT EXISTS {REGISTRY_TABLE} (
+            name     TEXT PRIMARY KEY,
+            kind     TEXT NOT NULL,
+            key      TEXT NOT NULL,
+            built_at REAL NOT NULL,
+            seconds  REAL NOT NULL
+        )"""
+    )
+
+
+def _key(*parts):
+    return hashlib.blake2b(json.dumps(parts, default=str).encode(), digest_size=16).hexdigest()
+
+
+def select_all(upstream, columns):
+    return f"SELECT * FROM {quote(upstream)}"
+
+
+def drop_nulls(upstream, columns):
+    """Rows without any NULL (the SQL form of `DataFrame.dropna()`)."""
+    where = " AND ".join(f"{quote(c)} IS NOT NULL" for c in columns) or "1"
+    return f"SELECT * FROM {quote(upstream)} WHERE {where}"
+
+
+def scaled_column(upstream, columns, source, target, factor):
+    """All columns plus `target = source * factor`."""
+    return f"SELECT *, {quote(source)} * {float(factor)!r} AS {quote(target)} FROM {quote(upstream)}"
+
+
+class StagingPipeline:
+    """Stages are declared in dependency order with `table` and `view`, then built with `run`.
+
+    `run` may be called after each declaration; stages it already handled are not checked again.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.stages = []
+        self.keys = {}
+
+    def table(self, name, df, prepared=None):
+        """Source stage: `df` materialized as table `name`. `prepared` is `etl.prepare_load(df)` if known."""
+        prepared = prepared or prepare_load(df)
+        self.stages.append({"name": name, "kind": "table", "df": df, "prepared": prepared})
+
+    def loaded(self, name, fingerprint):
+        """Source stage `name` the caller already wrote (e.g. in chunks), whose content hashes to `fingerprint`."""
+        self.stages.append({"name": name, "kind": "table", "df": None, "prepared": {"fingerprint": fingerprint}})
+
+    def is_current(self, name, fingerprint):
+        """True when source stage `name` was last built from content hashing to `fingerprint`."""
+        ensure_registry(self.conn)
+        return self._stored_key(name) == _key("table", fingerprint)
+
+    def view(self, name, upstream, build_sql, **params):
+        """Stage `name` as a view defined by `build_sql(upstream, upstream_columns, **params)`."""
+        self.stages.append({"name": name, "kind": "view", "upstream": upstream,
+                            "build_sql": build_sql, "params": params})
+
+    def columns(self, name):
+        return [r[1] for r in self.conn.execute(f"PRAGMA table_info({quote(name)})")]
+
+    def _stored_key(self, name):
+        row = self.conn.execute(f"SELECT key FROM {REGISTRY_TABLE} WHERE name = ?", (name,)).fetchone()
+        exists = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+        return row[0] if row and exists else None
+
+    def run(self, force=False):
+        """Build every new stage whose key changed. Returns one `{stage, kind, status, seconds}` per new stage."""
+        ensure_registry(self.conn)
+        results = []
+        keys = self.keys
+        for s in self.stages:
+            if s["name"] in keys:
+                continue
+            start = time.time()
+            # Upstream stages are already built, so a view's SQL can list their columns
+            if s["kind"] == "table":
+                keys[s["name"]] = _key("table", s["prepared"]["fingerprint"])
+            else:
+                s["sql"] = s["build_sql"](s["upstream"], self.columns(s["upstream"]), **s["params"])
+                keys[s["name"]] = _key("view", s["sql"], keys[s["upstream"]])
+            if not force and self._stored_key(s["name"]) == keys[s["name"]]:
+                results.append({"stage": s["name"], "kind": s["kind"], "status": "cached",
+                                "seconds": time.time() - start})
+                continue
+            if s["kind"] == "table":
+                if s["df"] is not None:
+                    load_table(self.conn, s["name"], s["df"], force=force, prepared=s["prepared"])
+            else:
+                old = self.conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (s["name"],)).fetchone()
+                with self.conn:
+                    if old:
+                        # Earlier versions of the page stored every stage as a table
+                        self.conn.execute(f"DROP {old[0].upper()} {quote(s['name'])}")
+                    self.conn.execute(f"CREATE VIEW {quote(s['name'])} AS {s['sql']}")
+            seconds = time.time() - start
+            with self.conn:
+                self.conn.execute(f"INSERT OR REPLACE INTO {REGISTRY_TABLE} VALUES (?, ?, ?, ?, ?)",
+                                  (s["name"], s["kind"], keys[s["name"]], time.time(), seconds))
+            results.append({"stage": s["name"], "kind": s["kind"], "status": "built", "seconds": seconds})
+        return results
+
+    def rows(self, name):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {quote(name)}").fetchone()[0]
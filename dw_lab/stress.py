@@ -0,0 +1,118 @@
+"""Stress harness: N simulated sessions loading and reading warehouses concurrently.
+
+Each session repeatedly loads its own fact table through the connection
+manager's writer, then reads it back through a pooled reader and checks that it
+sees exactly what it loaded. With per-session warehouses every read should
+match. With `--shared`, all sessions write the same file, so reads of another
+session's data and waits for the single writer show up in the report.
+
+    python -m dw_lab.stress --sessions 8 --seconds 10 [--shared]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from dw_lab.connections import WAREHOUSE_PATH, drop_manager, get_manager
+from dw_lab.etl import load_table
+from dw_lab.sessions import new_session_id, session_path
+
+READS_PER_LOAD = 5
+
+
+def _simulate(index, path, rows, deadline, results):
+    manager = get_manager(path)
+    rng = np.random.default_rng(index)
+    stats = {"session": index, "loads": 0, "reads": 0, "foreign_reads": 0, "errors": 0}
+    load_seconds, read_seconds = [], []
+    while time.time() < deadline:
+        df = pd.DataFrame({"OrderID": np.arange(rows), "Session": index,
+                           "Amount": rng.integers(1, 100, rows)})
+        expected = (rows, int(df["Amount"].sum()))
+        try:
+            start = time.perf_counter()
+            load_table(manager.writer(), "fact_table", df)
+            load_seconds.append(time.perf_counter() - start)
+            stats["loads"] += 1
+        except sqlite3.Error:
+            stats["errors"] += 1
+            continue
+        finally:
+            manager.release()
+        for _ in range(READS_PER_LOAD):
+            try:
+                start = time.perf_counter()
+                got = manager.reader().execute("SELECT COUNT(*), SUM(Amount) FROM fact_table").fetchone()
+                read_seconds.append(time.perf_counter() - start)
+                stats["reads"] += 1
+                stats["foreign_reads"] += got != expected
+            except sqlite3.Error:
+                stats["errors"] += 1
+            finally:
+                manager.release()
+    stats["load_p95_ms"] = np.percentile(load_seconds, 95) * 1000 if load_seconds else None
+    stats["read_p50_ms"] = np.percentile(read_seconds, 50) * 1000 if read_seconds else None
+    stats["read_p95_ms"] = np.percentile(read_seconds, 95) * 1000 if read_seconds else None
+    results[index] = stats
+
+
+def run_stress(sessions=8, rows=10_000, seconds=10.0, shared=False, workdir=None):
+    """Run `sessions` simulated sessions for `seconds`. Returns `(per_session_df, wait_stats)`.
+
+    Per-session warehouses are created in a temporary directory (or `workdir`)
+    and removed afterwards.
+    """
+    root = workdir or tempfile.mkdtemp(prefix="dw_stress_")
+    if shared:
+        paths = [os.path.join(root, WAREHOUSE_PATH)] * sessions
+    else:
+        paths = [session_path(new_session_id(), WAREHOUSE_PATH, sessions_dir=root) for _ in range(sessions)]
+    results = {}
+    deadline = time.time() + seconds
+    threads = [threading.Thread(target=_simulate, args=(i, path, rows, deadline, results))
+               for i, path in enumerate(paths)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        waits = {"writer_waits": 0, "writer_wait_seconds": 0.0, "reader_waits": 0, "reader_wait_seconds": 0.0}
+        for path in set(paths):
+            pool = get_manager(path).stats()
+            for k in waits:
+                waits[k] += pool[k]
+    finally:
+        for path in set(paths):
+            drop_manager(path)
+        if workdir is None:
+            shutil.rmtree(root, ignore_errors=True)
+    return pd.DataFrame([results[i] for i in sorted(results)]), waits
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--shared", action="store_true", help="All sessions use one warehouse file.")
+    args = parser.parse_args(argv)
+
+    per_session, waits = run_stress(args.sessions, args.rows, args.seconds, args.shared)
+    print(per_session.to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+    totals = per_session[["loads", "reads", "foreign_reads", "errors"]].sum()
+    print(f"\n{'shared warehouse' if args.shared else 'per-session warehouses'}: "
+          f"{totals['loads']:,} loads, {totals['reads']:,} reads, "
+          f"{totals['foreign_reads']:,} reads of another session's data, {totals['errors']:,} errors")
+    print(f"writer waits: {waits['writer_waits']:,} ({waits['writer_wait_seconds']:.2f} sec), "
+          f"reader waits: {waits['reader_waits']:,} ({waits['reader_wait_seconds']:.2f} sec)")
+    return 1 if not args.shared and (totals["foreign_reads"] or totals["errors"]) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
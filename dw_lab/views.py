@@ -0,0 +1,260 @@
+"""Materialized views with a registry, full refresh and incremental refresh.
+
+Every view is a real table plus a row in `_mv_registry` that records its
+defining SELECT, the tables it reads and their fingerprints at the last
+refresh. After ETL, views whose sources are unchanged are skipped. When the
+only change is rows appended to one source (see `etl.load_table`) and the view
+is a SUM/COUNT/MIN/MAX aggregate, the view is refreshed by aggregating just the
+appended rows and merging them into the existing result.
+"""
+import json
+import re
+import sqlite3
+import time
+
+import pandas as pd
+
+from dw_lab.bulkload import quote
+from dw_lab.etl import bump_version, stored_meta
+
+REGISTRY_TABLE = "_mv_registry"
+
+_CREATE_PREFIX = re.compile(r"^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?\S+\s+AS\s+", re.I)
+_AGGREGATE = re.compile(r"^(SUM|COUNT|MIN|MAX)\s*\((.*)\)(?:\s+(?:AS\s+)?\S+)?$", re.I | re.S)
+_AGGREGATE_CALL = re.compile(r"\b(SUM|COUNT|MIN|MAX|AVG|TOTAL|GROUP_CONCAT)\s*\(", re.I)
+_NOT_MERGEABLE = re.compile(r"\b(DISTINCT|HAVING|LIMIT|UNION|INTERSECT|EXCEPT|OVER|ORDER\s+BY)\b", re.I)
+# How each aggregate's partial results combine
+_MERGE = {"SUM": "SUM", "COUNT": "SUM", "MIN": "MIN", "MAX": "MAX"}
+
+
+def ensure_registry(conn):
+    conn.execute(
+        f"""CREATE TABLE IF NOT EXISTS {REGISTRY_TABLE} (
+            name         TEXT PRIMARY KEY,
+            sql          TEXT NOT NULL,
+            sources      TEXT NOT NULL,
+            refreshed_at REAL,
+            last_mode    TEXT,
+            seconds      REAL
+        )"""
+    )
+
+
+def has_registry(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (REGISTRY_TABLE,)
+    ).fetchone() is not None
+
+
+def strip_create(sql):
+    """Accept either a bare SELECT or the old `CREATE TABLE x AS SELECT ...` form."""
+    return _CREATE_PREFIX.sub("", sql.strip().rstrip(";"))
+
+
+def source_tables(conn, select_sql):
+    """Tables read by `select_sql`, found by compiling it under an authorizer."""
+    tables = set()
+
+    def authorizer(action, arg1, arg2, db_name, source):
+        if action == sqlite3.SQLITE_READ and arg1 and not arg1.startswith("sqlite_"):
+            tables.add(arg1)
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorizer)
+    try:
+        conn.execute(f"EXPLAIN {select_sql}").fetchall()
+    finally:
+        conn.set_authorizer(None)
+    return sorted(tables)
+
+
+def source_state(conn, tables):
+    """Fingerprint and row count per source table (ETL fingerprint when available)."""
+    state = {}
+    for table in tables:
+        meta = stored_meta(conn, table)
+        if meta:
+            state[table] = {"fingerprint": meta["fingerprint"], "rows": meta["rows"],
+                            "append_from": meta["append_from"]}
+        else:
+            rows, max_rowid = conn.execute(f"SELECT COUNT(*), MAX(rowid) FROM {quote(table)}").fetchone()
+            state[table] = {"fingerprint": f"rows:{rows}:{max_rowid}", "rows": rows, "append_from": None}
+    return state
+
+
+def _split_select_list(select_sql):
+    """Top-level items between SELECT and FROM, or None if the query can't be split."""
+    match = re.match(r"^\s*SELECT\s+", select_sql, re.I)
+    if not match:
+        return None
+    items, depth, start, i = [], 0, match.end(), match.end()
+    text = select_sql
+    while i < len(text):
+        ch = text[i]
+        if ch in "'\"":
+            end = text.find(ch, i + 1)
+            if end < 0:
+                return None
+            i = end + 1
+            continue
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif depth == 0 and ch == ",":
+            items.append(text[start:i].strip())
+            start = i + 1
+        elif depth == 0 and re.match(r"\bFROM\b", text[i:i + 5], re.I) and re.match(r"\s", text[i - 1]):
+            items.append(text[start:i].strip())
+            return items
+        i += 1
+    return None
+
+
+def _balanced(text):
+    depth = 0
+    for ch in text:
+        depth += {"(": 1, ")": -1}.get(ch, 0)
+        if depth < 0:
+            return False
+    return depth == 0
+
+
+def aggregate_plan(select_sql):
+    """Per output column, the merge function for its aggregate (None for group keys).
+
+    Returns None when the view can't be maintained incrementally.
+    """
+    if _NOT_MERGEABLE.search(select_sql):
+        return None
+    items = _split_select_list(select_sql)
+    if not items or any(item.endswith("*") for item in items):
+        return None
+    plan = []
+    for item in items:
+        match = _AGGREGATE.match(item)
+        if match and _balanced(match.group(2)):
+            plan.append(_MERGE[match.group(1).upper()])
+        elif _AGGREGATE_CALL.search(item):
+            return None  # e.g. AVG(x) or SUM(a) / COUNT(*): not mergeable
+        else:
+            plan.append(None)
+    has_group_by = re.search(r"\bGROUP\s+BY\b", select_sql, re.I) is not None
+    if not any(plan) or (not has_group_by and not all(plan)):
+        return None
+    return plan
+
+
+def _replace_table(conn, name, select_sql):
+    tmp = f"{name}__new"
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {quote(tmp)}")
+        conn.execute(f"CREATE TABLE {quote(tmp)} AS {select_sql}")
+        conn.execute(f"DROP TABLE IF EXISTS {quote(name)}")
+        conn.execute(f"ALTER TABLE {quote(tmp)} RENAME TO {quote(name)}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    bump_version(conn)
+
+
+def _merge_appended(conn, name, select_sql, plan, table, from_rows):
+    """Aggregate only rows of `table` past `from_rows` and merge them into view `name`."""
+    delta = f"_mv_delta_{table}"
+    conn.execute(f"DROP VIEW IF EXISTS temp.{quote(delta)}")
+    conn.execute(f"CREATE TEMP VIEW {quote(delta)} AS SELECT * FROM {quote(table)} WHERE rowid > {int(from_rows)}")
+    try:
+        delta_sql = re.sub(rf'(?<![\w."]){re.escape(table)}(?![\w"])|"{re.escape(table)}"',
+                           quote(delta), select_sql)
+        columns = [r[1] for r in conn.execute(f"PRAGMA table_info({quote(name)})")]
+        keys = [quote(c) for c, merge in zip(columns, plan) if merge is None]
+        merged = ", ".join(quote(c) if merge is None else f"{merge}({quote(c)}) AS {quote(c)}"
+                           for c, merge in zip(columns, plan))
+        group_by = f" GROUP BY {', '.join(keys)}" if keys else ""
+        _replace_table(conn, name, f"SELECT {merged} FROM (SELECT * FROM {quote(name)} "
+                                   f"UNION ALL SELECT * FROM ({delta_sql})){group_by}")
+    finally:
+        conn.execute(f"DROP VIEW IF EXISTS temp.{quote(delta)}")
+
+
+def _save(conn, name, select_sql, sources, mode, seconds):
+    with conn:
+        conn.execute(
+            f"INSERT OR REPLACE INTO {REGISTRY_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+            (name, select_sql, json.dumps(sources), time.time(), mode, seconds),
+        )
+
+
+def create_view(conn, name, sql):
+    """Register `sql` (a SELECT) as materialized view `name` and build it."""
+    ensure_registry(conn)
+    select_sql = strip_create(sql)
+    start = time.time()
+    sources = source_state(conn, source_tables(conn, select_sql))
+    _replace_table(conn, name, select_sql)
+    _save(conn, name, select_sql, sources, "full", time.time() - start)
+
+
+def refresh_view(conn, name, force=False):
+    """Refresh one view: skip, merge appended rows, or recompute in full.
+
+    Returns a dict with `view`, `mode` ("skipped", "incremental" or "full") and `seconds`.
+    """
+    ensure_registry(conn)
+    start = time.time()
+    select_sql, old_json = conn.execute(
+        f"SELECT sql, sources FROM {REGISTRY_TABLE} WHERE name = ?", (name,)
+    ).fetchone()
+    old = json.loads(old_json)
+    new = source_state(conn, source_tables(conn, select_sql))
+    changed = [t for t in new if old.get(t, {}).get("fingerprint") != new[t]["fingerprint"]]
+
+    mode = "full"
+    view_exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone()
+    if not force and view_exists and not changed and set(new) == set(old):
+        mode = "skipped"
+    elif not force and view_exists and len(changed) == 1:
+        table = changed[0]
+        plan = aggregate_plan(select_sql)
+        appended = new[table]["append_from"] is not None and new[table]["append_from"] == old.get(table, {}).get("rows")
+        if plan and appended:
+            _merge_appended(conn, name, select_sql, plan, table, old[table]["rows"])
+            mode = "incremental"
+
+    if mode == "full":
+        _replace_table(conn, name, select_sql)
+    if mode != "skipped":
+        _save(conn, name, select_sql, new, mode, time.time() - start)
+    return {"view": name, "mode": mode, "seconds": time.time() - start}
+
+
+def refresh_views(conn, force=False):
+    if not has_registry(conn):
+        return []
+    names = [r[0] for r in conn.execute(f"SELECT name FROM {REGISTRY_TABLE} ORDER BY name")]
+    return [refresh_view(conn, name, force) for name in names]
+
+
+def drop_view(conn, name):
+    ensure_registry(conn)
+    with conn:
+        conn.execute(f"DELETE FROM {REGISTRY_TABLE} WHERE name = ?", (name,))
+    conn.execute(f"DROP TABLE IF EXISTS {quote(name)}")
+    bump_version(conn)
+
+
+def list_views(conn):
+    # Also called on read-only connections, so the registry is not created here
+    columns = ["name", "sql", "sources", "last_mode", "seconds", "refreshed_at"]
+    if not has_registry(conn):
+        return pd.DataFrame(columns=columns)
+    views = pd.read_sql_query(f"SELECT {', '.join(columns)} FROM {REGISTRY_TABLE} ORDER BY name", conn)
+    views["sources"] = views["sources"].map(lambda s: ", ".join(json.loads(s)))
+    views["refreshed_at"] = pd.to_datetime(views["refreshed_at"], unit="s")
+    return views
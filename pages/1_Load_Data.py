@@ -1,6 +1,10 @@
 import streamlit as st
 import pandas as pd
 
+from dw_lab import cache
+from dw_lab.ingest import read_csv_chunked
+from dw_lab.profile import Profiler, category_suggestions, pk_candidates, profile_frame
+
 # Apply custom CSS
 st.markdown(
     """
@@ -59,17 +63,106 @@ button[kind="secondary"]:hover, button[kind="primary"]:hover {
 
 st.title("📂 Load Data")
 
+# ⚙️ Ingestion settings
+with st.expander("⚙️ Ingestion Settings"):
+    streaming = st.checkbox("Streaming (chunked) ingestion", value=True,
+                            help="Read the file in chunks and downcast dtypes to save memory.")
+    memory_budget_mb = st.number_input("Memory budget (MB)", min_value=16, value=512, step=64)
+    use_cache = st.checkbox("Use dataset cache", value=True,
+                            help=f"Keep a columnar copy of each file in `{cache.CACHE_DIR}/` so it is parsed only once.")
+    cache_quota_mb = st.number_input("Cache quota (MB)", min_value=64, value=cache.DEFAULT_QUOTA_MB, step=256)
+
+
+def parse_csv(source, profiler):
+    if not streaming:
+        df = pd.read_csv(source)
+        st.dataframe(df.head())
+        return df, True
+
+    preview = st.empty()
+    progress = st.progress(0.0, text="Reading CSV...")
+
+    def on_chunk(chunk, rows, fraction):
+        # ✅ Profile each chunk while it is in memory (no second pass over the data)
+        profiler.update(chunk)
+        if rows == len(chunk):
+            preview.dataframe(chunk.head())
+        progress.progress(fraction, text=f"Read {rows:,} rows...")
+
+    df, stats = read_csv_chunked(source, memory_budget_mb=memory_budget_mb, on_chunk=on_chunk)
+    progress.progress(1.0, text=f"Read {stats['rows']:,} rows in {stats['chunks']} chunks "
+                                f"({stats['memory_bytes'] / 1024 ** 2:,.1f} MB in memory).")
+    if stats['truncated']:
+        st.warning(f"⚠️ Memory budget of {memory_budget_mb} MB reached — "
+                   f"only the first {stats['rows']:,} rows were loaded.")
+    return df, not stats['truncated']
+
+
+def load_csv(source, source_id):
+    variant = f"chunked-{memory_budget_mb}" if streaming else "full"
+    source_id = f"{source_id}|{variant}"
+    # Streamlit reruns this script on every interaction: reuse the frame already loaded
+    if st.session_state.get('raw_df_source') == source_id and 'raw_df' in st.session_state:
+        df = st.session_state['raw_df']
+        st.dataframe(df.head())
+        return df
+
+    profiler = Profiler()
+    profile = None
+    if use_cache:
+        df, key, hit, seconds = cache.load_cached(source, lambda s: parse_csv(s, profiler), variant,
+                                                  quota_mb=cache_quota_mb)
+        if hit:
+            st.dataframe(df.head())
+            st.caption(f"⚡ Loaded from cache `{key[:12]}` in {seconds:.3f} sec.")
+            profile = cache.get_profile(key)
+    else:
+        df, _ = parse_csv(source, profiler)
+
+    if profile is None:
+        # Non-streaming loads (and cache entries older than profiles) are profiled once here
+        profile = profiler.summary() if profiler.columns else profile_frame(df)
+        if use_cache:
+            cache.put_profile(key, profile)
+    st.session_state['raw_profile'] = profile
+    st.session_state['raw_df_source'] = source_id
+    return df
+
+
 uploaded_file = st.file_uploader("Upload CSV file", type=["csv"])
 
 if uploaded_file:
-    df = pd.read_csv(uploaded_file)
+    source_id = getattr(uploaded_file, 'file_id', None) or f"{uploaded_file.name}:{uploaded_file.size}"
+    df = load_csv(uploaded_file, source_id)
     st.session_state['raw_df'] = df
     st.write("✅ File uploaded.")
-    st.dataframe(df.head())
 else:
     st.info("Upload your CSV or try the sample below:")
 
     if st.button("📄 Load Sample Data"):
-        df = pd.read_csv("data/sample.csv")
+        df = load_csv("data/sample.csv", "data/sample.csv")
         st.session_state['raw_df'] = df
-        st.dataframe(df.head())
+
+# 📊 Column profile (computed during ingestion, cached with the dataset)
+if 'raw_df' in st.session_state and st.session_state.get('raw_profile') is not None:
+    profile = st.session_state['raw_profile']
+    with st.expander("📊 Column Profile"):
+        st.caption("Distinct counts are HyperLogLog estimates (±1%), quantiles come from a t-digest "
+                   "and top values are approximate counts.")
+        st.dataframe(profile, hide_index=True)
+        keys = pk_candidates(profile)
+        st.write("🔑 Primary key candidates (unique, no nulls): " + (", ".join(f"`{c}`" for c in keys) or "none"))
+        suggested = [c for c in category_suggestions(profile) if c in st.session_state['raw_df'].columns]
+        if suggested:
+            st.write("🏷️ Low-cardinality text columns that would be smaller as `category`: "
+                     + ", ".join(f"`{c}`" for c in suggested))
+            if st.button("Convert to category"):
+                raw = st.session_state['raw_df']
+                before = raw.memory_usage(deep=True).sum()
+                raw = raw.astype({c: "category" for c in suggested})
+                st.session_state['raw_df'] = raw
+                profile = profile.copy()
+                profile.loc[profile["column"].isin(suggested), "dtype"] = "category"
+                st.session_state['raw_profile'] = profile
+                st.success(f"✅ Memory: {before / 1024 ** 2:,.1f} MB → "
+                           f"{raw.memory_usage(deep=True).sum() / 1024 ** 2:,.1f} MB")
@@ -1,6 +1,9 @@
 import streamlit as st
 import graphviz
 
+from dw_lab.keys import build_star
+from dw_lab.profile import key_column, pk_candidates
+
 # ✅ Apply custom CSS
 st.markdown(
     """
@@ -67,6 +70,7 @@ if 'raw_df' not in st.session_state:
 
 df = st.session_state['raw_df']
 st.dataframe(df.head())
+profile = st.session_state.get('raw_profile')
 
 st.subheader("✅ Choose Schema Type")
 schema_type = st.radio("Schema Type", ["Star", "Snowflake"])
@@ -74,6 +78,10 @@ schema_type = st.radio("Schema Type", ["Star", "Snowflake"])
 st.subheader("✅ Define Fact Table")
 columns = df.columns.tolist()
 fact_cols = st.multiselect("Fact Table Columns", columns, default=columns)
+grain = pk_candidates(profile, fact_cols)
+if grain:
+    st.caption("💡 Unique, non-null columns (candidate keys for the fact grain): "
+               + ", ".join(f"`{c}`" for c in grain))
 
 st.subheader("✅ Define Dimensions")
 dimension_defs = []
@@ -83,8 +91,14 @@ for i in range(num_dimensions):
     st.write(f"--- Dimension {i+1} ---")
     dim_name = st.text_input(f"Dimension {i+1} Name", value=f"dim_{i+1}")
     dim_cols = st.multiselect(f"Columns for {dim_name}", columns, key=f"dim_cols_{i}")
-    dim_pk = st.selectbox(f"Primary Key for {dim_name}", dim_cols, key=f"dim_pk_{i}")
+    # ✅ Default the PK to the profiled column with the fewest nulls and most distinct values
+    suggested_pk = key_column(profile, dim_cols)
+    dim_pk = st.selectbox(f"Primary Key for {dim_name}", dim_cols, key=f"dim_pk_{i}",
+                          index=dim_cols.index(suggested_pk) if suggested_pk else 0)
     fact_fk = st.selectbox(f"FK in Fact for {dim_name}", fact_cols, key=f"fact_fk_{i}")
+    history = st.checkbox(f"Keep history of {dim_name} (SCD Type 2)", key=f"history_{i}",
+                          help="ETL keeps every version of a changed row (valid_from / valid_to / is_current) "
+                               "instead of overwriting it. Needs surrogate keys.")
 
     sub_dim = None
     if schema_type == "Snowflake":
@@ -92,7 +106,9 @@ for i in range(num_dimensions):
         if add_sub:
             sub_name = st.text_input(f"Sub-dimension Name", value=f"sub_{dim_name}")
             sub_cols = st.multiselect(f"Sub-dim Columns", columns, key=f"sub_cols_{i}")
-            sub_pk = st.selectbox(f"Sub-dim PK", sub_cols, key=f"sub_pk_{i}")
+            suggested_sub_pk = key_column(profile, sub_cols)
+            sub_pk = st.selectbox(f"Sub-dim PK", sub_cols, key=f"sub_pk_{i}",
+                                  index=sub_cols.index(suggested_sub_pk) if suggested_sub_pk else 0)
             dim_fk = st.selectbox(f"FK in {dim_name} for sub-dim", dim_cols, key=f"dim_fk_{i}")
             sub_dim = {'name': sub_name, 'columns': sub_cols, 'pk': sub_pk, 'fk': dim_fk}
 
@@ -101,28 +117,52 @@ for i in range(num_dimensions):
         'columns': dim_cols,
         'pk': dim_pk,
         'fk': fact_fk,
+        'history': history,
         'sub_dim': sub_dim
     })
 
+st.subheader("✅ Keys")
+use_sk = st.checkbox("Use integer surrogate keys", value=True,
+                     help="Give each dimension a dense int key and store int32 FKs in the fact table "
+                          "instead of the natural key columns.")
+as_of = None
+if any(d['history'] for d in dimension_defs):
+    as_of = st.selectbox("Point-in-time column for history dimensions", ["(current version)"] + fact_cols,
+                         help="Fact rows reference the dimension version valid at this date; "
+                              "otherwise every fact row references the current version.")
+    as_of = None if as_of == "(current version)" else as_of
+
 if st.button("Save Schema"):
-    st.session_state['fact_table'] = df[fact_cols]
-    st.session_state['dimensions'] = []
-    for d in dimension_defs:
-        d_table = df[d['columns']].drop_duplicates()
-        st.session_state['dimensions'].append({
-            'name': d['name'],
-            'table': d_table,
-            'pk': d['pk'],
-            'fk': d['fk'],
-            'sub_dim': d['sub_dim']
-        })
+    if use_sk:
+        fact, dimensions = build_star(df, fact_cols, dimension_defs)
+    else:
+        fact = df[fact_cols]
+        dimensions = [{**d, 'table': df[d['columns']].drop_duplicates(), 'sk': None} for d in dimension_defs]
+    st.session_state['fact_table'] = fact
+    st.session_state['dimensions'] = [{
+        'name': d['name'],
+        'table': d['table'],
+        'pk': d['pk'],
+        'fk': d['fk'],
+        'sk': d['sk'],
+        'history': d['history'] and bool(d['sk']),
+        'sub_dim': d['sub_dim']
+    } for d in dimensions]
     st.session_state['schema_type'] = schema_type
+    st.session_state['history_as_of'] = as_of
+    # The warehouse no longer matches the new schema until ETL runs again
+    st.session_state.pop('warehouse', None)
     st.success(f"{schema_type} Schema saved.")
+    if use_sk:
+        before = df[fact_cols].memory_usage(deep=True).sum()
+        after = fact.memory_usage(deep=True).sum()
+        st.caption(f"Fact table: {before / 1024:,.1f} KB ➜ {after / 1024:,.1f} KB with surrogate keys.")
 
 if 'fact_table' in st.session_state:
     dot = "digraph G { Fact [shape=box, color=lightblue]; "
     for d in st.session_state['dimensions']:
-        dot += f"{d['name']} [shape=ellipse, color=lightgreen]; Fact -> {d['name']} [label=\"{d['fk']} ➜ {d['pk']}\"];"
+        key = d.get('sk') or f"{d['fk']} ➜ {d['pk']}"
+        dot += f"{d['name']} [shape=ellipse, color=lightgreen]; Fact -> {d['name']} [label=\"{key}\"];"
         if d['sub_dim']:
             s = d['sub_dim']
             dot += f"{s['name']} [shape=ellipse, color=lightyellow]; {d['name']} -> {s['name']} [label=\"{s['fk']} ➜ {s['pk']}\"];"
@@ -1,5 +1,20 @@
 import streamlit as st
-import sqlite3
+import pandas as pd
+import os
+import time
+
+from dw_lab.backends import DEFAULT_BACKEND, get_backend
+from dw_lab.buildgraph import DEFAULT_WORKERS
+from dw_lab.bulkload import quote
+from dw_lab.connections import WAREHOUSE_PATH, get_manager
+from dw_lab.cube import STAR_VIEW, build_cube, create_star_view, cube_config, is_stale, star_view_sql
+from dw_lab.indexes import index_star
+from dw_lab.jobs import POLL_SECONDS, etl_job, get_job, jobs, submit
+from dw_lab.partitions import date_columns
+from dw_lab.scd import is_history, point_in_time_sql
+from dw_lab.sessions import maybe_collect_garbage, new_session_id, session_path
+from dw_lab.views import refresh_views
+
 # Apply custom CSS
 st.markdown(
     """
@@ -46,16 +61,105 @@ if 'fact_table' not in st.session_state:
     st.warning("⚠️ Please define your schema first (Fact & Dimensions).")
     st.stop()
 
-# ✅ Use file DB so data persists across pages
-conn = sqlite3.connect("dw_lab.db", check_same_thread=False)
+# ✅ Use file DB so data persists across pages; each session has its own, so concurrent users
+# never overwrite each other's tables
+session_id = st.session_state.setdefault('session_id', new_session_id())
+warehouse_path = session_path(session_id, WAREHOUSE_PATH)
+warehouse = get_manager(warehouse_path)
+maybe_collect_garbage()
+
+# Tables whose content has not changed since the last load are skipped
+force_reload = st.checkbox("🔁 Force full reload", help="Rewrite every table even if it is unchanged.")
+fact = st.session_state['fact_table']
+# ✅ Monthly partitions: date-bounded queries read only the overlapping months, and a reload
+# rewrites only the months whose rows changed
+partition_options = date_columns(fact)
+partition_column = st.selectbox("🗓️ Partition the fact table by month on", ["(none)"] + partition_options,
+                                index=1 if partition_options else 0)
+partition_column = None if partition_column == "(none)" else partition_column
+load_results = []
+
+
+def report(node, label):
+    result = {**node['result'], 'build_seconds': node['build_seconds']}
+    load_results.append(result)
+    details = result.pop('details', None)
+    if result['skipped']:
+        st.success(f"✔️ {label} unchanged — skipped ({result['rows']} rows already loaded).")
+    elif details is not None:
+        changed = [r for r in details if not r['skipped']]
+        st.success(f"✔️ {label} saved with {result['rows']} rows in {result['partitions']} monthly partitions "
+                   f"({len(changed)} written, {len(details) - len(changed)} unchanged) in {result['seconds']:.3f} sec.")
+    elif 'versions' in result:
+        st.success(f"✔️ {label} history: {result['new']} new, {result['changed']} changed, "
+                   f"{result['expired']} expired, {result['unchanged']} unchanged keys "
+                   f"({result['versions']} versions) in {result['seconds']:.3f} sec.")
+    elif result['appended']:
+        st.success(f"✔️ {label} appended new rows ({result['rows']} total) in {result['seconds']:.3f} sec "
+                   f"({result['rows_per_sec'] or 0:,.0f} rows/sec).")
+    else:
+        st.success(f"✔️ {label} saved with {result['rows']} rows in {result['seconds']:.3f} sec "
+                   f"({result['rows_per_sec'] or 0:,.0f} rows/sec).")
+
+
+# ✅ Build and hash all tables in a worker pool (sub-dimensions wait for their dimension) and
+# write each one through the single writer connection as soon as it is ready. History (SCD Type 2)
+# dimensions version only their changed keys, before the fact table is built.
+# ✅ The loads run as a background job: widget clicks rerun this page without restarting them, and
+# you can browse other pages meanwhile. A new job starts only when the schema or the settings change.
+dimensions = st.session_state['dimensions']
+settings = (partition_column, force_reload, st.session_state.get('history_as_of'))
+current = st.session_state.get('etl_job')
+job = get_job(current['id']) if current else None
+raw_df = st.session_state['raw_df']
+# Sub-dimensions may be built from the raw frame, so a newly loaded one starts a new job too
+stale = (job is None or current['fact'] is not fact or current['dimensions'] is not dimensions
+         or current.get('raw_df') is not raw_df or current['settings'] != settings
+         or (job.status == "done" and not os.path.exists(warehouse_path)))
+if stale or (not job.active and job.status != "done" and st.button("▶️ Run ETL again")):
+    if job is not None:
+        job.cancel()
+    job = submit("etl", etl_job, warehouse_path, fact, dimensions, raw_df,
+                 as_of=settings[2], partition_column=partition_column, force=force_reload, session_id=session_id)
+    st.session_state['etl_job'] = {'id': job.id, 'fact': fact, 'dimensions': dimensions, 'raw_df': raw_df,
+                                   'settings': settings}
+
+if job.active:
+    st.subheader("⏳ Loading in the background")
+    progress = job.progress()
+    st.progress(job.fraction(), text=f"{sum(t['written'] for t in progress):,} rows written "
+                                     f"({job.status}, {time.time() - job.submitted:.0f} sec)")
+    if progress:
+        st.dataframe(pd.DataFrame(progress), hide_index=True,
+                     column_config={"rows_per_sec": st.column_config.NumberColumn("rows/sec", format="%.0f")})
+    if job.cancel_requested:
+        st.info("⏹️ Cancelling after the current batch...")
+    elif st.button("⏹️ Cancel load"):
+        job.cancel()
+    st.caption("You can keep browsing other pages; come back here to see the results.")
+    time.sleep(POLL_SECONDS)
+    st.rerun()
+if job.status == "cancelled":
+    st.warning("⏹️ The load was cancelled. Tables finished before that are kept; the one being written was "
+               "rolled back.")
+    st.stop()
+if job.status == "failed":
+    st.error(f"❌ The load failed: {job.error}")
+    with st.expander("Details"):
+        st.code(job.traceback)
+    st.stop()
+
+conn = warehouse.writer()
+history_dims = {d['name']: d for d in dimensions if is_history(d)}
+nodes = job.result['nodes']
+st.caption(f"⚙️ Built {len(nodes)} tables (up to {DEFAULT_WORKERS} in parallel) and loaded them in "
+           f"{job.result['seconds']:.3f} sec in the background (build time per table is in the Load Summary).")
 
 # ✅ 1️⃣ Load FACT table
 st.subheader("✅ 1️⃣ Fact Table")
-fact = st.session_state['fact_table']
 
-if fact is not None and not fact.empty:
-    fact.to_sql('fact_table', conn, index=False, if_exists='replace')
-    st.success(f"✔️ Fact table saved as `fact_table` with {len(fact)} rows and {len(fact.columns)} columns.")
+if 'result' in nodes['fact_table']:
+    report(nodes['fact_table'], f"Fact table `fact_table` ({len(fact.columns)} columns)")
     if st.checkbox("🔍 Show Fact Table Sample"):
         st.dataframe(fact.head())
 else:
@@ -68,11 +172,16 @@ for d in st.session_state['dimensions']:
     dim_name = d['name']
 
     st.write(f"**Dimension:** `{dim_name}`")
-    if dim_df is not None and not dim_df.empty:
-        dim_df.to_sql(dim_name, conn, index=False, if_exists='replace')
-        st.success(f"✔️ Dimension `{dim_name}` saved with {len(dim_df)} rows.")
+    if 'result' in nodes[dim_name]:
+        report(nodes[dim_name], f"Dimension `{dim_name}`")
         if st.checkbox(f"🔍 Show `{dim_name}`", key=dim_name):
             st.dataframe(dim_df.head())
+        if dim_name in history_dims and st.checkbox(f"🕰️ Show `{dim_name}` as of...", key=f"{dim_name}_as_of"):
+            # The default is set once: a `value` changing with the clock would reset what you type
+            st.session_state.setdefault(f"{dim_name}_as_of_ts", time.strftime("%Y-%m-%d %H:%M:%S"))
+            as_of = st.text_input("Timestamp (YYYY-MM-DD HH:MM:SS)", key=f"{dim_name}_as_of_ts")
+            st.dataframe(pd.read_sql_query(point_in_time_sql(dim_name), conn, params={'as_of': as_of}),
+                         hide_index=True)
     else:
         st.warning(f"⚠️ Dimension `{dim_name}` is empty! Please check your selected columns.")
 
@@ -80,22 +189,118 @@ for d in st.session_state['dimensions']:
     if d['sub_dim']:
         sub = d['sub_dim']
         sub_name = sub['name']
-        sub_table = st.session_state['raw_df'][sub['columns']].drop_duplicates()
-
         st.write(f"↳ Sub-dimension: `{sub_name}`")
-        if sub_table is not None and not sub_table.empty:
-            sub_table.to_sql(sub_name, conn, index=False, if_exists='replace')
-            st.success(f"✔️ Sub-dimension `{sub_name}` saved with {len(sub_table)} rows.")
+        if 'result' in nodes[sub_name]:
+            report(nodes[sub_name], f"Sub-dimension `{sub_name}`")
             if st.checkbox(f"🔍 Show `{sub_name}`", key=sub_name):
-                st.dataframe(sub_table.head())
+                st.dataframe(pd.read_sql_query(f"SELECT * FROM {quote(sub_name)} LIMIT 5", conn))
         else:
             st.warning(f"⚠️ Sub-dimension `{sub_name}` is empty! Double-check its source columns.")
 
-# ✅ Save connection for other pages
-st.session_state['conn'] = conn
+# ✅ 4️⃣ Indexes & statistics
+st.subheader("✅ 4️⃣ Indexes & Statistics")
+st.write("""
+Every dimension **PK** and fact **FK** gets an index so the auto-joins on the Query page are index lookups,
+then `ANALYZE` refreshes the query planner's statistics.
+""")
+fact_columns = fact.columns.tolist() if fact is not None else []
+with st.expander("➕ Covering indexes for common GROUP BY columns"):
+    group_by_cols = st.multiselect("Group-by columns", fact_columns, key="cover_group_by")
+    measure_cols = st.multiselect("Measures to include", fact_columns, key="cover_measures")
+
+index_results, index_bytes, analyze_seconds = index_star(conn, st.session_state['dimensions'],
+                                                         group_by=group_by_cols, measures=measure_cols)
+built = [r for r in index_results if r['created']]
+st.success(f"✔️ {len(index_results)} indexes in place ({len(built)} built this run, "
+           f"{sum(r['seconds'] for r in built):.3f} sec, +{index_bytes / 1024:,.1f} KB); "
+           + (f"ANALYZE took {analyze_seconds:.3f} sec." if built else "statistics are up to date."))
+if st.checkbox("🔍 Show index details"):
+    st.dataframe(pd.DataFrame(index_results), hide_index=True)
+
+# ✅ 5️⃣ Refresh materialized views
+view_results = refresh_views(conn)
+if view_results:
+    st.subheader("✅ 5️⃣ Materialized Views")
+    for r in view_results:
+        st.success(f"✔️ View `{r['view']}`: {r['mode']} refresh ({r['seconds']:.3f} sec).")
+
+# ✅ 6️⃣ OLAP cube
+st.subheader("✅ 6️⃣ OLAP Cube")
+st.write("""
+Pre-computes **ROLLUP** / **CUBE** aggregate tables over the star view `v_star` (fact joined to its dimensions).
+Roll-ups and drill-downs on the Visualize and Reports pages are answered from the smallest matching aggregate.
+""")
+star_columns = create_star_view(conn, st.session_state['dimensions'])
+config = cube_config(conn)
+cube_cols, cube_measures, cube_mode = config or ([], [], "rollup")
+with st.expander("🧊 Cube Definition", expanded=config is None):
+    cube_cols = st.multiselect("Dimension columns (in roll-up order)", star_columns,
+                               default=[c for c in cube_cols if c in star_columns])
+    cube_measures = st.multiselect("Measures", star_columns,
+                                   default=[c for c in cube_measures if c in star_columns])
+    cube_mode = st.radio("Grouping sets", ["rollup", "cube"], index=["rollup", "cube"].index(cube_mode),
+                         horizontal=True)
+    build_clicked = st.button("🧊 Build Cube")
+
+if build_clicked or (config and is_stale(conn)):
+    if cube_measures:
+        cube_results = build_cube(conn, cube_cols, cube_measures, cube_mode)
+        st.success(f"✔️ Built {len(cube_results)} aggregate tables in "
+                   f"{sum(r['seconds'] for r in cube_results):.3f} sec.")
+        st.dataframe(pd.DataFrame(cube_results), hide_index=True)
+    else:
+        st.warning("⚠️ Choose at least one measure for the cube.")
+elif config:
+    st.success(f"✔️ Cube over {', '.join(config[0]) or '(total)'} is up to date.")
+
+# ✅ 7️⃣ Columnar backend: a copy of the star schema for the Query page's analytical queries
+def warehouse_frame(name):
+    """Table `name` as loaded: this page's own frame where it is the same, else read back from the warehouse."""
+    if name == 'fact_table' and not history_dims:
+        return fact
+    for d in dimensions:
+        if d['name'] == name and name not in history_dims:
+            return d['table']
+    # History versions, sub-dimensions and a fact table with version keys are only in the warehouse
+    return pd.read_sql_query(f"SELECT * FROM {quote(name)}", conn)
+
+
+if DEFAULT_BACKEND != "sqlite":
+    st.subheader(f"✅ 7️⃣ Analytical Backend (`{DEFAULT_BACKEND}`)")
+    try:
+        backend = get_backend(warehouse_path, DEFAULT_BACKEND)
+        existing = set(backend.table_names())
+        copied = [backend.load_table(r['table'], warehouse_frame(r['table']))
+                  for r in load_results if not (r['skipped'] and r['table'] in existing)]
+        backend.create_view(STAR_VIEW, star_view_sql(conn, st.session_state['dimensions'])[0])
+        st.success(f"✔️ {len(copied)} tables copied to `{DEFAULT_BACKEND}` in "
+                   f"{sum(c['seconds'] for c in copied):.3f} sec; unchanged tables were kept.")
+    except Exception as e:
+        # The backend is only a copy: whatever goes wrong there, SQLite still answers every query
+        st.warning(f"⚠️ `{DEFAULT_BACKEND}` could not be refreshed ({e}). Queries will run on SQLite.")
+
+# ✅ Load summary
+if load_results:
+    st.subheader("⏱️ Load Summary")
+    skipped = sum(r['skipped'] for r in load_results)
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Tables", len(load_results))
+    c2.metric("Skipped (unchanged)", skipped)
+    c3.metric("Total time", f"{sum(r['seconds'] for r in load_results):.3f} sec")
+    st.dataframe(pd.DataFrame(load_results), hide_index=True)
+
+# ✅ Hand the writer back and tell other pages where the warehouse is
+warehouse.release()
+st.session_state['warehouse'] = warehouse_path
+
+with st.expander("🗂️ ETL jobs of this session"):
+    st.dataframe(pd.DataFrame([{'job': j.id, 'status': j.status,
+                                'submitted': time.strftime("%H:%M:%S", time.localtime(j.submitted)),
+                                'seconds': (j.finished or time.time()) - (j.started or j.submitted)}
+                               for j in jobs(session_id)]), hide_index=True)
 
-st.info("""
+st.info(f"""
 ✅ **ETL Complete!**  
-Your **Fact**, **Dimensions**, and **Sub-dimensions** are now loaded in `dw_lab.db`.  
+Your **Fact**, **Dimensions**, and **Sub-dimensions** are now loaded in `{warehouse_path}`.  
 You can query this data or create materialized views in the **next pages**.
 """)
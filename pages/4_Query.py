@@ -1,6 +1,16 @@
 import streamlit as st
 import pandas as pd
+import os
 import time
+
+from dw_lab.backends import DEFAULT_BACKEND, available_backends, get_backend
+from dw_lab.connections import get_manager
+from dw_lab.etl import warehouse_version
+from dw_lab.explain import explain, plan_warnings, profile_query
+from dw_lab.pager import MAX_DOWNLOAD_MB, ResultPager, export_to_tempfile
+from dw_lab.querycache import DEFAULT_MAX_MB, QueryCache, is_read_only, normalize_sql
+from dw_lab.views import create_view, drop_view, list_views, refresh_views
+
 # Apply custom CSS
 st.markdown(
     """
@@ -80,11 +90,14 @@ button {
 
 st.title("📝 Query + Views + Rollup")
 
-if 'conn' not in st.session_state:
+if 'warehouse' not in st.session_state or not os.path.exists(st.session_state['warehouse']):
+    # Idle sessions' warehouses are garbage-collected
     st.warning("Run ETL first.")
     st.stop()
 
-conn = st.session_state['conn']
+# Reads share the process-wide pool; anything that may write waits for the single writer
+warehouse = get_manager(st.session_state['warehouse'])
+conn = warehouse.reader()
 
 st.subheader("✅ Auto JOIN Example")
 
@@ -93,13 +106,18 @@ dim = st.selectbox("Choose dimension", [d['name'] for d in dims])
 
 d = next(d for d in dims if d['name'] == dim)
 
-join_pk = d['pk'] or 'id'
-join_fk = d['fk'] or 'id'
+# Surrogate-keyed schemas join on the int key stored in both tables
+join_pk = d.get('sk') or d['pk'] or 'id'
+join_fk = d.get('sk') or d['fk'] or 'id'
 
 st.write(f"PK: `{join_pk}` | FK: `{join_fk}`")
 
+# Only select dimension columns the fact table doesn't already have
+fact_columns = set(st.session_state['fact_table'].columns)
+dim_select = ", ".join(f"d.{c}" for c in d['table'].columns if c not in fact_columns) or "d.*"
+
 example = f"""
-SELECT f.*, d.* 
+SELECT f.*, {dim_select} 
 FROM fact_table f 
 JOIN {dim} d 
 ON f.{join_fk} = d.{join_pk}
@@ -109,29 +127,192 @@ st.code(example)
 
 query = st.text_area("Your SQL:", example)
 
+
+# Shared by all sessions; entries are keyed on normalized SQL + warehouse version
+@st.cache_resource
+def get_query_cache():
+    return QueryCache(DEFAULT_MAX_MB)
+
+
+query_cache = get_query_cache()
+
+# Whole-result queries (pagination off) run on the deployment's analytical backend (DW_BACKEND) when it
+# is installed and holds every table they read; pages and downloads are always read from SQLite
+backend = get_backend(st.session_state['warehouse'], DEFAULT_BACKEND) \
+    if DEFAULT_BACKEND != "sqlite" and DEFAULT_BACKEND in available_backends() else None
+
+paginate = st.checkbox("📄 Paginate results", value=True,
+                       help="Fetch one page at a time instead of loading the whole result.")
+page_size = st.selectbox("Rows per page", [50, 100, 500, 1000], index=1) if paginate else None
+if paginate and backend is not None:
+    st.caption(f"Pages are read from SQLite; turn pagination off to run the query on {backend.name}.")
+
 if st.button("Run Query"):
-    start = time.time()
+    st.session_state['last_query'] = query
+    st.session_state['result_page'] = 1
+    read_only = is_read_only(conn, query)
+    if not paginate or not read_only:
+        start = time.time()
+        try:
+            # The backend holds only the star schema; anything else (views, cube, partitions) runs on SQLite
+            engine = backend if backend is not None and read_only and backend.answers(conn, query) else None
+            df, hit, _, answered = query_cache.read_sql(conn if read_only else warehouse.writer(), query, engine)
+            st.dataframe(df)
+            if engine is not None and answered != engine.name:
+                st.warning(f"⚠️ {engine.name} could not run this query; it ran on SQLite.")
+            st.success(f"✅ Done in {time.time() - start:.3f} sec on {answered}."
+                       + (" ⚡ (cached result)" if hit else ""))
+        except Exception as e:
+            st.error(e)
+
+last_query = st.session_state.get('last_query')
+if paginate and last_query and is_read_only(conn, last_query):
+    try:
+        pager = st.session_state.get('pager')
+        if (pager is None or pager.sql != normalize_sql(last_query) or pager.page_size != page_size
+                or pager.version != warehouse_version(conn)):
+            pager = ResultPager(conn, last_query, page_size, cache=query_cache)
+            st.session_state['pager'] = pager
+
+        # Run Query resets the page through session state; a `value` as well would make Streamlit warn
+        page_no = st.number_input("Page", min_value=1, key="result_page")
+        start = time.time()
+        page_df = pager.page(page_no - 1)
+        st.dataframe(page_df)
+        first = (page_no - 1) * page_size
+        st.success(f"✅ Rows {first + 1:,}–{first + len(page_df):,} in {time.time() - start:.3f} sec.")
+
+        if st.button("🔢 Count total rows"):
+            pager.total()
+        total = pager.total(compute=False)
+        if total is not None:
+            st.write(f"**Total rows:** {total:,} ({-(-total // page_size):,} pages)")
+
+        fmt = st.radio("Download format", ["csv", "parquet"], horizontal=True)
+        if st.button("📦 Prepare full download"):
+            path, rows = export_to_tempfile(conn, last_query, fmt)
+            try:
+                size_mb = os.path.getsize(path) / 2 ** 20
+                if size_mb > MAX_DOWNLOAD_MB:
+                    st.warning(f"⚠️ The export of {rows:,} rows is {size_mb:,.0f} MB, over the {MAX_DOWNLOAD_MB} MB "
+                               f"a download may hold in memory. Select fewer rows or columns, or try Parquet.")
+                else:
+                    with open(path, "rb") as f:
+                        st.download_button(f"⬇️ Download {rows:,} rows ({fmt.upper()}, {size_mb:,.1f} MB)", f,
+                                           file_name=f"query_result.{fmt}")
+            finally:
+                os.remove(path)
+    except Exception as e:
+        st.error(e)
+
+with st.expander("⚡ Query Result Cache"):
+    cache_mb = st.number_input("Cache budget (MB)", min_value=1, value=query_cache.max_bytes // (1024 * 1024))
+    if cache_mb * 1024 * 1024 != query_cache.max_bytes:
+        query_cache.resize(cache_mb)
+    stats = query_cache.stats()
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Hits", stats['hits'])
+    c2.metric("Misses", stats['misses'])
+    c3.metric("Hit rate", f"{stats['hit_rate']:.0%}")
+    c4.metric("Cached", f"{stats['entries']} ({stats['bytes'] / 1024 ** 2:,.1f} MB)")
+    if st.button("Clear Cache"):
+        query_cache.clear()
+
+with st.expander("🔌 Connections"):
+    pool = warehouse.stats()
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Readers open", f"{pool['readers_open']} / {pool['max_readers']}")
+    c2.metric("Readers in use", pool['readers_leased'])
+    c3.metric("Writer", "busy" if pool['writer_busy'] else ("idle" if pool['writer_open'] else "closed"))
+    c4.metric("Waits", pool['reader_waits'] + pool['writer_waits'])
+    st.caption(f"`{pool['path']}` — waited {pool['reader_wait_seconds']:.3f} sec for readers and "
+               f"{pool['writer_wait_seconds']:.3f} sec for the writer; "
+               f"{pool['statement_cache']} prepared statements cached per connection.")
+
+st.subheader("🩺 Query Profiler")
+st.write("""
+Shows the **query plan** and splits the latency of *Your SQL* into phases.
+Runs are kept in a per-session history, so you can compare timings before and after adding indexes
+or changing the schema. Profiling always executes the query (the result cache is bypassed).
+""")
+
+if st.button("Profile Query"):
     try:
-        df = pd.read_sql_query(query, conn)
-        st.dataframe(df)
-        st.success(f"✅ Done in {time.time() - start:.3f} sec.")
+        db = conn if is_read_only(conn, query) else warehouse.writer()
+        plan = explain(db, query)
+        st.write("**EXPLAIN QUERY PLAN**")
+        st.dataframe(plan, hide_index=True)
+        warnings = plan_warnings(plan)
+        for w in warnings:
+            st.warning(f"⚠️ {w}")
+        if not warnings:
+            st.success("✅ No full scans or temporary B-trees in this plan.")
+
+        df, timings = profile_query(db, query)
+        start = time.perf_counter()
+        st.dataframe(df.head(100))
+        timings['render'] = time.perf_counter() - start
+
+        st.bar_chart(pd.DataFrame({'seconds': timings}))
+        total = sum(timings.values())
+        st.write(" | ".join(f"**{k}:** {v * 1000:,.1f} ms" for k, v in timings.items())
+                 + f" | **total:** {total * 1000:,.1f} ms")
+
+        st.session_state.setdefault('query_history', []).append({
+            'run': len(st.session_state.get('query_history', [])) + 1,
+            'sql': normalize_sql(query)[:80],
+            'rows': len(df),
+            **{f"{k}_ms": round(v * 1000, 2) for k, v in timings.items()},
+            'total_ms': round(total * 1000, 2),
+            'full_scans': int(plan['full_scan'].sum()),
+            'temp_btrees': int(plan['temp_btree'].sum()),
+            'dw_version': warehouse_version(conn),
+        })
     except Exception as e:
         st.error(e)
 
+if st.session_state.get('query_history'):
+    st.write("**Query history (this session)**")
+    history = pd.DataFrame(st.session_state['query_history'])
+    st.dataframe(history, hide_index=True)
+    st.line_chart(history.set_index('run')['total_ms'])
+    if st.button("Clear History"):
+        st.session_state['query_history'] = []
+        st.rerun()
+
 st.subheader("✅ Create Materialized View")
+st.write("""
+Materialized views are stored as tables and **refreshed automatically after every ETL run**.
+Aggregate views over `fact_table` (`SUM` / `COUNT` / `MIN` / `MAX` with `GROUP BY`) are refreshed
+**incrementally** from newly appended fact rows; other views are recomputed in full.
+""")
 mv_name = st.text_input("View name", "mv_example")
-mv_query = st.text_area("View SQL", f"CREATE TABLE {mv_name} AS {example}")
+mv_query = st.text_area("View SQL (SELECT)", example)
 
 if st.button("Create View"):
     try:
-        conn.execute(mv_query)
+        create_view(warehouse.writer(), mv_name, mv_query)
         st.success(f"✅ View `{mv_name}` created.")
     except Exception as e:
         st.error(e)
 
+if st.button("Refresh Views"):
+    try:
+        for r in refresh_views(warehouse.writer()):
+            st.write(f"`{r['view']}`: {r['mode']} ({r['seconds']:.3f} sec)")
+    except Exception as e:
+        st.error(e)
+
 if st.button("Drop View"):
     try:
-        conn.execute(f"DROP TABLE IF EXISTS {mv_name}")
+        drop_view(warehouse.writer(), mv_name)
         st.success(f"✅ View `{mv_name}` dropped.")
     except Exception as e:
         st.error(e)
+
+views = list_views(conn)
+if not views.empty:
+    st.write("**Registered views:**")
+    st.dataframe(views, hide_index=True)
+
+warehouse.release()
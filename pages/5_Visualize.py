@@ -2,6 +2,10 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 
+from dw_lab.connections import get_manager
+from dw_lab.cube import answer
+from dw_lab.keys import natural_fact
+
 # ✅ Custom CSS for white select boxes
 st.markdown(
     """
@@ -42,7 +46,7 @@ if 'fact_table' not in st.session_state:
     st.warning("Run ETL first.")
     st.stop()
 
-df = st.session_state['fact_table']
+df = natural_fact(st.session_state['fact_table'], st.session_state.get('dimensions', []))
 
 # ✅ Show all columns
 st.write("**Available columns:**", list(df.columns))
@@ -62,9 +66,18 @@ if x in df.columns and y in df.columns:
     except Exception as e:
         st.error(f"🚫 Could not show sample: {e}")
 
-    # ✅ Safe pivot
+    # ✅ Safe pivot — answered from the warehouse's pre-computed aggregates when possible
     try:
-        pivot = pd.pivot_table(df, index=x, values=y, aggfunc='sum')
+        pivot = None
+        if 'warehouse' in st.session_state and x != y and pd.api.types.is_numeric_dtype(df[y]):
+            try:
+                result, source = answer(get_manager(st.session_state['warehouse']).reader(), [x], y, 'sum')
+                pivot = result.set_index(x)
+                st.caption(f"⚡ Aggregated in the warehouse from `{source}`.")
+            except Exception:
+                pivot = None
+        if pivot is None:
+            pivot = pd.pivot_table(df, index=x, values=y, aggfunc='sum')
         st.dataframe(pivot)
 
         chart = alt.Chart(pivot.reset_index()).mark_bar().encode(
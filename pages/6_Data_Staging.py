@@ -1,7 +1,11 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
 
+from dw_lab.connections import STAGING_PATH, get_manager
+from dw_lab.etl import prepare_load
+from dw_lab.sessions import maybe_collect_garbage, new_session_id, session_path
+from dw_lab.staging import StagingPipeline, drop_nulls, scaled_column, select_all
+
 # Apply custom CSS
 st.markdown(
     """
@@ -47,7 +51,36 @@ if 'raw_df' not in st.session_state:
 df = st.session_state['raw_df']
 
 # Use file DB so it persists across pages
-conn = sqlite3.connect("staging_lab.db", check_same_thread=False)
+session_id = st.session_state.setdefault('session_id', new_session_id())
+staging = get_manager(session_path(session_id, STAGING_PATH))
+conn = staging.writer()
+maybe_collect_garbage()
+
+# ✅ Stages are memoized: each one is rebuilt only when its input or parameters change
+pipeline = StagingPipeline(conn)
+stage_results = []
+
+
+def built(result, label):
+    stage_results.extend(result)
+    r = result[0]
+    if r['status'] == 'cached':
+        return f"{label} — unchanged, reused."
+    return f"{label} — rebuilt in {r['seconds']:.3f} sec."
+
+
+def stage_rows(name):
+    # A stage's key hashes its definition and everything upstream, so its row count is counted once per key
+    counts = st.session_state.setdefault('staging_rows', {})
+    key = pipeline.keys[name]
+    if counts.get(name, (None, None))[0] != key:
+        counts[name] = (key, pipeline.rows(name))
+    return counts[name][1]
+
+
+def read_stage(name):
+    return pd.read_sql_query(f"SELECT * FROM {name}", conn)
+
 
 st.subheader("✅ 1️⃣ Raw Stage")
 st.write("""
@@ -55,8 +88,13 @@ st.write("""
 We load your original uploaded data into a staging table **without any cleaning**.  
 This is your raw source.
 """)
-df.to_sql("staging_raw", conn, index=False, if_exists="replace")
-st.success(f"✔️ Raw table saved as `staging_raw` with {len(df)} rows.")
+# Fingerprint the upload once, not on every widget change
+cached = st.session_state.get('staging_input')
+if cached is None or cached[0] is not df:
+    cached = (df, prepare_load(df))
+    st.session_state['staging_input'] = cached
+pipeline.table("staging_raw", df, prepared=cached[1])
+st.success("✔️ " + built(pipeline.run(), f"Raw table saved as `staging_raw` with {len(df)} rows"))
 
 if st.checkbox("Show Raw Data"):
     st.dataframe(df)
@@ -66,14 +104,14 @@ st.subheader("✅ 2️⃣ Clean Stage")
 st.write("""
 **What happens:**  
 We remove rows with **NULL / missing values**.  
-This is your cleaned version, ready for light transformation.
+This is your cleaned version, ready for light transformation. It is a **view** over `staging_raw`,
+so no rows are copied.
 """)
-df_clean = df.dropna()
-df_clean.to_sql("staging_clean", conn, index=False, if_exists="replace")
-st.success(f"✔️ Clean table saved as `staging_clean` with {len(df_clean)} rows.")
+pipeline.view("staging_clean", "staging_raw", drop_nulls)
+st.success("✔️ " + built(pipeline.run(), f"Clean view `staging_clean` with {stage_rows('staging_clean')} rows"))
 
 if st.checkbox("Show Cleaned Data"):
-    st.dataframe(df_clean)
+    st.dataframe(read_stage("staging_clean"))
 
 # 🔄 Transform Stage
 st.subheader("✅ 3️⃣ Transform Stage")
@@ -82,19 +120,23 @@ st.write("""
 You can add simple derived columns — for example, convert an amount to USD.
 """)
 
-if 'Amount' in df_clean.columns:
-    if st.checkbox("Add `Amount_USD` column"):
-        usd_rate = st.number_input("USD Rate", min_value=0.0, value=1.0, step=0.01)
-        df_clean["Amount_USD"] = df_clean["Amount"] * usd_rate
-        st.success(f"✔️ `Amount_USD` added using rate: {usd_rate}")
+if 'Amount' in df.columns and st.checkbox("Add `Amount_USD` column"):
+    usd_rate = st.number_input("USD Rate", min_value=0.0, value=1.0, step=0.01)
+    pipeline.view("staging_transformed", "staging_clean", scaled_column,
+                  source="Amount", target="Amount_USD", factor=usd_rate)
+    st.success(f"✔️ `Amount_USD` added using rate: {usd_rate}")
+else:
+    pipeline.view("staging_transformed", "staging_clean", select_all)
 
-df_clean.to_sql("staging_transformed", conn, index=False, if_exists="replace")
-st.success(f"✔️ Transformed table saved as `staging_transformed` with {len(df_clean)} rows.")
+st.success("✔️ " + built(pipeline.run(), f"Transformed view `staging_transformed` with "
+                                 f"{stage_rows('staging_transformed')} rows"))
 
 if st.checkbox("Show Transformed Data"):
-    st.dataframe(df_clean)
+    st.dataframe(read_stage("staging_transformed"))
+
+staging.release()
 
-# Save for other pages
-st.session_state['conn_staging'] = conn
+with st.expander("🧮 Stage cache"):
+    st.dataframe(pd.DataFrame(stage_results), hide_index=True)
 
 st.info("✅ **Staging done!** You can now load this into your Data Warehouse in the next step.")
@@ -1,6 +1,13 @@
 import streamlit as st
 import pandas as pd
 import altair as alt
+import os
+
+from dw_lab.bitmap import BitmapIndex, pack
+from dw_lab.connections import get_manager
+from dw_lab.keys import natural_fact
+from dw_lab.reports import (GRANULARITIES, MAX_POINTS, WarehouseReport, bucket_series, choose_granularity,
+                             distinct_values, downsample, point_budget, star_columns, value_range)
 st.markdown(
     """
     <style>
@@ -56,73 +63,170 @@ if 'fact_table' not in st.session_state:
     st.warning("⚠️ Please run ETL first to load the DW.")
     st.stop()
 
-df = st.session_state['fact_table'].copy()
+warehouse_path = st.session_state.get('warehouse')
+conn = get_manager(warehouse_path).reader() if warehouse_path and os.path.exists(warehouse_path) else None
 
 # --- Filters ---
 st.sidebar.header("🔍 Filter Your Data")
+use_warehouse = conn is not None and st.sidebar.checkbox(
+    "🏛️ Query the warehouse", value=True,
+    help="Filter and aggregate inside this session's warehouse so only small aggregated results reach the page.")
+
+if use_warehouse:
+    report = WarehouseReport(conn)
+    columns = star_columns(conn)
+else:
+    # ✅ Decode the fact table and build its bitmap index once per loaded fact table
+    fact = st.session_state['fact_table']
+    cached = st.session_state.get('report_bitmaps')
+    if cached is None or cached['fact'] is not fact:
+        frame = natural_fact(fact, st.session_state.get('dimensions', [])).copy()
+        if 'Date' in frame.columns:
+            frame['Date'] = pd.to_datetime(frame['Date'])
+        cached = {'fact': fact, 'df': frame, 'index': BitmapIndex(frame)}
+        st.session_state['report_bitmaps'] = cached
+    df, bitmaps = cached['df'], cached['index']
+    selection = bitmaps.all()
+    columns = df.columns.tolist()
+
+
+def aggregate(group_by, agg='sum', buckets=None):
+    """`Amount` aggregated by `group_by` under the current filters (date columns in `buckets` truncated)."""
+    if use_warehouse:
+        return report.aggregate(group_by, agg, buckets)
+    if not group_by:
+        return pd.DataFrame({'Amount': [df['Amount'].agg(agg)]})
+    keys = [bucket_series(df[c], buckets[c]) if c in (buckets or {}) else df[c] for c in group_by]
+    return df.groupby(keys, observed=True)['Amount'].agg(agg).reset_index()
+
+
+def money(value):
+    return "—" if value is None or pd.isna(value) else f"${value:,.2f}"
+
 
 # Optional: Date filter
-if 'Date' in df.columns:
-    df['Date'] = pd.to_datetime(df['Date'])
-    min_date = df['Date'].min()
-    max_date = df['Date'].max()
+if 'Date' in columns:
+    if use_warehouse:
+        min_date, max_date = (pd.to_datetime(v) for v in value_range(conn, 'Date'))
+    else:
+        min_date = df['Date'].min()
+        max_date = df['Date'].max()
+    trend_start, trend_end = min_date, max_date
     date_range = st.sidebar.date_input("Select Date Range",
                                        [min_date, max_date],
                                        min_value=min_date,
                                        max_value=max_date)
     if len(date_range) == 2:
-        df = df[(df['Date'] >= pd.to_datetime(date_range[0])) &
-                (df['Date'] <= pd.to_datetime(date_range[1]))]
-
-# Optional: Category filter
-if 'Category' in df.columns:
-    categories = df['Category'].unique().tolist()
-    selected_cats = st.sidebar.multiselect("Category", categories, default=categories)
-    df = df[df['Category'].isin(selected_cats)]
-
-# Optional: Product filter
-if 'Product' in df.columns:
-    products = df['Product'].unique().tolist()
-    selected_products = st.sidebar.multiselect("Product", products, default=products)
-    df = df[df['Product'].isin(selected_products)]
+        trend_start, trend_end = date_range
+        if use_warehouse:
+            report.filters['Date'] = ("between", str(date_range[0]), f"{date_range[1]} 23:59:59")
+        else:
+            selection &= pack((df['Date'] >= pd.to_datetime(date_range[0])) &
+                              (df['Date'] <= pd.to_datetime(date_range[1])))
+
+
+def value_filter(column):
+    """Multiselect over `column`'s values, labelled with their row counts, applied to the current filters."""
+    global selection
+    # Labels use whole-table counts: they are part of the widget's identity, so they must not
+    # change with the other filters or the selection would reset. Options are the values left
+    # by the filters applied so far
+    if use_warehouse:
+        counts = distinct_values(conn, column).set_index(column)['rows'].to_dict()
+        options = (distinct_values(conn, column, report.filters)[column].tolist() if report.filters
+                   else list(counts))
+    elif column in bitmaps.columns:
+        counts = bitmaps.counts(column)
+        options = [v for v, n in bitmaps.counts(column, within=selection).items() if n]
+    else:
+        # Missing values are one option, `None`, as in the bitmap index
+        counts = df[column].value_counts(sort=False).to_dict()
+        missing = int(df[column].isna().sum())
+        if missing:
+            counts[None] = missing
+        current = bitmaps.take(df[column], selection)
+        options = current.dropna().unique().tolist() + ([None] if current.isna().any() else [])
+    selected = st.sidebar.multiselect(column, options, default=options,
+                                      format_func=lambda v: f"{'(missing)' if v is None else v} ({counts[v]:,})")
+    if use_warehouse:
+        # With every value selected there is nothing to filter: no IN list of all of them, and rows
+        # where the column is NULL (not an option) are kept
+        if len(selected) < len(options):
+            report.filters[column] = selected
+    elif column in bitmaps.columns:
+        selection = bitmaps.evaluate({column: selected}, within=selection)
+    else:
+        mask = df[column].isin([v for v in selected if v is not None])
+        selection &= pack(mask | df[column].isna() if None in selected else mask)
+
+
+# Optional: Category and Product filters
+for column in ['Category', 'Product']:
+    if column in columns:
+        value_filter(column)
+
+if not use_warehouse:
+    # ✅ One gather for all filters combined
+    df = bitmaps.take(df, selection)
+    st.sidebar.caption(f"{len(df):,} of {bitmaps.rows:,} rows match "
+                       f"(bitmap index: {len(bitmaps.columns)} columns, {bitmaps.nbytes() / 1024:,.0f} KB)")
 
 # --- Metrics ---
 st.subheader("✅ Key Metrics")
 
-if 'Amount' in df.columns:
-    st.metric("Total Amount", f"${df['Amount'].sum():,.2f}")
-    st.metric("Average Order", f"${df['Amount'].mean():,.2f}")
-    st.metric("Max Order", f"${df['Amount'].max():,.2f}")
+if 'Amount' in columns:
+    st.metric("Total Amount", money(aggregate([], 'sum')['Amount'].iloc[0]))
+    st.metric("Average Order", money(aggregate([], 'mean')['Amount'].iloc[0]))
+    st.metric("Max Order", money(aggregate([], 'max')['Amount'].iloc[0]))
 
 # --- Category Breakdown ---
 st.subheader("✅ Category Breakdown")
 
-if 'Category' in df.columns and 'Amount' in df.columns:
-    chart = alt.Chart(df).mark_bar().encode(
+if 'Category' in columns and 'Amount' in columns:
+    by_category = aggregate(['Category'])
+    chart = alt.Chart(by_category).mark_bar().encode(
         x=alt.X("Category:N", sort='-y'),
-        y="sum(Amount):Q",
+        y=alt.Y("Amount:Q", title="Sum of Amount"),
         color="Category:N",
-        tooltip=['Category', 'sum(Amount)']
+        tooltip=['Category', 'Amount']
     ).properties(height=400)
     st.altair_chart(chart, use_container_width=True)
 
 # --- Drill-down ---
 st.subheader("✅ Drill-down Table")
 
-if 'Product' in df.columns and 'Amount' in df.columns:
-    group_by = st.selectbox("Group By:", options=['Product', 'Category', 'Date'])
-    pivot = df.groupby(group_by)['Amount'].sum().reset_index().sort_values('Amount', ascending=False)
+if 'Product' in columns and 'Amount' in columns:
+    group_by = st.selectbox("Group By:", options=[c for c in ['Product', 'Category', 'Date'] if c in columns])
+    pivot = aggregate([group_by]).sort_values('Amount', ascending=False)
     pivot.columns = [group_by, 'Total_Amount']
     st.dataframe(pivot)
 
 # --- Time Trend ---
 st.subheader("✅ Time Trend")
 
-if 'Date' in df.columns and 'Amount' in df.columns:
+if 'Date' in columns and 'Amount' in columns:
     trend_metric = st.radio("Metric:", options=['sum', 'mean'])
-    chart = alt.Chart(df).mark_line(point=True).encode(
+    col1, col2 = st.columns(2)
+    granularity = col1.selectbox("Granularity:", options=['auto', *GRANULARITIES, 'raw'],
+                                 help="'raw' plots every distinct date, downsampled with LTTB.")
+    width = col2.slider("Chart width (px)", 300, 2000, 900, step=100,
+                        help=f"Sets the point budget: one point per few pixels, at most {MAX_POINTS}.")
+    max_points = point_budget(width)
+    if granularity == 'auto':
+        granularity = choose_granularity(trend_start, trend_end, max_points)
+    buckets = None if granularity == 'raw' else {'Date': granularity}
+    trend = aggregate(['Date'], trend_metric, buckets)
+    bucketed_points = len(trend)
+    # Caps the payload even when a fine granularity is forced over a long range
+    trend = downsample(trend, 'Date', 'Amount', max_points)
+    st.caption(f"📉 {granularity} buckets: {bucketed_points:,} → {len(trend):,} points plotted "
+               f"(budget {max_points:,})")
+    chart = alt.Chart(trend).mark_line(point=len(trend) <= 100).encode(
         x=alt.X("Date:T"),
-        y=alt.Y(f"{trend_metric}(Amount):Q"),
-        tooltip=['Date', f"{trend_metric}(Amount)"]
+        y=alt.Y("Amount:Q", title=f"{trend_metric} of Amount"),
+        tooltip=['Date', 'Amount']
     ).properties(height=400)
     st.altair_chart(chart, use_container_width=True)
+
+if use_warehouse and report.sources:
+    st.caption(f"⚡ Aggregated in the warehouse from: {', '.join(f'`{t}`' for t in sorted(report.sources))}")